@@ -40,6 +40,7 @@ from .datasets import (
     volume_by_name,
     volumes,
 )
+from .decode_executor import get_decode_executor, set_decode_executor
 from .error import (
     GeoEngineException,
     InputException,
@@ -51,6 +52,7 @@ from .error import (
     ModificationNotOnLayerDbException,
     OGCXMLError,
     SpatialReferenceMismatchException,
+    TileCacheEvictedException,
     TypeException,
     UninitializedException,
     check_response_for_error,
@@ -71,7 +73,8 @@ from .permissions import (
     remove_role,
     revoke_role,
 )
-from .raster import RasterTile2D
+from .raster import RasterTile2D, raster_tile_schema
+from .raster_statistics import BandStatistics, HistogramBins
 from .raster_workflow_rio_writer import RasterWorkflowRioWriter
 from .resource_identifier import (
     LAYER_DB_PROVIDER_ID,
@@ -84,7 +87,11 @@ from .resource_identifier import (
     Resource,
     UploadId,
 )
+from .resumable import ReconnectPolicy
+from .streaming import StreamStatistics
 from .tasks import Task, TaskId
+from .tile_cache import TileCache
+from .tiling import TileGrid
 from .types import (
     DEFAULT_ISO_TIME_FORMAT,
     BoundingBox2D,
@@ -123,6 +130,7 @@ from .types import (
     VectorSymbology,
 )
 from .util import clamp_datetime_ms_ns
+from .vector_geometry import GeometryEncoding
 from .workflow import (
     Workflow,
     WorkflowId,
@@ -0,0 +1,173 @@
+"""
+The executor that decodes stream data off the event loop.
+
+By default, a dedicated thread pool is used, so that decoding does not compete with other work on the
+event loop's default executor.
+A process pool can be used instead for GIL-bound work like geometry parsing.
+Its results are handed back through shared memory instead of the process pool's pipe.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import contextvars
+import functools
+import multiprocessing
+import pickle
+import threading
+from collections.abc import Callable
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from multiprocessing import resource_tracker
+from multiprocessing.shared_memory import SharedMemory
+from typing import Any, Literal, TypeVar
+
+T = TypeVar("T")
+
+DecodeExecutorKind = Literal["thread", "process"]
+
+_lock = threading.Lock()
+_executor: Executor | None = None
+_executor_kind: DecodeExecutorKind = "thread"
+_max_workers: int | None = None
+
+
+def set_decode_executor(kind: DecodeExecutorKind | Executor = "thread", max_workers: int | None = None) -> None:
+    """
+    Configure the executor that is used for decoding stream data.
+
+    Parameters
+    ----------
+    kind
+        Either `"thread"` for a dedicated thread pool, `"process"` for a process pool
+        or an already existing `concurrent.futures.Executor`.
+    max_workers
+        The number of workers of the thread or process pool. Defaults to the pool's default.
+    """
+
+    global _executor, _executor_kind, _max_workers  # pylint: disable=global-statement
+
+    with _lock:
+        previous = _executor
+
+        if isinstance(kind, Executor):
+            _executor = kind
+            _executor_kind = "process" if isinstance(kind, ProcessPoolExecutor) else "thread"
+        else:
+            if kind not in ("thread", "process"):
+                raise ValueError(f"Unknown decode executor kind: {kind}")
+            _executor = None
+            _executor_kind = kind
+
+        _max_workers = max_workers
+
+    if previous is not None and previous is not _executor:
+        previous.shutdown(wait=False)
+
+
+def get_decode_executor() -> Executor:
+    """Return the executor that is used for decoding stream data and create it if necessary"""
+
+    global _executor  # pylint: disable=global-statement
+
+    with _lock:
+        if _executor is None:
+            if _executor_kind == "process":
+                # Let the workers share our resource tracker, so that shared memory created by them
+                # is unregistered when we unlink it.
+                resource_tracker.ensure_running()
+                _executor = ProcessPoolExecutor(
+                    max_workers=_max_workers,
+                    # do not fork the (multi-threaded) event loop process
+                    mp_context=multiprocessing.get_context("spawn"),
+                )
+            else:
+                _executor = ThreadPoolExecutor(max_workers=_max_workers, thread_name_prefix="geoengine-decode")
+
+        return _executor
+
+
+async def run_in_decode_executor(func: Callable[..., T], *args: Any) -> T:
+    """
+    Run `func(*args)` in the decode executor.
+
+    For a process pool, `func`, its arguments and its result must be picklable.
+    """
+
+    executor = get_decode_executor()
+    loop = asyncio.get_running_loop()
+
+    if _executor_kind == "process":
+        shared_result = await loop.run_in_executor(executor, _call_and_share, func, args)
+        return _load_shared(shared_result)
+
+    ctx = contextvars.copy_context()
+    return await loop.run_in_executor(executor, functools.partial(ctx.run, func, *args))
+
+
+class _SharedResult:
+    """A pickled result whose (out-of-band) buffers were placed in a shared memory block"""
+
+    payload: bytes
+    shared_memory_name: str | None
+    buffer_sizes: list[int]
+
+    def __init__(self, payload: bytes, shared_memory_name: str | None, buffer_sizes: list[int]) -> None:
+        self.payload = payload
+        self.shared_memory_name = shared_memory_name
+        self.buffer_sizes = buffer_sizes
+
+
+def _call_and_share(func: Callable[..., Any], args: tuple[Any, ...]) -> _SharedResult:
+    """Call `func` in a worker process and place the buffers of its result in shared memory"""
+
+    result = func(*args)
+
+    buffers: list[pickle.PickleBuffer] = []
+    payload = pickle.dumps(result, protocol=5, buffer_callback=buffers.append)
+
+    raw_buffers = [buffer.raw() for buffer in buffers]
+    buffer_sizes = [raw_buffer.nbytes for raw_buffer in raw_buffers]
+
+    if sum(buffer_sizes) == 0:
+        return _SharedResult(payload, None, buffer_sizes)
+
+    shared_memory = SharedMemory(create=True, size=sum(buffer_sizes))
+    shared_buffer = shared_memory.buf
+    assert shared_buffer is not None, "Shared memory must be open"
+
+    offset = 0
+    for raw_buffer, size in zip(raw_buffers, buffer_sizes, strict=True):
+        shared_buffer[offset : offset + size] = raw_buffer
+        offset += size
+
+    # the parent process unlinks the shared memory after reading it
+    del shared_buffer
+    shared_memory.close()
+
+    return _SharedResult(payload, shared_memory.name, buffer_sizes)
+
+
+def _load_shared(shared_result: _SharedResult) -> Any:
+    """Unpickle a result of `_call_and_share` and release its shared memory"""
+
+    if shared_result.shared_memory_name is None:
+        return pickle.loads(shared_result.payload, buffers=[b""] * len(shared_result.buffer_sizes))
+
+    shared_memory = SharedMemory(name=shared_result.shared_memory_name)
+    try:
+        shared_buffer = shared_memory.buf
+        assert shared_buffer is not None, "Shared memory must be open"
+        # copy the data once, so that the shared memory can be released right away
+        data = memoryview(bytearray(shared_buffer[: sum(shared_result.buffer_sizes)]))
+        del shared_buffer
+    finally:
+        shared_memory.close()
+        shared_memory.unlink()
+
+    buffers = []
+    offset = 0
+    for size in shared_result.buffer_sizes:
+        buffers.append(data[offset : offset + size])
+        offset += size
+
+    return pickle.loads(shared_result.payload, buffers=buffers)
@@ -137,6 +137,16 @@ class SpatialReferenceMismatchException(Exception):
         return f"Spatial reference mismatch {self.__spatial_reference_a} != {self.__spatial_reference_b}"
 
 
+class TileCacheEvictedException(Exception):
+    """
+    Exception for when a cached tile was evicted by another process while it was streamed
+    and the server did not return it again
+    """
+
+    def __str__(self) -> str:
+        return "A cached tile was evicted while streaming and could not be queried again, please retry the query"
+
+
 class InvalidUrlException(Exception):
     """
     Exception for when no valid url is provided
@@ -2,6 +2,8 @@
 
 from __future__ import annotations
 
+import functools
+import sys
 from collections.abc import AsyncIterator
 from typing import cast
 
@@ -13,9 +15,21 @@ import xarray as xr
 import geoengine.types as gety
 from geoengine.util import clamp_datetime_ms_ns
 
+# the number of distinct metadata values whose parsed objects are kept
+_METADATA_CACHE_SIZE = 1024
+
 
 class RasterTile2D:
-    """A 2D raster tile as produced by the Geo Engine"""
+    """
+    A 2D raster tile as produced by the Geo Engine.
+
+    If the spatial grid of the result is known when the tile is decoded, `pixel_idx` is the index of the tile's
+    upper left pixel in this grid. This allows placing tiles with integer arithmetic instead of coordinates.
+
+    Decoded tiles share equal metadata objects (geo transform, CRS and time), so these must not be modified.
+    """
+
+    __slots__ = ("size_x", "size_y", "data", "geo_transform", "crs", "time", "band", "pixel_idx", "__null_mask")
 
     size_x: int
     size_y: int
@@ -24,6 +38,7 @@ class RasterTile2D:
     crs: str
     time: gety.TimeInterval
     band: int
+    pixel_idx: gety.GridIdx2D | None
 
     # pylint: disable=too-many-arguments,too-many-positional-arguments
     def __init__(
@@ -34,6 +49,7 @@ class RasterTile2D:
         crs: str,
         time: gety.TimeInterval,
         band: int,
+        pixel_idx: gety.GridIdx2D | None = None,
     ):
         """Create a RasterTile2D object"""
         self.size_y, self.size_x = shape
@@ -42,6 +58,8 @@ class RasterTile2D:
         self.crs = crs
         self.time = time
         self.band = band
+        self.pixel_idx = pixel_idx
+        self.__null_mask: np.ndarray | None = None
 
     @property
     def shape(self) -> tuple[int, int]:
@@ -75,11 +93,44 @@ class RasterTile2D:
     def pixel_size(self) -> tuple[float, float]:
         return (self.geo_transform.x_pixel_size, self.geo_transform.y_pixel_size)
 
+    @property
+    def tile_idx(self) -> gety.GridIdx2D | None:
+        """Return the index of the tile in the tile grid of the result, if its `pixel_idx` is known"""
+        if self.pixel_idx is None:
+            return None
+        return gety.GridIdx2D(x_idx=self.pixel_idx.x_idx // self.size_x, y_idx=self.pixel_idx.y_idx // self.size_y)
+
+    def to_numpy_values_view(self) -> np.ndarray:
+        """
+        Return a read-only numpy view of the raster tile's values without copying them.
+        Caution: the values of nodata pixels are undefined !
+        """
+        values_buffer = self.data.buffers()[1]
+        view = np.frombuffer(
+            values_buffer,
+            dtype=self.numpy_data_type,
+            count=len(self.data),
+            offset=self.data.offset * self.data_type.byte_width,
+        )
+        view.flags.writeable = False
+        return view.reshape(self.shape)
+
     def to_numpy_data_array(self, fill_null_value=0) -> np.ndarray:
         """
-        Return the raster tile as a numpy array.
+        Return the raster tile as a (read-only) numpy array.
         Caution: this will not mask nodata values but replace them with the provided value !
+
+        If the raster tile has no null values, this is a view on the tile's data without copying it.
         """
+        if not self.has_null_values:
+            return self.to_numpy_values_view()
+
+        if self.is_empty():
+            # there are no values to keep
+            empty = np.full(self.shape, fill_null_value, dtype=self.numpy_data_type)
+            empty.flags.writeable = False
+            return empty
+
         nulled_array = self.data.fill_null(fill_null_value)
         return nulled_array.to_numpy(
             zero_copy_only=True,  # data was already copied when creating the "null filled" array
@@ -87,23 +138,37 @@ class RasterTile2D:
 
     def to_numpy_mask_array(self, nan_is_null=False) -> np.ndarray | None:
         """
-        Return the raster tiles mask as a numpy array.
+        Return the raster tiles mask as a (read-only) numpy array.
         True means no data, False means data.
         If the raster tile has no null values, None is returned.
         It is possible to specify whether NaN values should be considered as no data when creating the mask.
+
+        The mask is built from the validity bitmap on first use and then reused.
         """
-        numpy_mask = None
-        if self.has_null_values:
-            numpy_mask = (
-                self.data.is_null(
-                    nan_is_null=nan_is_null  # nan is not no data
-                )
-                .to_numpy(
-                    zero_copy_only=False  # cannot zero-copy with bools
-                )
-                .reshape(self.shape)
-            )
-        return numpy_mask
+        if not self.has_null_values:
+            return None
+
+        if self.__null_mask is None and self.is_empty():
+            null_mask = np.ones(self.shape, dtype=np.bool_)
+            null_mask.flags.writeable = False
+            self.__null_mask = null_mask
+
+        if self.__null_mask is None:
+            validity_buffer = self.data.buffers()[0]
+            offset = self.data.offset
+            validity = np.unpackbits(
+                np.frombuffer(validity_buffer, dtype=np.uint8),
+                count=offset + len(self.data),
+                bitorder="little",
+            )[offset:]
+            null_mask = np.logical_not(validity.view(np.bool_)).reshape(self.shape)
+            null_mask.flags.writeable = False
+            self.__null_mask = null_mask
+
+        if nan_is_null and np.issubdtype(self.numpy_data_type, np.floating):
+            return self.__null_mask | np.isnan(self.to_numpy_values_view())
+
+        return self.__null_mask
 
     def to_numpy_masked_array(self, nan_is_null=False) -> np.ma.MaskedArray:
         """Return the raster tile as a masked numpy array"""
@@ -196,31 +261,71 @@ class RasterTile2D:
     def spatial_resolution(self) -> gety.SpatialResolution:
         return self.geo_transform.spatial_resolution()
 
+    def is_at_position_of(self, other: RasterTile2D) -> bool:
+        """Check if two tiles cover the same pixels, by their grid indices if both are known"""
+        if self.pixel_idx is not None and other.pixel_idx is not None:
+            return self.pixel_idx == other.pixel_idx
+        return self.geo_transform == other.geo_transform
+
     def is_empty(self) -> bool:
-        """Returns true if the tile is empty"""
+        """
+        Returns true if the tile is empty, i.e., all of its pixels are nodata.
+
+        This only compares the Arrow null count, which is part of the received metadata, and converts nothing.
+        """
         num_pixels = self.size_x * self.size_y
         num_nulls = self.data.null_count
         return num_pixels == num_nulls
 
+    def to_arrow_row(self) -> pa.RecordBatch:
+        """
+        Return the tile as a record batch with a single row of the schema `raster_tile_schema(tile.data_type)`.
+
+        The metadata of the tile becomes columns and its pixels become a list, which references them without copying.
+        """
+
+        time_end = self.time_end_ms
+
+        return pa.record_batch(
+            [
+                pa.array([int(self.time_start_ms.astype(np.int64))], pa.timestamp("ms")),
+                pa.array([None if time_end is None else int(time_end.astype(np.int64))], pa.timestamp("ms")),
+                pa.array([self.band], pa.uint32()),
+                pa.array([self.geo_transform.x_min], pa.float64()),
+                pa.array([self.geo_transform.y_max], pa.float64()),
+                pa.array([self.geo_transform.x_pixel_size], pa.float64()),
+                pa.array([self.geo_transform.y_pixel_size], pa.float64()),
+                pa.array([self.size_x], pa.uint32()),
+                pa.array([self.size_y], pa.uint32()),
+                pa.array([self.crs], pa.string()),
+                pa.ListArray.from_arrays(pa.array([0, len(self.data)], pa.int32()), self.data),
+            ],
+            schema=raster_tile_schema(self.data_type),
+        )
+
     @staticmethod
-    def from_ge_record_batch(record_batch: pa.RecordBatch) -> RasterTile2D:
-        """Create a RasterTile2D from an Arrow record batch recieved from the Geo Engine"""
+    def from_ge_record_batch(
+        record_batch: pa.RecordBatch, grid_geo_transform: gety.GeoTransform | None = None
+    ) -> RasterTile2D:
+        """
+        Create a RasterTile2D from an Arrow record batch recieved from the Geo Engine.
+
+        If the geo transform of the result's spatial grid is given, the tile's `pixel_idx` is computed.
+        """
         metadata = record_batch.schema.metadata
-        inner = geoengine_openapi_client.GeoTransform.from_json(metadata[b"geoTransform"])
-        assert inner is not None, "Failed to parse geoTransform"
-        geo_transform = gety.GeoTransform.from_response(inner)
+        geo_transform = _parse_geo_transform(metadata[b"geoTransform"])
         x_size = int(metadata[b"xSize"])
         y_size = int(metadata[b"ySize"])
-        spatial_reference = metadata[b"spatialReference"].decode("utf-8")
+        spatial_reference = _parse_spatial_reference(metadata[b"spatialReference"])
         # We know from the backend that there is only one array a.k.a. one column
         arrow_array = record_batch.column(0)
 
-        inner_time = geoengine_openapi_client.TimeInterval.from_json(metadata[b"time"])
-        assert inner_time is not None, "Failed to parse time"
-        time = gety.TimeInterval.from_response(inner_time)
+        time = _parse_time_interval(metadata[b"time"])
 
         band = int(metadata[b"band"])
 
+        pixel_idx = None if grid_geo_transform is None else grid_geo_transform.pixel_idx_of(geo_transform)
+
         return RasterTile2D(
             (y_size, x_size),
             arrow_array,
@@ -228,64 +333,231 @@ class RasterTile2D:
             spatial_reference,
             time,
             band,
+            pixel_idx,
         )
 
 
+@functools.lru_cache(maxsize=_METADATA_CACHE_SIZE)
+def _parse_geo_transform(raw: bytes) -> gety.GeoTransform:
+    """Parse the geo transform metadata of a tile, which repeats for tiles at the same position"""
+    inner = geoengine_openapi_client.GeoTransform.from_json(raw.decode("utf-8"))
+    assert inner is not None, "Failed to parse geoTransform"
+    return gety.GeoTransform.from_response(inner)
+
+
+@functools.lru_cache(maxsize=_METADATA_CACHE_SIZE)
+def _parse_time_interval(raw: bytes) -> gety.TimeInterval:
+    """Parse the time metadata of a tile, which repeats for all tiles of a time step"""
+    inner_time = geoengine_openapi_client.TimeInterval.from_json(raw.decode("utf-8"))
+    assert inner_time is not None, "Failed to parse time"
+    return gety.TimeInterval.from_response(inner_time)
+
+
+@functools.lru_cache(maxsize=_METADATA_CACHE_SIZE)
+def _parse_spatial_reference(raw: bytes) -> str:
+    """Decode the spatial reference metadata of a tile, which repeats for all tiles"""
+    return sys.intern(raw.decode("utf-8"))
+
+
+def raster_tile_schema(data_type: pa.DataType) -> pa.Schema:
+    """The schema of raster tiles as rows, with their metadata as columns and their pixels (row-major) as a list"""
+    return pa.schema(
+        [
+            ("time_start", pa.timestamp("ms")),
+            ("time_end", pa.timestamp("ms")),
+            ("band", pa.uint32()),
+            ("x_min", pa.float64()),
+            ("y_max", pa.float64()),
+            ("x_pixel_size", pa.float64()),
+            ("y_pixel_size", pa.float64()),
+            ("width", pa.uint32()),
+            ("height", pa.uint32()),
+            ("spatial_reference", pa.string()),
+            ("data", pa.list_(data_type)),
+        ]
+    )
+
+
 class RasterTileStack2D:
-    """A stack of all the bands of a raster tile as produced by the Geo Engine"""
+    """
+    A stack of all the bands of a raster tile as produced by the Geo Engine.
+
+    The bands are stored in one contiguous (band, y, x) array together with one mask of the same shape,
+    so that numpy and xarray views of the stack do not copy them again.
+    """
+
+    __slots__ = ("size_y", "size_x", "geo_transform", "crs", "time", "values", "mask", "bands", "pixel_idx")
 
     size_y: int
     size_x: int
     geo_transform: gety.GeoTransform
     crs: str
     time: gety.TimeInterval
-    data: list[pa.Array]
+    values: np.ndarray
+    mask: np.ndarray | None
     bands: list[int]
+    pixel_idx: gety.GridIdx2D | None
 
     # pylint: disable=too-many-arguments,too-many-positional-arguments
     def __init__(
         self,
         tile_shape: tuple[int, int],
-        data: list[pa.Array],
+        values: np.ndarray,
+        mask: np.ndarray | None,
         geo_transform: gety.GeoTransform,
         crs: str,
         time: gety.TimeInterval,
         bands: list[int],
+        pixel_idx: gety.GridIdx2D | None = None,
     ):
-        """Create a RasterTileStack2D object"""
+        """
+        Create a RasterTileStack2D object from its (band, y, x) values and mask.
+        True in the mask means no data, and the mask is `None` if all pixels are valid.
+        """
         (self.size_y, self.size_x) = tile_shape
-        self.data = data
+        assert values.shape == (len(bands), *tile_shape), "Values do not match the bands and the tile shape"
+        assert mask is None or mask.shape == values.shape, "Mask does not match the values"
+        self.values = values
+        self.mask = mask
         self.geo_transform = geo_transform
         self.crs = crs
         self.time = time
         self.bands = bands
+        self.pixel_idx = pixel_idx
+
+    @staticmethod
+    def from_tiles(tiles: list[RasterTile2D]) -> RasterTileStack2D:
+        """Copy the bands of a tile into one preallocated stack. Nodata pixels are set to 0."""
+
+        first = tiles[0]
+        shape = (len(tiles), *first.shape)
+
+        values = np.empty(shape, dtype=first.numpy_data_type)
+        mask: np.ndarray | None = None
+
+        for i, tile in enumerate(tiles):
+            values[i] = tile.to_numpy_values_view()
+
+            tile_mask = tile.to_numpy_mask_array()
+            if tile_mask is None:
+                continue
+
+            if mask is None:
+                mask = np.zeros(shape, dtype=np.bool_)
+            mask[i] = tile_mask
+            values[i][tile_mask] = 0
+
+        return RasterTileStack2D(
+            first.shape,
+            values,
+            mask,
+            first.geo_transform,
+            first.crs,
+            first.time,
+            [tile.band for tile in tiles],
+            first.pixel_idx,
+        )
+
+    # pylint: disable=too-many-arguments,too-many-positional-arguments
+    @staticmethod
+    def from_arrow_bands(
+        tile_shape: tuple[int, int],
+        data: list[pa.Array],
+        geo_transform: gety.GeoTransform,
+        crs: str,
+        time: gety.TimeInterval,
+        bands: list[int],
+        pixel_idx: gety.GridIdx2D | None = None,
+    ) -> RasterTileStack2D:
+        """Create a RasterTileStack2D object from one Arrow array per band, copying them into one stack."""
+        assert len(data) == len(bands), "The number of bands and data arrays do not match"
+
+        return RasterTileStack2D.from_tiles(
+            [
+                RasterTile2D(tile_shape, band_data, geo_transform, crs, time, band, pixel_idx)
+                for band_data, band in zip(data, bands, strict=True)
+            ]
+        )
+
+    @property
+    def shape(self) -> tuple[int, int, int]:
+        """Return the shape of the stack in numpy order (bands, y_size, x_size)"""
+        return (len(self.bands), self.size_y, self.size_x)
+
+    @property
+    def data(self) -> list[pa.Array]:
+        """Return the bands as Arrow arrays that share the memory of the stack's values"""
+        return [self.__band_array(i) for i in range(len(self.bands))]
 
     def single_band(self, index: int) -> RasterTile2D:
         """Return a single band from the stack"""
         return RasterTile2D(
             (self.size_y, self.size_x),
-            self.data[index],
+            self.__band_array(index),
             self.geo_transform,
             self.crs,
             self.time,
             self.bands[index],
+            self.pixel_idx,
         )
 
     def to_numpy_masked_array_stack(self) -> np.ma.MaskedArray:
-        """Return the raster stack as a 3D masked numpy array"""
-        arrays = [self.single_band(i).to_numpy_masked_array() for i in range(0, len(self.data))]
-        stack = np.ma.stack(arrays, axis=0)
-        return stack
+        """Return the raster stack as a 3D masked numpy array without copying it"""
+        numpy_mask: np.ndarray | np.ma.MaskType = np.ma.nomask if self.mask is None else self.mask
+        return np.ma.masked_array(self.values, mask=numpy_mask, copy=False)
 
     def to_xarray(self, clip_with_bounds: gety.SpatialBounds | None = None) -> xr.DataArray:
-        """Return the raster stack as an xarray.DataArray"""
-        arrays = [self.single_band(i).to_xarray(clip_with_bounds) for i in range(0, len(self.data))]
-        stack = xr.concat(arrays, dim="band")
-        return stack
+        """
+        Return the raster stack as an xarray.DataArray with the dimensions (band, y, x).
+
+        The array is a view on the stack's values if it has no nodata pixels.
+        Otherwise, it is promoted to floating point with NaN as nodata, like `RasterTile2D.to_xarray`.
+        """
+
+        first_band = self.single_band(0)
+
+        array = xr.DataArray(
+            self.to_numpy_masked_array_stack(),
+            dims=["band", "y", "x"],
+            coords={
+                "x": first_band.coords_x(pixel_center=True),
+                "y": first_band.coords_y(pixel_center=True),
+                "time": clamp_datetime_ms_ns(first_band.time_start_ms),
+                "band": self.bands,
+            },
+        )
+        array.rio.write_crs(self.crs, inplace=True)
+
+        if clip_with_bounds is not None:
+            array = array.rio.clip_box(*clip_with_bounds.as_bbox_tuple(), auto_expand=True)
+            array = cast(xr.DataArray, array)
+
+        return array
+
+    def __band_array(self, index: int) -> pa.Array:
+        """An Arrow array on the values of a band with the validity bitmap of its mask"""
+
+        values = pa.py_buffer(np.ascontiguousarray(self.values[index]).reshape(-1))
+        length = self.size_y * self.size_x
+
+        band_mask = None if self.mask is None else self.mask[index]
+        if band_mask is None or not band_mask.any():
+            return pa.Array.from_buffers(pa.from_numpy_dtype(self.values.dtype), length, [None, values])
+
+        validity = pa.py_buffer(np.packbits(~band_mask.reshape(-1), bitorder="little"))
+        null_count = int(np.count_nonzero(band_mask))
+
+        return pa.Array.from_buffers(
+            pa.from_numpy_dtype(self.values.dtype), length, [validity, values], null_count=null_count
+        )
 
 
 async def tile_stream_to_stack_stream(raster_stream: AsyncIterator[RasterTile2D]) -> AsyncIterator[RasterTileStack2D]:
-    """Convert a stream of raster tiles to stream of stacked tiles"""
+    """
+    Convert a stream of raster tiles to stream of stacked tiles.
+
+    The tiles of a stack are copied into its contiguous buffer once the stack is complete.
+    """
     store: list[RasterTile2D] = []
     first_band: int = -1
 
@@ -297,37 +569,25 @@ async def tile_stream_to_stack_stream(raster_stream: AsyncIterator[RasterTile2D]
         else:
             # check things that should be the same for all tiles
             assert tile.shape == store[0].shape, "Tile shapes do not match"
-            # TODO: geo transform should be the same for all tiles
-            #       tiles should have a tile position or global pixel position
-
-            # assert tile.geo_transform == store[0].geo_transform, 'Tile geo_transforms do not match'
             assert tile.crs == store[0].crs, "Tile crs do not match"
 
             if tile.band == first_band:
                 assert tile.time.start >= store[0].time.start, "Tile time intervals must be equal or increasing"
 
-                stack = [tile.data for tile in store]
-                tile_shape = store[0].shape
-                bands = [tile.band for tile in store]
-                geo_transforms = store[0].geo_transform
-                crs = store[0].crs
-                time = store[0].time
+                stack = RasterTileStack2D.from_tiles(store)
 
                 store = [tile]
-                yield RasterTileStack2D(tile_shape, stack, geo_transforms, crs, time, bands)
+                yield stack
 
             else:
                 assert tile.time == store[0].time, "Time missmatch. " + str(store[0].time) + " != " + str(tile.time)
+                assert tile.data_type == store[0].data_type, "Tile data types do not match"
+                assert tile.is_at_position_of(store[0]), "Tile positions do not match"
                 store.append(tile)
 
     if len(store) > 0:
-        tile_shape = store[0].shape
-        stack = [tile.data for tile in store]
-        bands = [tile.band for tile in store]
-        geo_transforms = store[0].geo_transform
-        crs = store[0].crs
-        time = store[0].time
+        stack = RasterTileStack2D.from_tiles(store)
 
         store = []
 
-        yield RasterTileStack2D(tile_shape, stack, geo_transforms, crs, time, bands)
+        yield stack
@@ -0,0 +1,140 @@
+"""Memory-mapped numpy output for raster streams"""
+
+from __future__ import annotations
+
+import math
+import os
+
+import numpy as np
+
+import geoengine.types as gety
+from geoengine.raster_mosaic import MosaicGrid, RasterMosaic
+
+
+class RasterMemmap:
+    """A (time, band, y, x) raster stream result in a memory-mapped file"""
+
+    array: np.ndarray
+    geo_transform: gety.GeoTransform
+    time: np.ndarray
+    bands: list[int]
+    crs: str | None
+
+    # pylint: disable=too-many-arguments,too-many-positional-arguments
+    def __init__(
+        self,
+        array: np.ndarray,
+        geo_transform: gety.GeoTransform,
+        time: np.ndarray,
+        bands: list[int],
+        crs: str | None,
+    ) -> None:
+        """
+        Create a result from
+        - its array, which is a `numpy.memmap` unless the result is empty,
+        - the geo transform of its upper left pixel,
+        - the start times of its time steps (as `datetime64[ms]`),
+        - its bands and
+        - its CRS, which is `None` if the result is empty.
+        """
+        self.array = array
+        self.geo_transform = geo_transform
+        self.time = time
+        self.bands = bands
+        self.crs = crs
+
+    def __repr__(self) -> str:
+        return (
+            f"RasterMemmap(shape={self.array.shape}, dtype={self.array.dtype}, "
+            f"geo_transform={self.geo_transform}, time={self.time}, bands={self.bands}, crs={self.crs})"
+        )
+
+
+class MemmapMosaicWriter:
+    """Allocates the mosaic of each time step of a raster stream in a file, one time step after the other"""
+
+    path: str | os.PathLike
+    bands: list[int]
+    dtype: np.dtype
+    fill_value: int | float
+
+    def __init__(
+        self, path: str | os.PathLike, bands: list[int], dtype: np.dtype, fill_value: int | float | None = None
+    ) -> None:
+        """
+        Create a writer that (over)writes the file at `path`.
+
+        Nodata pixels are written as `fill_value`, which defaults to NaN for floating point data and 0 otherwise.
+        """
+
+        self.path = path
+        self.bands = bands
+        self.dtype = np.dtype(dtype)
+
+        if fill_value is None:
+            fill_value = np.nan if np.issubdtype(self.dtype, np.floating) else 0
+        self.fill_value = fill_value
+
+        self.__grid: MosaicGrid | None = None
+        self.__crs: str | None = None
+        self.__times: list[np.datetime64] = []
+        self.__mosaic: RasterMosaic | None = None
+
+        with open(self.path, "wb"):
+            pass
+
+    def allocate(self, grid: MosaicGrid, time: gety.TimeInterval, crs: str) -> RasterMosaic:
+        """Append a time step to the file and return its mosaic"""
+
+        assert self.__grid is None or self.__grid.shape == grid.shape, "All time steps must have the same grid"
+
+        self.__flush()
+
+        self.__grid = grid
+        self.__crs = crs
+
+        step_shape = (len(self.bands), *grid.shape)
+        step_bytes = math.prod(step_shape) * self.dtype.itemsize
+        step_index = len(self.__times)
+
+        # grow the file by one time step, which the OS fills with zeros
+        with open(self.path, "r+b") as file:
+            file.truncate((step_index + 1) * step_bytes)
+
+        data = np.memmap(self.path, dtype=self.dtype, mode="r+", offset=step_index * step_bytes, shape=step_shape)
+        if self.fill_value != 0:
+            data[...] = self.fill_value
+
+        self.__times.append(time.start)
+        self.__mosaic = RasterMosaic(grid, time, self.bands, crs, data, fill_value=self.fill_value)
+
+        return self.__mosaic
+
+    def finish(self, empty_grid: MosaicGrid) -> RasterMemmap:
+        """Flush the file and map all time steps as one array. Uses `empty_grid` if there are no time steps."""
+
+        self.__flush()
+
+        grid = empty_grid if self.__grid is None else self.__grid
+        shape = (len(self.__times), len(self.bands), *grid.shape)
+        time = np.array(self.__times, dtype="datetime64[ms]")
+
+        if math.prod(shape) == 0:
+            # empty files cannot be mapped
+            return RasterMemmap(np.empty(shape, dtype=self.dtype), grid.geo_transform, time, self.bands, self.__crs)
+
+        array = np.memmap(self.path, dtype=self.dtype, mode="r+", shape=shape)
+
+        return RasterMemmap(array, grid.geo_transform, time, self.bands, self.__crs)
+
+    def __flush(self) -> None:
+        """Flush the mosaic of the previous time step"""
+
+        if self.__mosaic is None:
+            return
+
+        data = self.__mosaic.data
+        if isinstance(data, np.memmap):
+            data.flush()
+
+        self.__mosaic = None
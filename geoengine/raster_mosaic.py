@@ -0,0 +1,518 @@
+"""Assembly of raster tiles into preallocated mosaics"""
+
+from __future__ import annotations
+
+import math
+from collections.abc import AsyncIterator, Callable
+
+import numpy as np
+import xarray as xr
+from xarray.core import indexing as xr_indexing
+
+import geoengine.types as gety
+from geoengine.raster import RasterTile2D
+from geoengine.tiling import TileGrid
+from geoengine.util import clamp_datetime_ms_ns
+
+MosaicAllocator = Callable[["MosaicGrid", gety.TimeInterval, str], "RasterMosaic"]
+
+# tolerance (in pixels) for floating point noise when converting coordinates to pixel indices
+_PIXEL_EPSILON = 1e-9
+
+
+class MosaicGrid:
+    """
+    The pixel grid of a mosaic, aligned to the pixels of a raster result.
+
+    If `pixel_idx` (the index of its upper left pixel in the spatial grid of the result) is known,
+    tiles with a known `pixel_idx` are placed with integer arithmetic.
+    """
+
+    geo_transform: gety.GeoTransform
+    width: int
+    height: int
+    pixel_idx: gety.GridIdx2D | None
+
+    def __init__(
+        self, geo_transform: gety.GeoTransform, width: int, height: int, pixel_idx: gety.GridIdx2D | None = None
+    ) -> None:
+        """Create a mosaic grid from the geo transform of its upper left pixel and its size in pixels"""
+        self.geo_transform = geo_transform
+        self.width = width
+        self.height = height
+        self.pixel_idx = pixel_idx
+
+    @staticmethod
+    def from_bounds(
+        geo_transform: gety.GeoTransform, bounds: gety.BoundingBox2D | gety.SpatialPartition2D
+    ) -> MosaicGrid:
+        """Create the grid of all pixels of `geo_transform` (the result's spatial grid) that intersect the bounds"""
+
+        x_pixel_size = geo_transform.x_pixel_size
+        y_pixel_size = -geo_transform.y_pixel_size
+
+        x_start = math.floor((bounds.xmin - geo_transform.x_min) / x_pixel_size + _PIXEL_EPSILON)
+        x_end = math.ceil((bounds.xmax - geo_transform.x_min) / x_pixel_size - _PIXEL_EPSILON)
+        y_start = math.floor((geo_transform.y_max - bounds.ymax) / y_pixel_size + _PIXEL_EPSILON)
+        y_end = math.ceil((geo_transform.y_max - bounds.ymin) / y_pixel_size - _PIXEL_EPSILON)
+
+        (x_min, y_max) = geo_transform.pixel_ul_to_coord(x_start, y_start)
+
+        return MosaicGrid(
+            gety.GeoTransform(x_min, y_max, geo_transform.x_pixel_size, geo_transform.y_pixel_size),
+            width=max(x_end - x_start, 1),
+            height=max(y_end - y_start, 1),
+            pixel_idx=gety.GridIdx2D(x_idx=x_start, y_idx=y_start),
+        )
+
+    @staticmethod
+    def from_tiles(tile_grid: TileGrid, bounds: gety.BoundingBox2D | gety.SpatialPartition2D) -> MosaicGrid:
+        """Create the grid of all tiles that intersect the bounds"""
+
+        tiles = tile_grid.intersecting_tiles(bounds)
+        tiles_bounds = tile_grid.tile_bounds(tiles)
+
+        return MosaicGrid(
+            gety.GeoTransform(
+                tiles_bounds.xmin,
+                tiles_bounds.ymax,
+                tile_grid.geo_transform.x_pixel_size,
+                tile_grid.geo_transform.y_pixel_size,
+            ),
+            width=(tiles.bottom_right_idx.x_idx - tiles.top_left_idx.x_idx + 1) * tile_grid.tile_size_x,
+            height=(tiles.bottom_right_idx.y_idx - tiles.top_left_idx.y_idx + 1) * tile_grid.tile_size_y,
+            pixel_idx=gety.GridIdx2D(
+                x_idx=tiles.top_left_idx.x_idx * tile_grid.tile_size_x,
+                y_idx=tiles.top_left_idx.y_idx * tile_grid.tile_size_y,
+            ),
+        )
+
+    @property
+    def shape(self) -> tuple[int, int]:
+        """Return the shape of the grid in numpy order (height, width)"""
+        return (self.height, self.width)
+
+    def pixel_offset(self, tile_geo_transform: gety.GeoTransform) -> tuple[int, int]:
+        """Return the (y, x) pixel offset of a tile's upper left pixel in this grid"""
+        return (
+            round((self.geo_transform.y_max - tile_geo_transform.y_max) / -self.geo_transform.y_pixel_size),
+            round((tile_geo_transform.x_min - self.geo_transform.x_min) / self.geo_transform.x_pixel_size),
+        )
+
+    def tile_offset(self, tile: RasterTile2D) -> tuple[int, int]:
+        """Return the (y, x) pixel offset of a tile's upper left pixel in this grid, from the grid indices if known"""
+        if self.pixel_idx is None or tile.pixel_idx is None:
+            return self.pixel_offset(tile.geo_transform)
+        return (tile.pixel_idx.y_idx - self.pixel_idx.y_idx, tile.pixel_idx.x_idx - self.pixel_idx.x_idx)
+
+    def tile_window(self, tile: RasterTile2D) -> tuple[tuple[slice, slice], tuple[slice, slice]] | None:
+        """
+        Return the (y, x) slices of the part of a tile that lies in the grid,
+        once for the grid (destination) and once for the tile (source).
+        Returns `None` if the tile does not intersect the grid.
+        """
+
+        (y_offset, x_offset) = self.tile_offset(tile)
+        (tile_height, tile_width) = tile.shape
+
+        y_start = max(y_offset, 0)
+        x_start = max(x_offset, 0)
+        y_end = min(y_offset + tile_height, self.height)
+        x_end = min(x_offset + tile_width, self.width)
+
+        if y_start >= y_end or x_start >= x_end:
+            return None
+
+        destination = (slice(y_start, y_end), slice(x_start, x_end))
+        source = (slice(y_start - y_offset, y_end - y_offset), slice(x_start - x_offset, x_end - x_offset))
+
+        return (destination, source)
+
+    def coords_x(self) -> np.ndarray:
+        """Return the x coordinates of the pixel centers"""
+        return (
+            self.geo_transform.x_min
+            + self.geo_transform.x_half_pixel_size
+            + np.arange(self.width) * (self.geo_transform.x_pixel_size)
+        )
+
+    def coords_y(self) -> np.ndarray:
+        """Return the y coordinates of the pixel centers"""
+        return (
+            self.geo_transform.y_max
+            + self.geo_transform.y_half_pixel_size
+            + np.arange(self.height) * (self.geo_transform.y_pixel_size)
+        )
+
+
+class RasterMosaic:
+    """
+    The mosaic of all tiles of one time step as a (band, y, x) array.
+
+    Tiles are written into the preallocated array by slicing.
+    With a mask, the mask tracks which pixels have no data (True) and starts out fully masked.
+    Without a mask, nodata pixels are set to the fill value, which defaults to NaN for floating point data.
+    """
+
+    grid: MosaicGrid
+    time: gety.TimeInterval
+    bands: list[int]
+    crs: str
+    data: np.ndarray
+    mask: np.ndarray | None
+    fill_value: int | float | None
+
+    # pylint: disable=too-many-arguments,too-many-positional-arguments
+    def __init__(
+        self,
+        grid: MosaicGrid,
+        time: gety.TimeInterval,
+        bands: list[int],
+        crs: str,
+        data: np.ndarray,
+        mask: np.ndarray | None = None,
+        fill_value: int | float | None = None,
+    ) -> None:
+        """Create a mosaic on an (already initialized) data array and either a mask array or a fill value"""
+        assert data.shape == (len(bands), *grid.shape), "Data array does not match the grid"
+        assert mask is None or mask.shape == data.shape, "Mask array does not match the data array"
+
+        if mask is None and fill_value is None:
+            assert np.issubdtype(data.dtype, np.floating), "Non-float data requires a mask or a fill value"
+            fill_value = np.nan
+
+        self.grid = grid
+        self.time = time
+        self.bands = bands
+        self.crs = crs
+        self.data = data
+        self.mask = mask
+        self.fill_value = fill_value
+        self.__band_indices = {band: i for i, band in enumerate(bands)}
+
+    @staticmethod
+    def allocate(
+        grid: MosaicGrid, time: gety.TimeInterval, bands: list[int], crs: str, dtype: np.dtype, with_mask: bool
+    ) -> RasterMosaic:
+        """Allocate a new mosaic, optionally with a mask (which is required for non-float data)"""
+
+        shape = (len(bands), *grid.shape)
+
+        if with_mask or not np.issubdtype(dtype, np.floating):
+            return RasterMosaic(grid, time, bands, crs, np.zeros(shape, dtype=dtype), np.ones(shape, dtype=np.bool_))
+
+        return RasterMosaic(grid, time, bands, crs, np.full(shape, np.nan, dtype=dtype))
+
+    def add_tile(self, tile: RasterTile2D) -> None:
+        """Write a tile into the mosaic"""
+
+        assert tile.time == self.time, "Tile time does not match the mosaic time"
+
+        window = self.grid.tile_window(tile)
+        if window is None:
+            return
+
+        if tile.is_empty():
+            # the mosaic is initialized as nodata
+            return
+
+        (destination, source) = window
+        band_index = self.__band_indices[tile.band]
+
+        self.data[band_index][destination] = tile.to_numpy_values_view()[source]
+
+        tile_mask = tile.to_numpy_mask_array()
+
+        if self.mask is not None:
+            self.mask[band_index][destination] = False if tile_mask is None else tile_mask[source]
+        elif tile_mask is not None and self.fill_value is not None:
+            np.copyto(self.data[band_index][destination], self.fill_value, where=tile_mask[source])
+
+    @property
+    def xarray_time(self) -> np.datetime64:
+        """The time coordinate of the mosaic, clamped to the range of xarray's datetime64[ns]"""
+        return clamp_datetime_ms_ns(self.time.start.astype("datetime64[ms]"))
+
+    def to_numpy_masked_array(self) -> np.ma.MaskedArray:
+        """Return the mosaic as a (band, y, x) masked numpy array"""
+        if self.mask is not None:
+            return np.ma.masked_array(self.data, mask=self.mask)
+        if self.fill_value is None or np.isnan(self.fill_value):
+            return np.ma.masked_invalid(self.data, copy=False)
+        return np.ma.masked_equal(self.data, self.fill_value, copy=False)
+
+    def to_xarray(self) -> xr.DataArray:
+        """Return the mosaic as a (band, y, x) xarray.DataArray where masked pixels are NaN"""
+        array = xr.DataArray(
+            nan_masked(self.data, self.mask),
+            dims=["band", "y", "x"],
+            coords={
+                "x": self.grid.coords_x(),
+                "y": self.grid.coords_y(),
+                "time": self.xarray_time,
+                "band": self.bands,
+            },
+        )
+        array.rio.write_crs(self.crs, inplace=True)
+        return array
+
+
+def nan_masked(data: np.ndarray, mask: np.ndarray | None) -> np.ndarray:
+    """
+    Set masked pixels to NaN like xarray does for masked arrays.
+
+    The data is promoted to a float type and copied only if it contains masked pixels.
+    """
+
+    if mask is None or not mask.any():
+        return data
+
+    float_data = data.astype(np.result_type(data.dtype, np.float32))
+    float_data[mask] = np.nan
+    return float_data
+
+
+class TimeChunkedArray(xr.backends.BackendArray):
+    """
+    A read-only (time, ...) array whose time steps are stored in several chunks.
+
+    It is a lazy concatenation of the chunks for xarray: indexing it only reads the selected time steps,
+    and a selection within one chunk is a view of that chunk.
+    """
+
+    shape: tuple[int, ...]
+    dtype: np.dtype
+
+    def __init__(self, chunks: list[np.ndarray]) -> None:
+        """Create an array from chunks with the same dtype and the same shape apart from the time axis"""
+
+        self.chunks = chunks
+        self.shape = (sum(len(chunk) for chunk in chunks), *chunks[0].shape[1:])
+        self.dtype = chunks[0].dtype
+        self.__offsets = np.cumsum([0] + [len(chunk) for chunk in chunks])
+
+    def __getitem__(self, key: xr_indexing.ExplicitIndexer) -> np.ndarray:
+        return xr_indexing.explicit_indexing_adapter(
+            key, self.shape, xr_indexing.IndexingSupport.BASIC, self.__raw_getitem
+        )
+
+    def __raw_getitem(self, key: tuple) -> np.ndarray:
+        """Select with a tuple of integers and slices"""
+
+        (time_key, *other_keys) = key
+        time_steps = np.arange(self.shape[0])[time_key]
+        chunk_indices = np.searchsorted(self.__offsets, time_steps, side="right") - 1
+
+        if np.ndim(time_steps) == 0:
+            chunk_index = int(chunk_indices)
+            return self.chunks[chunk_index][(int(time_steps) - self.__offsets[chunk_index], *other_keys)]
+
+        if len(time_steps) > 0 and chunk_indices[0] == chunk_indices[-1]:
+            # a slice within one chunk stays a view of it
+            chunk_index = int(chunk_indices[0])
+            (first, last) = (
+                int(time_steps[0]) - self.__offsets[chunk_index],
+                int(time_steps[-1]) - self.__offsets[chunk_index],
+            )
+            step = time_key.step or 1
+            stop = last + (1 if step > 0 else -1)
+            local = slice(first, stop if stop >= 0 else None, step)
+            return self.chunks[chunk_index][(local, *other_keys)]
+
+        # the time steps of a slice are monotonic, so the chunks are visited in the order of the selection
+        parts = [
+            self.chunks[chunk_index][time_steps[chunk_indices == chunk_index] - self.__offsets[chunk_index]]
+            for chunk_index in dict.fromkeys(chunk_indices.tolist())
+        ]
+        empty_shape = (0, *self.shape[1:])
+        data = np.concatenate(parts, axis=0) if parts else np.empty(empty_shape, dtype=self.dtype)
+        return data[(slice(None), *other_keys)]
+
+
+def time_chunked_data(chunks: list[np.ndarray]) -> np.ndarray | xr_indexing.LazilyIndexedArray:
+    """
+    Wrap the time chunks of a `MosaicTimeStack` as data for xarray without concatenating them.
+    A single chunk is used as it is.
+    """
+
+    if len(chunks) == 1:
+        return chunks[0]
+
+    return xr_indexing.LazilyIndexedArray(TimeChunkedArray(chunks))
+
+
+def concatenate_time_chunks(chunks: list[np.ndarray]) -> np.ndarray:
+    """Concatenate the time chunks of a `MosaicTimeStack` into one array, which copies only if there are several"""
+
+    if len(chunks) == 1:
+        return chunks[0]
+
+    return np.concatenate(chunks, axis=0)
+
+
+class MosaicTimeStack:
+    """
+    Allocates the mosaics of all time steps of a raster stream as (time, band, y, x) chunks.
+
+    If the number of time steps is known (e.g., from a regular time dimension), they are allocated in one chunk.
+    Otherwise, or if there are more time steps than expected, further chunks are added that are as large as all
+    chunks before them, so that there are only logarithmically many chunks and no time step is ever copied.
+    A time step is only initialized when it is allocated, so that the unused capacity of the last chunk is never
+    touched (and thus not backed by physical memory).
+    """
+
+    bands: list[int]
+    dtype: np.dtype
+    with_mask: bool
+
+    def __init__(
+        self, bands: list[int], dtype: np.dtype, with_mask: bool, expected_time_steps: int | None = None
+    ) -> None:
+        """Create a stack, optionally with a mask (which is required for non-float data)"""
+
+        self.bands = bands
+        self.dtype = np.dtype(dtype)
+        self.with_mask = with_mask or not np.issubdtype(self.dtype, np.floating)
+
+        self.__expected_time_steps = max(expected_time_steps or 1, 1)
+        self.__grid: MosaicGrid | None = None
+        self.__data_chunks: list[np.ndarray] = []
+        self.__mask_chunks: list[np.ndarray] = []
+        self.__capacity = 0
+        self.__times: list[gety.TimeInterval] = []
+        self.__crs: str | None = None
+
+    def allocate(self, grid: MosaicGrid, time: gety.TimeInterval, crs: str) -> RasterMosaic:
+        """Append a time step to the stack and return its mosaic"""
+
+        assert self.__grid is None or self.__grid.shape == grid.shape, "All time steps must have the same grid"
+
+        step_index = len(self.__times)
+        if step_index == self.__capacity:
+            self.__add_chunk(grid, self.__expected_time_steps if self.__capacity == 0 else self.__capacity)
+
+        self.__grid = grid
+        self.__crs = crs
+        self.__times.append(time)
+
+        # the last chunk holds the new time step
+        chunk_index = step_index - (self.__capacity - len(self.__data_chunks[-1]))
+        data = self.__data_chunks[-1][chunk_index]
+
+        if not self.with_mask:
+            data[...] = np.nan
+            return RasterMosaic(grid, time, self.bands, crs, data)
+
+        data[...] = 0
+        mask = self.__mask_chunks[-1][chunk_index]
+        mask[...] = True
+        return RasterMosaic(grid, time, self.bands, crs, data, mask)
+
+    def finish(self, empty_grid: MosaicGrid) -> tuple[MosaicGrid, list[np.ndarray], list[np.ndarray] | None]:
+        """
+        Return the grid and the (time, band, y, x) chunks of the data and the mask (if any) of the time steps.
+        The chunks are views of the allocated time steps, so that nothing is copied.
+        Uses `empty_grid` if there are no time steps.
+        """
+
+        if self.__grid is None:
+            shape = (0, len(self.bands), *empty_grid.shape)
+            return (
+                empty_grid,
+                [np.empty(shape, dtype=self.dtype)],
+                [np.empty(shape, dtype=np.bool_)] if self.with_mask else None,
+            )
+
+        return (
+            self.__grid,
+            self.__filled(self.__data_chunks),
+            self.__filled(self.__mask_chunks) if self.with_mask else None,
+        )
+
+    @property
+    def times(self) -> list[gety.TimeInterval]:
+        """The time intervals of the allocated time steps"""
+        return self.__times
+
+    @property
+    def crs(self) -> str | None:
+        """The CRS of the time steps, which is `None` if there are none"""
+        return self.__crs
+
+    def __add_chunk(self, grid: MosaicGrid, num_time_steps: int) -> None:
+        """Add a chunk for `num_time_steps` further time steps"""
+
+        shape = (num_time_steps, len(self.bands), *grid.shape)
+        self.__data_chunks.append(np.empty(shape, dtype=self.dtype))
+        if self.with_mask:
+            self.__mask_chunks.append(np.empty(shape, dtype=np.bool_))
+        self.__capacity += num_time_steps
+
+    def __filled(self, chunks: list[np.ndarray]) -> list[np.ndarray]:
+        """Return the chunks with a view of the allocated time steps of the last one"""
+
+        unused = self.__capacity - len(self.__times)
+        return [*chunks[:-1], chunks[-1][: len(chunks[-1]) - unused]]
+
+
+async def raster_stream_into_mosaics(
+    tile_stream: AsyncIterator[RasterTile2D],
+    geo_transform: gety.GeoTransform,
+    query_rectangle: gety.RasterQueryRectangle,
+    allocate: MosaicAllocator,
+    clip_to_query_rectangle: bool = False,
+) -> AsyncIterator[RasterMosaic]:
+    """
+    Assemble a stream of tiles (ordered by time) into one mosaic per time step.
+
+    The mosaic of each time step is created by `allocate` from its grid, time and CRS.
+    It is yielded as soon as all tiles that intersect the query rectangle arrived
+    or, if some of them are missing, once the tiles of the next time step arrive.
+
+    The grid of the mosaics covers all tiles that intersect the query rectangle or,
+    if `clip_to_query_rectangle` is true, only the pixels that intersect the query rectangle.
+    """
+
+    grid: MosaicGrid | None = None
+    if clip_to_query_rectangle:
+        grid = MosaicGrid.from_bounds(geo_transform, query_rectangle.spatial_bounds)
+
+    mosaic: RasterMosaic | None = None
+    tiles_per_time_step: int | None = None
+    num_tiles = 0
+    completed_time: gety.TimeInterval | None = None
+
+    async for tile in tile_stream:
+        if tiles_per_time_step is None:
+            # the tile size is only known from the tiles themselves
+            tile_grid = TileGrid(geo_transform, tile.shape)
+            if grid is None:
+                grid = MosaicGrid.from_tiles(tile_grid, query_rectangle.spatial_bounds)
+
+            tiles = tile_grid.intersecting_tiles(query_rectangle.spatial_bounds)
+            tiles_per_time_step = (tiles.width + 1) * (tiles.height + 1) * len(query_rectangle.raster_bands)
+
+        assert grid is not None
+
+        if completed_time is not None and tile.time == completed_time:
+            # the tile lies outside of the grid of the already yielded mosaic
+            continue
+
+        if mosaic is None or mosaic.time != tile.time:
+            if mosaic is not None:
+                yield mosaic
+
+            mosaic = allocate(grid, tile.time, tile.crs)
+            num_tiles = 0
+
+        mosaic.add_tile(tile)
+        num_tiles += 1
+
+        if num_tiles == tiles_per_time_step:
+            # yield the complete time step without waiting for the first tile of the next one
+            completed_time = mosaic.time
+            yield mosaic
+            mosaic = None
+
+    if mosaic is not None:
+        yield mosaic
@@ -0,0 +1,211 @@
+"""
+Extraction of the values of raster results at point locations.
+
+The points are indexed by the tiles of the result once, so that only the tiles that contain points are queried
+and the values of each tile are gathered with one vectorized indexing operation.
+The memory usage is proportional to the number of points (and time steps), not to the queried extent.
+"""
+
+from __future__ import annotations
+
+from collections.abc import AsyncIterator
+
+import geopandas as gpd
+import numpy as np
+
+import geoengine.types as gety
+from geoengine.error import InputException
+from geoengine.raster import RasterTile2D
+from geoengine.raster_mosaic import MosaicGrid
+from geoengine.tiling import TileGrid
+
+
+class PointIndex:
+    """The pixels of points in the spatial grid of a raster result, grouped by the tiles that contain them"""
+
+    grid_geo_transform: gety.GeoTransform
+    pixel_x: np.ndarray
+    pixel_y: np.ndarray
+    positions: np.ndarray
+
+    def __init__(self, grid_geo_transform: gety.GeoTransform, x: np.ndarray, y: np.ndarray, grid: MosaicGrid) -> None:
+        """
+        Index the points with the coordinates `x` and `y` in the spatial grid of a result.
+        Only the points in the pixels of `grid` (a part of the result's spatial grid) are indexed.
+        """
+
+        assert grid.pixel_idx is not None, "The grid must know its position in the spatial grid"
+
+        self.grid_geo_transform = grid_geo_transform
+
+        pixel_x = np.floor((x - grid_geo_transform.x_min) / grid_geo_transform.x_pixel_size).astype(np.int64)
+        pixel_y = np.floor((y - grid_geo_transform.y_max) / grid_geo_transform.y_pixel_size).astype(np.int64)
+
+        in_grid = (
+            (pixel_x >= grid.pixel_idx.x_idx)
+            & (pixel_x < grid.pixel_idx.x_idx + grid.width)
+            & (pixel_y >= grid.pixel_idx.y_idx)
+            & (pixel_y < grid.pixel_idx.y_idx + grid.height)
+        )
+
+        self.positions = np.flatnonzero(in_grid)
+        self.pixel_x = pixel_x[self.positions]
+        self.pixel_y = pixel_y[self.positions]
+
+        self.__tiles: dict[tuple[int, int], dict[tuple[int, int], np.ndarray]] = {}
+
+    def tiles(self, tile_shape: tuple[int, int]) -> dict[tuple[int, int], np.ndarray]:
+        """Return the indices (into the indexed points) of the points per (x, y) tile index of a tile shape"""
+
+        tiles = self.__tiles.get(tile_shape)
+        if tiles is not None:
+            return tiles
+
+        (tile_height, tile_width) = tile_shape
+        tile_x = self.pixel_x // tile_width
+        tile_y = self.pixel_y // tile_height
+
+        # sort the points by tile once and split them into the runs of equal tiles
+        order = np.lexsort((tile_x, tile_y))
+        keys = np.stack([tile_x[order], tile_y[order]], axis=1)
+        (unique_keys, starts) = np.unique(keys, axis=0, return_index=True)
+
+        tiles = {
+            (int(key[0]), int(key[1])): points
+            for key, points in zip(unique_keys, np.split(order, starts[1:]), strict=True)
+        }
+        self.__tiles[tile_shape] = tiles
+
+        return tiles
+
+    def tile_queries(
+        self, tile_grid: TileGrid, query_rectangle: gety.RasterQueryRectangle
+    ) -> list[gety.RasterQueryRectangle]:
+        """
+        Return one query per row of tiles (of a tile grid) that contains points.
+        A query spans from the leftmost to the rightmost tile of its row that contains points.
+        """
+
+        rows: dict[int, tuple[int, int]] = {}
+        for x_idx, y_idx in self.tiles((tile_grid.tile_size_y, tile_grid.tile_size_x)):
+            (start, end) = rows.get(y_idx, (x_idx, x_idx))
+            rows[y_idx] = (min(start, x_idx), max(end, x_idx))
+
+        bounds = query_rectangle.spatial_bounds
+        queries = []
+
+        for y_idx, (x_start, x_end) in sorted(rows.items()):
+            row_bounds = tile_grid.tile_bounds(
+                gety.GridBoundingBox2D(
+                    top_left_idx=gety.GridIdx2D(x_idx=x_start, y_idx=y_idx),
+                    bottom_right_idx=gety.GridIdx2D(x_idx=x_end, y_idx=y_idx),
+                )
+            )
+
+            queries.append(
+                gety.RasterQueryRectangle(
+                    gety.BoundingBox2D(
+                        max(bounds.xmin, row_bounds.xmin),
+                        max(bounds.ymin, row_bounds.ymin),
+                        min(bounds.xmax, row_bounds.xmax),
+                        min(bounds.ymax, row_bounds.ymax),
+                    ),
+                    query_rectangle.time,
+                    query_rectangle.raster_bands,
+                    query_rectangle.srs,
+                )
+            )
+
+        return queries
+
+    def gather(self, tile: RasterTile2D) -> tuple[np.ndarray, np.ndarray, np.ndarray | None]:
+        """
+        Gather the values of the points in a tile.
+        Returns the indices of the points (into all points), their values and their nodata mask (or `None`).
+        """
+
+        pixel_idx = tile.pixel_idx
+        if pixel_idx is None:
+            pixel_idx = self.grid_geo_transform.pixel_idx_of(tile.geo_transform)
+
+        (tile_height, tile_width) = tile.shape
+        points = self.tiles(tile.shape).get((pixel_idx.x_idx // tile_width, pixel_idx.y_idx // tile_height))
+
+        if points is None:
+            return (np.empty(0, dtype=np.int64), np.empty(0, dtype=tile.numpy_data_type), None)
+
+        rows = self.pixel_y[points] - pixel_idx.y_idx
+        cols = self.pixel_x[points] - pixel_idx.x_idx
+
+        values = tile.to_numpy_values_view()[rows, cols]
+        tile_mask = tile.to_numpy_mask_array()
+        mask = None if tile_mask is None else tile_mask[rows, cols]
+
+        return (self.positions[points], values, mask)
+
+
+class PointValues:
+    """Collects the values of points per time step as (time, band, point) arrays"""
+
+    bands: list[int]
+    num_points: int
+    dtype: np.dtype
+
+    def __init__(self, bands: list[int], num_points: int, dtype: np.dtype) -> None:
+        self.bands = bands
+        self.num_points = num_points
+        self.dtype = np.dtype(dtype)
+
+        self.__band_indices = {band: i for i, band in enumerate(bands)}
+        self.__times: dict[np.datetime64, tuple[np.ndarray, np.ndarray]] = {}
+
+    def add(self, tile: RasterTile2D, points: np.ndarray, values: np.ndarray, mask: np.ndarray | None) -> None:
+        """Add the gathered values of the points of a tile"""
+
+        time_values = self.__times.get(tile.time.start)
+        if time_values is None:
+            shape = (len(self.bands), self.num_points)
+            time_values = (np.zeros(shape, dtype=self.dtype), np.ones(shape, dtype=np.bool_))
+            self.__times[tile.time.start] = time_values
+
+        (data, data_mask) = time_values
+        band_index = self.__band_indices[tile.band]
+
+        data[band_index, points] = values
+        data_mask[band_index, points] = False if mask is None else mask
+
+    def finish(self) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Return the time steps (ordered by time) and the (time, band, point) values and nodata mask"""
+
+        times = sorted(self.__times.keys())
+        shape = (0, len(self.bands), self.num_points)
+
+        if not times:
+            return (np.array([], dtype="datetime64[ms]"), np.empty(shape, dtype=self.dtype), np.empty(shape, np.bool_))
+
+        return (
+            np.array(times, dtype="datetime64[ms]"),
+            np.stack([self.__times[time][0] for time in times]),
+            np.stack([self.__times[time][1] for time in times]),
+        )
+
+
+def point_coordinates(points: gpd.GeoDataFrame | gpd.GeoSeries, srs: str) -> tuple[np.ndarray, np.ndarray]:
+    """Return the x and y coordinates of points in a spatial reference system"""
+
+    if points.crs is not None:
+        points = points.to_crs(srs)
+
+    geometries = points.geometry if isinstance(points, gpd.GeoDataFrame) else points
+
+    if not (geometries.geom_type == "Point").all():
+        raise InputException("Values can only be extracted at point geometries")
+
+    return (geometries.x.to_numpy(dtype=np.float64), geometries.y.to_numpy(dtype=np.float64))
+
+
+async def chain_streams(streams: list[AsyncIterator[RasterTile2D]]) -> AsyncIterator[RasterTile2D]:
+    """Yield the items of the streams one stream after the other"""
+    for stream in streams:
+        async for tile in stream:
+            yield tile
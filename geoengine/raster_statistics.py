@@ -0,0 +1,258 @@
+"""
+Streaming statistics of raster results.
+
+Each tile is reduced to mergeable partial statistics, so that the statistics of a result are computed with
+constant memory. Means and variances are merged with the parallel variant of Welford's algorithm
+(Chan et al.) and histograms have fixed bins.
+"""
+
+from __future__ import annotations
+
+from collections.abc import Iterable
+
+import numpy as np
+import xarray as xr
+
+from geoengine.error import InputException
+from geoengine.raster import RasterTile2D
+from geoengine.raster_mosaic import MosaicGrid
+from geoengine.util import clamp_datetime_ms_ns
+
+ALL_STATISTICS = ("count", "min", "max", "mean", "std", "histogram")
+DEFAULT_STATISTICS = ("count", "min", "max", "mean", "std")
+
+
+class HistogramBins:
+    """Equally sized histogram bins over a fixed value range, where values outside the range are not counted"""
+
+    bins: int
+    value_range: tuple[float, float]
+
+    def __init__(self, bins: int, value_range: tuple[float, float]) -> None:
+        """Create `bins` bins from `value_range[0]` (inclusive) to `value_range[1]` (inclusive)"""
+
+        if bins < 1:
+            raise InputException("A histogram needs at least one bin")
+        if not value_range[0] < value_range[1]:
+            raise InputException("The histogram range must be increasing")
+
+        self.bins = bins
+        self.value_range = value_range
+
+    def counts(self, values: np.ndarray) -> np.ndarray:
+        """Count the values per bin"""
+        (counts, _) = np.histogram(values, bins=self.bins, range=self.value_range)
+        return counts.astype(np.int64)
+
+    def edges(self) -> np.ndarray:
+        """The `bins + 1` edges of the bins"""
+        return np.linspace(self.value_range[0], self.value_range[1], self.bins + 1)
+
+    def __repr__(self) -> str:
+        return f"HistogramBins(bins={self.bins}, value_range={self.value_range})"
+
+
+class BandStatistics:
+    """Mergeable statistics of the valid pixels of a band"""
+
+    count: int
+    min: float
+    max: float
+    mean: float
+    m2: float
+    histogram: np.ndarray | None
+
+    # pylint: disable=too-many-arguments,too-many-positional-arguments
+    def __init__(
+        self,
+        count: int = 0,
+        min_value: float = np.inf,
+        max_value: float = -np.inf,
+        mean: float = 0.0,
+        m2: float = 0.0,
+        histogram: np.ndarray | None = None,
+    ) -> None:
+        """Create statistics from the number of values, their extrema, mean, sum of squared deviations and histogram"""
+        self.count = count
+        self.min = min_value
+        self.max = max_value
+        self.mean = mean
+        self.m2 = m2
+        self.histogram = histogram
+
+    @staticmethod
+    def of_values(
+        values: np.ndarray, statistics: frozenset[str], histogram_bins: HistogramBins | None
+    ) -> BandStatistics:
+        """Compute the requested statistics of a 1D array of values with vectorized numpy operations"""
+
+        result = BandStatistics(count=len(values))
+
+        if histogram_bins is not None and "histogram" in statistics:
+            result.histogram = histogram_bins.counts(values)
+
+        if len(values) == 0:
+            return result
+
+        if "min" in statistics or "max" in statistics:
+            result.min = float(values.min())
+            result.max = float(values.max())
+
+        if "mean" in statistics or "std" in statistics:
+            float_values = values.astype(np.float64, copy=False)
+            result.mean = float(float_values.mean())
+            result.m2 = float(np.square(float_values - result.mean).sum())
+
+        return result
+
+    def merge(self, other: BandStatistics) -> None:
+        """Merge the statistics of other values into these statistics"""
+
+        if other.count > 0:
+            count = self.count + other.count
+            delta = other.mean - self.mean
+
+            self.m2 += other.m2 + delta * delta * self.count * other.count / count
+            self.mean += delta * other.count / count
+            self.count = count
+            self.min = min(self.min, other.min)
+            self.max = max(self.max, other.max)
+
+        if other.histogram is not None:
+            self.histogram = other.histogram.copy() if self.histogram is None else self.histogram + other.histogram
+
+    @property
+    def variance(self) -> float:
+        """The population variance of the values, which is NaN if there are none"""
+        return self.m2 / self.count if self.count > 0 else np.nan
+
+    @property
+    def std(self) -> float:
+        """The population standard deviation of the values, which is NaN if there are none"""
+        return float(np.sqrt(self.variance))
+
+    def value(self, statistic: str) -> float:
+        """Return a scalar statistic by its name, which is NaN if there are no values"""
+        if statistic == "count":
+            return self.count
+        if self.count == 0:
+            return np.nan
+        if statistic == "min":
+            return self.min
+        if statistic == "max":
+            return self.max
+        if statistic == "mean":
+            return self.mean
+        if statistic == "std":
+            return self.std
+        raise InputException(f"Unknown statistic `{statistic}`")
+
+    def __repr__(self) -> str:
+        return (
+            f"BandStatistics(count={self.count}, min={self.min}, max={self.max}, mean={self.mean}, "
+            f"std={self.std}, histogram={self.histogram})"
+        )
+
+
+def check_statistics(statistics: Iterable[str], histogram_bins: HistogramBins | None) -> frozenset[str]:
+    """Validate the names of requested statistics"""
+
+    requested = frozenset(statistics)
+
+    unknown = requested.difference(ALL_STATISTICS)
+    if unknown:
+        raise InputException(f"Unknown statistics {sorted(unknown)}, available are {list(ALL_STATISTICS)}")
+
+    if "histogram" in requested and histogram_bins is None:
+        raise InputException("A histogram requires `histogram_bins`")
+
+    return requested
+
+
+def tile_band_statistics(
+    tile: RasterTile2D,
+    grid: MosaicGrid,
+    statistics: frozenset[str],
+    histogram_bins: HistogramBins | None,
+) -> BandStatistics | None:
+    """
+    Reduce the valid pixels of a tile that lie in a grid to their statistics.
+    Returns `None` if the tile does not intersect the grid.
+    """
+
+    window = grid.tile_window(tile)
+    if window is None:
+        return None
+
+    if tile.is_empty():
+        return BandStatistics.of_values(np.empty(0, dtype=tile.numpy_data_type), statistics, histogram_bins)
+
+    (_, source) = window
+    values = tile.to_numpy_values_view()[source]
+
+    tile_mask = tile.to_numpy_mask_array()
+    mask = None if tile_mask is None else tile_mask[source]
+    if np.issubdtype(values.dtype, np.floating):
+        # NaN values are nodata as well
+        mask = np.isnan(values) if mask is None else mask | np.isnan(values)
+
+    valid_values = values.reshape(-1) if mask is None else values[~mask]
+
+    return BandStatistics.of_values(valid_values, statistics, histogram_bins)
+
+
+def statistics_to_xarray(
+    results: dict[np.datetime64, dict[int, BandStatistics]],
+    bands: list[int],
+    statistics: frozenset[str],
+    histogram_bins: HistogramBins | None,
+) -> xr.Dataset:
+    """
+    Convert the statistics per time step and band into a dataset with the dimensions (time, band).
+    The histogram has the additional dimension `bin`, whose coordinate is the center of each bin.
+    """
+
+    times = list(results.keys())
+    empty = BandStatistics()
+
+    def band_statistics(time: np.datetime64, band: int) -> BandStatistics:
+        return results[time].get(band, empty)
+
+    data_vars: dict[str, tuple[list[str], np.ndarray]] = {}
+
+    for statistic in ALL_STATISTICS:
+        if statistic not in statistics or statistic == "histogram":
+            continue
+
+        values = np.array(
+            [[band_statistics(time, band).value(statistic) for band in bands] for time in times],
+            dtype=np.int64 if statistic == "count" else np.float64,
+        ).reshape(len(times), len(bands))
+
+        data_vars[statistic] = (["time", "band"], values)
+
+    coords: dict[str, np.ndarray | list[int]] = {
+        "time": np.array(
+            [clamp_datetime_ms_ns(time.astype("datetime64[ms]")) for time in times], dtype="datetime64[ns]"
+        ),
+        "band": bands,
+    }
+
+    if "histogram" in statistics and histogram_bins is not None:
+        no_counts = np.zeros(histogram_bins.bins, dtype=np.int64)
+        histograms = np.array(
+            [
+                [
+                    counts if (counts := band_statistics(time, band).histogram) is not None else no_counts
+                    for band in bands
+                ]
+                for time in times
+            ],
+            dtype=np.int64,
+        ).reshape(len(times), len(bands), histogram_bins.bins)
+
+        edges = histogram_bins.edges()
+        data_vars["histogram"] = (["time", "band", "bin"], histograms)
+        coords["bin"] = (edges[:-1] + edges[1:]) / 2
+
+    return xr.Dataset(data_vars, coords=coords)
@@ -6,8 +6,10 @@ from typing import cast
 import numpy as np
 import rasterio as rio
 
+from geoengine.resumable import DEFAULT_RECONNECT_POLICY, ReconnectPolicy
 from geoengine.types import (
     GeoTransform,
+    GridIdx2D,
     QueryRectangle,
     RasterQueryRectangle,
     RasterResultDescriptor,
@@ -42,6 +44,7 @@ class RasterWorkflowRioWriter:
     gdal_driver = "GTiff"
     rio_kwargs = {"tiled": True, "compress": "DEFLATE", "zlevel": 6}
     tile_size = 512
+    reconnect: ReconnectPolicy | None = None
 
     # pylint: disable=too-many-arguments,too-many-positional-arguments
     def __init__(
@@ -52,12 +55,18 @@ class RasterWorkflowRioWriter:
         data_type: np.dtype | None = None,
         print_info=False,
         rio_kwargs=None,
+        reconnect: ReconnectPolicy | None = DEFAULT_RECONNECT_POLICY,
     ):
-        """Create a new RasterWorkflowGdalWriter instance."""
+        """
+        Create a new RasterWorkflowGdalWriter instance.
+
+        The `reconnect` policy resumes the stream if the connection drops. Pass `None` to fail instead.
+        """
         self.dataset_prefix = dataset_prefix
         self.workflow = workflow
         self.no_data_value = no_data_value
         self.print_info = print_info
+        self.reconnect = reconnect
 
         ras_res = cast(RasterResultDescriptor, self.workflow.get_result_descriptor())
         self.result_descriptor = ras_res
@@ -162,8 +171,15 @@ class RasterWorkflowRioWriter:
         self.create_gdal_geo_transform_width_height(query)
 
         assert self.workflow is not None, "The workflow must be set"
+        assert self.dataset_geo_transform is not None, "The geo transform must be set"
+
+        # the pixel of the dataset at the origin of the result's spatial grid, to place tiles by their grid index
+        grid_geo_transform = self.result_descriptor.geo_transform
+        grid_origin_px_idx = self.dataset_geo_transform.coord_to_pixel_ul(
+            grid_geo_transform.x_min, grid_geo_transform.y_max
+        )
         try:
-            async for tile in self.workflow.raster_stream(query):
+            async for tile in self.workflow.raster_stream(query, reconnect=self.reconnect):
                 if self.current_time != tile.time:
                     self.close_current_dataset()
                     self.current_time = tile.time
@@ -174,14 +190,24 @@ class RasterWorkflowRioWriter:
                 if self.current_dataset is None:
                     self.__create_new_dataset(query)
 
+                if tile.is_empty():
+                    # GDAL fills the windows that are never written with the nodata value
+                    continue
+
                 assert self.current_time == tile.time, "The time of the current dataset does not match the tile"
                 assert self.dataset_geo_transform is not None, "The geo transform must be set"
                 assert self.dataset_height is not None
                 assert self.dataset_width is not None
 
-                ul_tile_px_idx = self.dataset_geo_transform.coord_to_pixel_ul(
-                    tile.geo_transform.x_min, tile.geo_transform.y_max
-                )
+                if tile.pixel_idx is None:
+                    ul_tile_px_idx = self.dataset_geo_transform.coord_to_pixel_ul(
+                        tile.geo_transform.x_min, tile.geo_transform.y_max
+                    )
+                else:
+                    ul_tile_px_idx = GridIdx2D(
+                        x_idx=grid_origin_px_idx.x_idx + tile.pixel_idx.x_idx,
+                        y_idx=grid_origin_px_idx.y_idx + tile.pixel_idx.y_idx,
+                    )
 
                 lr_tile_px_x = ul_tile_px_idx.x_idx + self.tile_size
                 lr_tile_px_y = ul_tile_px_idx.y_idx + self.tile_size
@@ -0,0 +1,272 @@
+"""
+Out-of-core writing of raster streams into Zarr (version 2) stores.
+
+The store layout follows the conventions of `xarray.Dataset.to_zarr`, so that the result can be opened lazily
+with `xarray.open_zarr`.
+Chunks are uncompressed and aligned to the tiles, so that each tile is written as exactly one chunk.
+"""
+
+from __future__ import annotations
+
+import contextlib
+import json
+import os
+from collections.abc import AsyncIterator, Iterator, MutableMapping
+from pathlib import Path
+from typing import Any
+
+import numpy as np
+import xarray as xr
+
+import geoengine.types as gety
+from geoengine import backports
+from geoengine.raster import RasterTile2D
+from geoengine.raster_mosaic import MosaicGrid
+from geoengine.tiling import TileGrid
+
+ZarrStore = str | os.PathLike | MutableMapping[str, bytes]
+
+_TIME_UNITS = "milliseconds since 1970-01-01T00:00:00"
+
+
+class DirectoryStore(MutableMapping[str, bytes]):
+    """A minimal Zarr store that maps keys to files in a directory"""
+
+    root: Path
+
+    def __init__(self, root: str | os.PathLike) -> None:
+        self.root = Path(root)
+
+    def __getitem__(self, key: str) -> bytes:
+        try:
+            return (self.root / key).read_bytes()
+        except FileNotFoundError as e:
+            raise KeyError(key) from e
+
+    def __setitem__(self, key: str, value: bytes) -> None:
+        path = self.root / key
+        path.parent.mkdir(parents=True, exist_ok=True)
+
+        # write atomically, so that readers never see partial chunks
+        temp_path = path.with_name(f".{path.name}.partial")
+        temp_path.write_bytes(value)
+        temp_path.replace(path)
+
+    def __delitem__(self, key: str) -> None:
+        try:
+            (self.root / key).unlink()
+        except FileNotFoundError as e:
+            raise KeyError(key) from e
+
+    def __iter__(self) -> Iterator[str]:
+        for path in self.root.rglob("*"):
+            if path.is_file() and not path.name.endswith(".partial"):
+                yield path.relative_to(self.root).as_posix()
+
+    def __len__(self) -> int:
+        return sum(1 for _ in self)
+
+
+class ZarrRasterWriter:
+    """
+    Writes the tiles of a raster stream as chunks of a (time, band, y, x) Zarr array.
+
+    The array covers all tiles that intersect the query rectangle.
+    The metadata (shape, coordinates, time steps and CRS) is written once by `finish`.
+    """
+
+    store: MutableMapping[str, bytes]
+    variable_name: str
+    geo_transform: gety.GeoTransform
+    query_rectangle: gety.RasterQueryRectangle
+    dtype: np.dtype
+    fill_value: int | float | None
+
+    # pylint: disable=too-many-arguments,too-many-positional-arguments
+    def __init__(
+        self,
+        store: ZarrStore,
+        geo_transform: gety.GeoTransform,
+        query_rectangle: gety.RasterQueryRectangle,
+        dtype: np.dtype,
+        variable_name: str = "data",
+        fill_value: int | float | None = None,
+    ) -> None:
+        """
+        Create a writer for a store.
+
+        Nodata pixels are written as `fill_value`, which defaults to NaN for floating point data.
+        Integer data has no fill value by default, so that no valid value is masked when reading.
+        Its nodata pixels are written as 0 then.
+        """
+
+        self.store = store if isinstance(store, MutableMapping) else DirectoryStore(store)
+        self.variable_name = variable_name
+        self.geo_transform = geo_transform
+        self.query_rectangle = query_rectangle
+        self.dtype = np.dtype(dtype)
+
+        if fill_value is None and np.issubdtype(self.dtype, np.floating):
+            fill_value = np.nan
+        self.fill_value = fill_value
+
+        self.__grid: MosaicGrid | None = None
+        self.__tile_shape: tuple[int, int] | None = None
+        self.__crs: str | None = None
+        self.__time_indices: dict[np.datetime64, int] = {}
+        self.__band_indices = {band: i for i, band in enumerate(query_rectangle.raster_bands)}
+
+    def write_tile(self, tile: RasterTile2D) -> None:
+        """Write a tile as a chunk of the array"""
+
+        if self.__grid is None:
+            # the tile size is only known from the tiles themselves
+            self.__tile_shape = tile.shape
+            self.__crs = tile.crs
+            self.__grid = MosaicGrid.from_tiles(
+                TileGrid(self.geo_transform, tile.shape), self.query_rectangle.spatial_bounds
+            )
+
+        assert tile.shape == self.__tile_shape, "All tiles must have the same shape"
+
+        (y_offset, x_offset) = self.__grid.tile_offset(tile)
+        (tile_height, tile_width) = tile.shape
+
+        if not (0 <= y_offset < self.__grid.height and 0 <= x_offset < self.__grid.width):
+            return
+
+        assert y_offset % tile_height == 0 and x_offset % tile_width == 0, "Tiles must be aligned to the tile grid"
+
+        time_index = self.__time_indices.setdefault(tile.time.start, len(self.__time_indices))
+        band_index = self.__band_indices[tile.band]
+
+        key = f"{time_index}.{band_index}.{y_offset // tile_height}.{x_offset // tile_width}"
+
+        if tile.is_empty():
+            if self.fill_value is not None:
+                # missing chunks are read as the fill value
+                with contextlib.suppress(KeyError):
+                    del self.store[f"{self.variable_name}/{key}"]
+                return
+            chunk = np.zeros(tile.shape, dtype=self.dtype)
+        else:
+            chunk = tile.to_numpy_values_view().astype(self.dtype, copy=False)
+            mask = tile.to_numpy_mask_array()
+            if mask is not None:
+                chunk = np.where(mask, np.array(self.fill_value or 0, dtype=self.dtype), chunk)
+
+        self.store[f"{self.variable_name}/{key}"] = np.ascontiguousarray(chunk).tobytes()
+
+    def finish(self) -> None:
+        """Write the metadata of the array and its coordinates"""
+
+        grid = self.__grid
+        tile_shape = self.__tile_shape
+
+        if grid is None or tile_shape is None:
+            # nothing was written, so we describe an empty array on the pixels of the query rectangle
+            grid = MosaicGrid.from_bounds(self.geo_transform, self.query_rectangle.spatial_bounds)
+            tile_shape = grid.shape
+
+        metadata: dict[str, Any] = {
+            ".zgroup": {"zarr_format": 2},
+            ".zattrs": {},
+        }
+
+        times = np.array(list(self.__time_indices.keys()), dtype="datetime64[ms]").astype(np.int64)
+        bands = np.array(self.query_rectangle.raster_bands, dtype=np.int64)
+
+        coordinates = {
+            "time": (times, {"units": _TIME_UNITS, "calendar": "proleptic_gregorian"}),
+            "band": (bands, {}),
+            "y": (grid.coords_y(), {}),
+            "x": (grid.coords_x(), {}),
+        }
+        for name, (values, attributes) in coordinates.items():
+            # coordinates are single chunks, which must not be empty
+            chunks = (max(len(values), 1),)
+            metadata.update(_array_metadata(name, [name], values.shape, chunks, values.dtype, None, attributes))
+            self.store[f"{name}/0"] = np.ascontiguousarray(values).tobytes()
+
+        metadata.update(
+            _array_metadata("spatial_ref", [], (), (), np.dtype(np.int64), None, self.__crs_attributes(grid))
+        )
+        self.store["spatial_ref/0"] = np.array(0, dtype=np.int64).tobytes()
+
+        metadata.update(
+            _array_metadata(
+                self.variable_name,
+                ["time", "band", "y", "x"],
+                (len(times), len(bands), *grid.shape),
+                (1, 1, *tile_shape),
+                self.dtype,
+                self.fill_value,
+                {"grid_mapping": "spatial_ref", "coordinates": "spatial_ref"},
+            )
+        )
+
+        for key, value in metadata.items():
+            self.store[key] = _json_bytes(value)
+
+        # consolidated metadata lets readers open the store with a single read
+        self.store[".zmetadata"] = _json_bytes({"zarr_consolidated_format": 1, "metadata": metadata})
+
+    def __crs_attributes(self, grid: MosaicGrid) -> dict[str, Any]:
+        """The CF grid mapping attributes of the CRS like `rioxarray` writes them"""
+
+        crs = self.__crs if self.__crs is not None else "EPSG:4326"
+        attributes = dict(xr.DataArray(0).rio.write_crs(crs).spatial_ref.attrs)
+
+        geo_transform = grid.geo_transform
+        attributes["GeoTransform"] = (
+            f"{geo_transform.x_min} {geo_transform.x_pixel_size} 0.0 {geo_transform.y_max} 0.0 "
+            f"{geo_transform.y_pixel_size}"
+        )
+
+        return attributes
+
+
+# pylint: disable=too-many-arguments,too-many-positional-arguments
+def _array_metadata(
+    name: str,
+    dimensions: list[str],
+    shape: tuple[int, ...],
+    chunks: tuple[int, ...],
+    dtype: np.dtype,
+    fill_value: int | float | None,
+    attributes: dict[str, Any],
+) -> dict[str, Any]:
+    """The `.zarray` and `.zattrs` entries of an array"""
+
+    if isinstance(fill_value, float) and np.isnan(fill_value):
+        json_fill_value: int | float | str | None = "NaN"
+    else:
+        json_fill_value = fill_value
+
+    return {
+        f"{name}/.zarray": {
+            "zarr_format": 2,
+            "shape": list(shape),
+            "chunks": list(chunks),
+            "dtype": dtype.str,
+            "compressor": None,
+            "fill_value": json_fill_value,
+            "order": "C",
+            "filters": None,
+            "dimension_separator": ".",
+        },
+        f"{name}/.zattrs": {"_ARRAY_DIMENSIONS": dimensions, **attributes},
+    }
+
+
+def _json_bytes(value: Any) -> bytes:
+    return json.dumps(value, indent=4, sort_keys=True).encode()
+
+
+async def raster_stream_into_zarr(tile_stream: AsyncIterator[RasterTile2D], writer: ZarrRasterWriter) -> None:
+    """Write a stream of tiles into a Zarr store without keeping more than one tile in memory"""
+
+    async for tile in tile_stream:
+        await backports.to_thread(writer.write_tile, tile)
+
+    await backports.to_thread(writer.finish)
@@ -0,0 +1,329 @@
+"""
+Resumable streams that reconnect after transient connection failures.
+
+A stream records its progress, so that a reconnect only requests what is still missing
+and skips what was already yielded.
+"""
+
+from __future__ import annotations
+
+import asyncio
+from collections.abc import AsyncIterator, Callable
+from logging import warning
+from typing import TypeVar
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import websockets.exceptions
+
+import geoengine.types as gety
+from geoengine.raster import RasterTile2D
+
+T = TypeVar("T")
+
+# errors of a dropped connection (and not, e.g., of an invalid query)
+RECONNECTABLE_ERRORS: tuple[type[BaseException], ...] = (
+    websockets.exceptions.ConnectionClosedError,
+    OSError,
+    asyncio.TimeoutError,
+)
+
+# mixes the hashes of the columns of a feature (a large odd number, so that the multiplication is invertible)
+_HASH_FACTOR = np.uint64(0x9E3779B97F4A7C15)
+
+
+class ReconnectPolicy:
+    """How often and after which delays a dropped stream is reconnected"""
+
+    max_retries: int
+    initial_backoff: float
+    max_backoff: float
+    backoff_factor: float
+
+    def __init__(
+        self,
+        max_retries: int = 5,
+        initial_backoff: float = 1.0,
+        max_backoff: float = 60.0,
+        backoff_factor: float = 2.0,
+    ) -> None:
+        """
+        Create a policy that retries up to `max_retries` times in a row.
+        The delay before the n-th retry is `initial_backoff * backoff_factor ** (n - 1)` seconds,
+        but at most `max_backoff` seconds.
+        """
+        self.max_retries = max_retries
+        self.initial_backoff = initial_backoff
+        self.max_backoff = max_backoff
+        self.backoff_factor = backoff_factor
+
+    def backoff(self, retry: int) -> float:
+        """The delay in seconds before the `retry`-th retry (starting at 1)"""
+        return min(self.initial_backoff * self.backoff_factor ** (retry - 1), self.max_backoff)
+
+    def __repr__(self) -> str:
+        return (
+            f"ReconnectPolicy(max_retries={self.max_retries}, initial_backoff={self.initial_backoff}, "
+            f"max_backoff={self.max_backoff}, backoff_factor={self.backoff_factor})"
+        )
+
+
+DEFAULT_RECONNECT_POLICY = ReconnectPolicy()
+
+
+async def reconnecting_stream(
+    open_stream: Callable[[], AsyncIterator[T]],
+    policy: ReconnectPolicy,
+) -> AsyncIterator[T]:
+    """
+    Yield the items of `open_stream()` and open it again if the connection drops.
+
+    `open_stream` must resume where the previous stream stopped.
+    The retries are counted since the last yielded item, so a long stream may reconnect more often in total.
+    """
+
+    retry = 0
+
+    while True:
+        try:
+            async for item in open_stream():
+                retry = 0
+                yield item
+            return
+        except RECONNECTABLE_ERRORS as e:
+            retry += 1
+            if retry > policy.max_retries:
+                raise
+
+            backoff = policy.backoff(retry)
+            warning("Stream connection dropped (%s), reconnecting in %.1f s", e, backoff)
+            await asyncio.sleep(backoff)
+
+
+class RasterStreamProgress:
+    """
+    Records which tiles of a raster stream were yielded.
+
+    The Geo Engine yields the tiles ordered by time, so all time steps before the current one are complete.
+    A resumed stream queries from the current time step on and skips the tiles of it that were already yielded.
+    """
+
+    query_rectangle: gety.RasterQueryRectangle
+    current_time_start: np.datetime64 | None
+
+    def __init__(self, query_rectangle: gety.RasterQueryRectangle) -> None:
+        self.query_rectangle = query_rectangle
+        self.current_time_start = None
+        self.__yielded: set[tuple[int, float, float]] = set()
+
+    def remaining_query(self) -> gety.RasterQueryRectangle:
+        """The query rectangle of the time steps that are not complete yet"""
+
+        if self.current_time_start is None:
+            return self.query_rectangle
+
+        query_time = self.query_rectangle.time
+        start = max(query_time.start, self.current_time_start)
+
+        return gety.RasterQueryRectangle(
+            self.query_rectangle.spatial_bounds,
+            gety.TimeInterval(start, max(start, query_time.end) if query_time.end is not None else None),
+            self.query_rectangle.raster_bands,
+            self.query_rectangle.srs,
+        )
+
+    def is_yielded(self, tile: RasterTile2D) -> bool:
+        """Check if a tile was already yielded"""
+
+        if self.current_time_start is None:
+            return False
+
+        if tile.time.start != self.current_time_start:
+            return bool(tile.time.start < self.current_time_start)
+
+        return self.__key(tile) in self.__yielded
+
+    def record(self, tile: RasterTile2D) -> None:
+        """Record that a tile was yielded"""
+
+        if tile.time.start != self.current_time_start:
+            self.current_time_start = tile.time.start
+            self.__yielded.clear()
+
+        self.__yielded.add(self.__key(tile))
+
+    @staticmethod
+    def __key(tile: RasterTile2D) -> tuple[int, float, float]:
+        if tile.pixel_idx is not None:
+            return (tile.band, tile.pixel_idx.x_idx, tile.pixel_idx.y_idx)
+        return (tile.band, tile.geo_transform.x_min, tile.geo_transform.y_max)
+
+
+async def resumable_raster_stream(
+    open_stream: Callable[[gety.RasterQueryRectangle], AsyncIterator[T]],
+    query_rectangle: gety.RasterQueryRectangle,
+    policy: ReconnectPolicy,
+    tile_of: Callable[[T], RasterTile2D],
+) -> AsyncIterator[T]:
+    """
+    Stream the items of a query rectangle and resume with the remaining extent after a dropped connection.
+
+    `tile_of` returns the tile of an item.
+    """
+
+    progress = RasterStreamProgress(query_rectangle)
+
+    async def resume() -> AsyncIterator[T]:
+        async for item in open_stream(progress.remaining_query()):
+            tile = tile_of(item)
+            if progress.is_yielded(tile):
+                continue
+            progress.record(tile)
+            yield item
+
+    async for item in reconnecting_stream(resume, policy):
+        yield item
+
+
+class VectorStreamProgress:
+    """
+    Records which features of a vector stream were yielded.
+
+    The Geo Engine neither orders the features of a vector stream (e.g., by time) nor guarantees the boundaries
+    of its chunks. So a resumed stream queries the whole query rectangle again and skips the features that were
+    already yielded by their identity, i.e., a hash of all of their values.
+    Equal features are counted, so that none of them are lost.
+    """
+
+    def __init__(self) -> None:
+        self.__yielded: list[np.ndarray] = []
+        self.__skip: dict[int, int] = {}
+
+    def resume(self) -> None:
+        """Start a (re)connection, which skips the features that were yielded before"""
+
+        if not self.__yielded:
+            return
+
+        self.__yielded = [np.concatenate(self.__yielded)]
+        (keys, counts) = np.unique(self.__yielded[0], return_counts=True)
+        self.__skip = dict(zip(keys.tolist(), counts.tolist(), strict=True))
+
+    def remaining(self, keys: np.ndarray) -> np.ndarray | None:
+        """
+        Return a mask of the features (by their keys) that were not yielded yet
+        or `None` if no features have to be skipped anymore.
+        """
+
+        if not self.__skip:
+            return None
+
+        mask = np.ones(len(keys), dtype=np.bool_)
+        for i, key in enumerate(keys.tolist()):
+            count = self.__skip.get(key, 0)
+            if count == 0:
+                continue
+
+            mask[i] = False
+            if count == 1:
+                del self.__skip[key]
+            else:
+                self.__skip[key] = count - 1
+
+        return mask
+
+    def record(self, keys: np.ndarray) -> None:
+        """Record that the features with `keys` were yielded"""
+
+        if len(keys) > 0:
+            self.__yielded.append(keys)
+
+
+def feature_keys(record_batch: pa.RecordBatch) -> np.ndarray:
+    """Hash all values of each feature (row) of a record batch, so that it is recognized in a repeated query"""
+
+    keys = np.zeros(record_batch.num_rows, dtype=np.uint64)
+    for column in record_batch.columns:
+        keys = keys * _HASH_FACTOR + _array_hashes(column)
+    return keys
+
+
+def _array_hashes(array: pa.Array) -> np.ndarray:
+    """Hash the values of an array, including nested lists (e.g., of GeoArrow geometries) and structs"""
+
+    if pa.types.is_struct(array.type):
+        hashes = np.zeros(len(array), dtype=np.uint64)
+        for field in array.flatten():
+            hashes = hashes * _HASH_FACTOR + _array_hashes(field)
+    elif pa.types.is_list(array.type) or pa.types.is_large_list(array.type) or pa.types.is_fixed_size_list(array.type):
+        if pa.types.is_fixed_size_list(array.type):
+            offsets = np.arange(len(array) + 1) * array.type.list_size
+        else:
+            offsets = array.offsets.to_numpy()
+            # the offsets of a sliced array do not start at zero, but its flattened values do
+            offsets = offsets - offsets[0]
+
+        values = array.flatten()
+        # the position of each value in its list, so that the order of the values matters
+        positions = np.arange(len(values)) - np.repeat(offsets[:-1], np.diff(offsets))
+        value_hashes = pd.util.hash_array(_array_hashes(values) ^ positions.astype(np.uint64))
+
+        sums = np.concatenate([np.zeros(1, dtype=np.uint64), np.cumsum(value_hashes, dtype=np.uint64)])
+        hashes = (sums[offsets[1:]] - sums[offsets[:-1]]) * _HASH_FACTOR + pd.util.hash_array(np.diff(offsets))
+    else:
+        return pd.util.hash_array(array.to_numpy(zero_copy_only=False))
+
+    if array.null_count > 0:
+        hashes[array.is_null().to_numpy(zero_copy_only=False)] = 0
+
+    return hashes
+
+
+def decode_with_feature_keys(
+    frame: bytes,
+    decode: Callable[[bytes], T | None],
+    read: Callable[[bytes], pa.RecordBatch],
+) -> tuple[T, np.ndarray] | None:
+    """
+    Decode a chunk of a vector stream and hash its features for a `VectorStreamProgress`.
+    `read` reads the record batch of the chunk.
+    """
+
+    decoded = decode(frame)
+    if decoded is None:
+        return None
+
+    return (decoded, feature_keys(read(frame)))
+
+
+async def resumable_feature_stream(
+    open_stream: Callable[[], AsyncIterator[tuple[T, np.ndarray]]],
+    policy: ReconnectPolicy,
+    filter_features: Callable[[T, np.ndarray], T],
+) -> AsyncIterator[T]:
+    """
+    Stream chunks of features and skip the already yielded features after a dropped connection.
+
+    `open_stream` streams the chunks together with the keys of their features (see `decode_with_feature_keys`)
+    and `filter_features` selects the features of a chunk by a boolean mask.
+    """
+
+    progress = VectorStreamProgress()
+
+    async def resume() -> AsyncIterator[T]:
+        progress.resume()
+
+        async for chunk, keys in open_stream():
+            mask = progress.remaining(keys)
+            if mask is not None and not mask.all():
+                if not mask.any():
+                    continue
+                chunk = filter_features(chunk, mask)
+                keys = keys[mask]
+
+            progress.record(keys)
+            yield chunk
+
+    async for chunk in reconnecting_stream(resume, policy):
+        yield chunk
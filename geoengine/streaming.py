@@ -0,0 +1,357 @@
+"""Helpers for consuming and combining asynchronous data streams"""
+
+from __future__ import annotations
+
+import asyncio
+import threading
+import time
+from collections.abc import AsyncIterator, Callable, Iterator, Sequence
+from typing import Any, TypeVar
+
+import websockets
+import websockets.asyncio.client
+
+from geoengine.decode_executor import run_in_decode_executor
+from geoengine.error import GeoEngineException
+
+T = TypeVar("T")
+
+DEFAULT_MERGE_BUFFER_SIZE = 4
+DEFAULT_PREFETCH = 4
+DEFAULT_DECODERS = 2
+
+
+class _StreamEnd:
+    """Marks the end of a stream in a queue"""
+
+
+class _StreamError:
+    """Transports an exception of a stream through a queue"""
+
+    exception: BaseException
+
+    def __init__(self, exception: BaseException) -> None:
+        self.exception = exception
+
+
+class StreamStatistics:
+    """
+    Counters of a websocket data stream.
+
+    They show where a stream spends its time:
+    - A high `network_wait_seconds` means that the consumer waits for frames from the server.
+    - A high `decode_wait_seconds` means that the consumer waits for frames to be decoded.
+    - A high `mean_queue_depth` (close to the prefetch limit) means that the consumer itself is the bottleneck.
+
+    Raster streams also count their empty (all nodata) tiles in `empty_tiles`.
+    """
+
+    requested_frames: int
+    received_frames: int
+    received_bytes: int
+    yielded_items: int
+    empty_tiles: int
+    max_pending_requests: int
+    max_pending_decodes: int
+    max_queue_depth: int
+    queue_depth_sum: int
+    network_wait_seconds: float
+    decode_wait_seconds: float
+
+    def __init__(self) -> None:
+        """Create a new set of counters"""
+        self.requested_frames = 0
+        self.received_frames = 0
+        self.received_bytes = 0
+        self.yielded_items = 0
+        self.empty_tiles = 0
+        self.max_pending_requests = 0
+        self.max_pending_decodes = 0
+        self.max_queue_depth = 0
+        self.queue_depth_sum = 0
+        self.network_wait_seconds = 0.0
+        self.decode_wait_seconds = 0.0
+
+    @property
+    def pending_requests(self) -> int:
+        """
+        The number of requests that were sent but not yet answered.
+        If the statistics are shared by several connections, this is the sum over all of them.
+        """
+        return self.requested_frames - self.received_frames
+
+    @property
+    def mean_queue_depth(self) -> float:
+        """The mean number of received frames that were waiting for the consumer when it asked for the next item"""
+        if self.yielded_items == 0:
+            return 0.0
+        return self.queue_depth_sum / self.yielded_items
+
+    def __repr__(self) -> str:
+        return (
+            f"StreamStatistics(requested_frames={self.requested_frames}, received_frames={self.received_frames}, "
+            f"received_bytes={self.received_bytes}, yielded_items={self.yielded_items}, "
+            f"empty_tiles={self.empty_tiles}, max_pending_requests={self.max_pending_requests}, "
+            f"max_pending_decodes={self.max_pending_decodes}, "
+            f"mean_queue_depth={self.mean_queue_depth:.2f}, max_queue_depth={self.max_queue_depth}, "
+            f"network_wait_seconds={self.network_wait_seconds:.3f}, "
+            f"decode_wait_seconds={self.decode_wait_seconds:.3f})"
+        )
+
+
+# pylint: disable=too-many-arguments,too-many-positional-arguments
+async def websocket_frame_stream(
+    websocket: websockets.asyncio.client.ClientConnection,
+    decode: Callable[[bytes], T | None],
+    prefetch: int = DEFAULT_PREFETCH,
+    decoders: int = DEFAULT_DECODERS,
+    statistics: StreamStatistics | None = None,
+) -> AsyncIterator[T]:
+    """
+    Request frames from a Geo Engine websocket stream and decode them in a pipeline.
+
+    Up to `prefetch` frames are requested (by sending `NEXT`) before they are consumed and
+    up to `decoders` frames are decoded concurrently in the decode executor.
+    The decoded items are yielded in the order of the frames.
+    """
+
+    prefetch = max(1, prefetch)
+    statistics = statistics if statistics is not None else StreamStatistics()
+
+    # holds the decoding tasks in the order of the frames
+    queue: asyncio.Queue = asyncio.Queue(maxsize=prefetch)
+    decode_slots = asyncio.Semaphore(max(1, decoders))
+    pending_decodes = 0
+    # The flow control counts the requests of this connection only, since the statistics may be shared
+    # with other connections (e.g., of parallel or resumed streams).
+    pending_requests = 0
+
+    async def request_frame() -> bool:
+        nonlocal pending_requests
+        try:
+            await websocket.send("NEXT")
+        except websockets.exceptions.ConnectionClosed:
+            # the websocket connection is already closed, we cannot read anymore
+            return False
+
+        pending_requests += 1
+        statistics.requested_frames += 1
+        statistics.max_pending_requests = max(statistics.max_pending_requests, pending_requests)
+        return True
+
+    async def decode_frame(frame: bytes) -> T | None:
+        nonlocal pending_decodes
+        async with decode_slots:
+            pending_decodes += 1
+            statistics.max_pending_decodes = max(statistics.max_pending_decodes, pending_decodes)
+            try:
+                return await run_in_decode_executor(decode, frame)
+            finally:
+                pending_decodes -= 1
+
+    async def read_frames() -> None:
+        nonlocal pending_requests
+
+        for _ in range(prefetch):
+            if not await request_frame():
+                break
+
+        # Do not check the connection state here, since the server may close the connection
+        # while there are still prefetched frames in the receive buffer.
+        while True:
+            try:
+                data: str | bytes = await websocket.recv()
+            except websockets.exceptions.ConnectionClosedOK:
+                # the websocket connection closed gracefully, so we stop reading
+                break
+
+            if isinstance(data, str):
+                # the server sent an error message
+                raise GeoEngineException({"error": data})
+
+            pending_requests -= 1
+            statistics.received_frames += 1
+            statistics.received_bytes += len(data)
+
+            # the queue is bounded, so a slow consumer stops the requesting of new frames
+            await queue.put(asyncio.ensure_future(decode_frame(data)))
+            statistics.max_queue_depth = max(statistics.max_queue_depth, queue.qsize())
+
+            if pending_requests < prefetch:
+                await request_frame()
+
+    async def reader_task() -> None:
+        try:
+            await read_frames()
+        except Exception as e:  # pylint: disable=broad-exception-caught
+            await queue.put(_StreamError(e))
+            return
+        await queue.put(_StreamEnd())
+
+    reader = asyncio.create_task(reader_task())
+
+    try:
+        while True:
+            statistics.queue_depth_sum += queue.qsize()
+
+            wait_start = time.perf_counter()
+            item = await queue.get()
+            statistics.network_wait_seconds += time.perf_counter() - wait_start
+
+            if isinstance(item, _StreamEnd):
+                break
+            if isinstance(item, _StreamError):
+                raise item.exception
+
+            wait_start = time.perf_counter()
+            decoded = await item
+            statistics.decode_wait_seconds += time.perf_counter() - wait_start
+
+            if decoded is None:
+                continue
+
+            statistics.yielded_items += 1
+            yield decoded
+    finally:
+        await _cancel_all([reader])
+
+        # do not leave decoding tasks behind
+        pending: list[asyncio.Future] = []
+        while not queue.empty():
+            item = queue.get_nowait()
+            if isinstance(item, asyncio.Future):
+                pending.append(item)
+        await _cancel_all(pending)
+
+
+async def _pump(stream: AsyncIterator[T], queue: asyncio.Queue) -> None:
+    """Read a stream into a queue and mark its end (or failure)"""
+    try:
+        async for item in stream:
+            await queue.put(item)
+    except Exception as e:  # pylint: disable=broad-exception-caught
+        await queue.put(_StreamError(e))
+        return
+    finally:
+        # close the stream (and e.g. its connection) on cancellation
+        aclose = getattr(stream, "aclose", None)
+        if aclose is not None:
+            await aclose()
+    await queue.put(_StreamEnd())
+
+
+async def _cancel_all(tasks: Sequence[asyncio.Future]) -> None:
+    """Cancel all tasks and wait until they are finished"""
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+
+
+async def merge_streams_as_completed(
+    streams: list[AsyncIterator[T]], buffer_size: int = DEFAULT_MERGE_BUFFER_SIZE
+) -> AsyncIterator[T]:
+    """
+    Consume all streams concurrently and yield their items as soon as they arrive.
+
+    At most `buffer_size` items are read ahead per stream.
+    """
+
+    queue: asyncio.Queue = asyncio.Queue(maxsize=max(1, buffer_size * len(streams)))
+    tasks = [asyncio.create_task(_pump(stream, queue)) for stream in streams]
+
+    try:
+        remaining = len(tasks)
+        while remaining > 0:
+            item = await queue.get()
+
+            if isinstance(item, _StreamEnd):
+                remaining -= 1
+                continue
+            if isinstance(item, _StreamError):
+                raise item.exception
+
+            yield item
+    finally:
+        await _cancel_all(tasks)
+
+
+async def merge_streams_ordered(
+    streams: list[AsyncIterator[T]],
+    key: Callable[[T], Any],
+    buffer_size: int = DEFAULT_MERGE_BUFFER_SIZE,
+) -> AsyncIterator[T]:
+    """
+    Consume all streams concurrently and yield their items ordered by `key`.
+
+    Each stream must already be sorted by `key`.
+    Items with equal keys are yielded in the order of the streams.
+    At most `buffer_size` items are read ahead per stream.
+    """
+
+    queues: list[asyncio.Queue] = [asyncio.Queue(maxsize=max(1, buffer_size)) for _ in streams]
+    tasks = [asyncio.create_task(_pump(stream, queue)) for stream, queue in zip(streams, queues, strict=True)]
+
+    async def next_item(queue: asyncio.Queue) -> Any:
+        item = await queue.get()
+        if isinstance(item, _StreamError):
+            raise item.exception
+        return item
+
+    try:
+        heads = [await next_item(queue) for queue in queues]
+
+        while True:
+            keys = [key(head) for head in heads if not isinstance(head, _StreamEnd)]
+            if len(keys) == 0:
+                break
+
+            current_key = min(keys)
+
+            for i, queue in enumerate(queues):
+                while not isinstance(heads[i], _StreamEnd) and key(heads[i]) == current_key:
+                    yield heads[i]
+                    heads[i] = await next_item(queue)
+    finally:
+        await _cancel_all(tasks)
+
+
+def iterate_in_background(
+    open_stream: Callable[[], AsyncIterator[T]], buffer_size: int = DEFAULT_PREFETCH
+) -> Iterator[T]:
+    """
+    Iterate over an asynchronous stream from synchronous code.
+
+    The stream runs on an event loop in a background thread, so that it keeps receiving and decoding
+    up to `buffer_size` items while the consumer processes the previous ones.
+    This also works while another event loop is running in the calling thread, e.g., in Jupyter.
+    Closing the iterator (e.g., by breaking out of a `for` loop) closes the stream.
+    """
+
+    loop = asyncio.new_event_loop()
+    thread = threading.Thread(target=loop.run_forever, name="geoengine-stream", daemon=True)
+    thread.start()
+
+    async def start() -> tuple[asyncio.Queue, asyncio.Future]:
+        queue: asyncio.Queue = asyncio.Queue(maxsize=buffer_size)
+        return (queue, asyncio.ensure_future(_pump(open_stream(), queue)))
+
+    try:
+        (queue, pump) = asyncio.run_coroutine_threadsafe(start(), loop).result()
+
+        try:
+            while True:
+                item = asyncio.run_coroutine_threadsafe(queue.get(), loop).result()
+
+                if isinstance(item, _StreamEnd):
+                    return
+                if isinstance(item, _StreamError):
+                    raise item.exception
+
+                yield item
+        finally:
+            asyncio.run_coroutine_threadsafe(_cancel_all([pump]), loop).result()
+    finally:
+        asyncio.run_coroutine_threadsafe(loop.shutdown_asyncgens(), loop).result()
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join()
+        loop.close()
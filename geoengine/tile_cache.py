@@ -0,0 +1,524 @@
+"""
+A persistent local cache for the tiles of raster streams.
+
+The cache stores the raw Arrow IPC frames of the tiles in a SQLite database.
+It records which cells of the tile grid are complete for a query time interval,
+so that a stream only has to query the cells that are missing.
+The database is shared safely between processes and evicts the least recently used tiles beyond its size limit.
+A stream pins the cached tiles that it has yet to read, and if another process evicts one of them anyway,
+the stream queries its cell from the server again.
+"""
+
+from __future__ import annotations
+
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import Counter
+from collections.abc import AsyncIterator, Awaitable, Callable
+from pathlib import Path
+
+import geoengine.types as gety
+from geoengine import backports
+from geoengine.error import TileCacheEvictedException
+from geoengine.raster import RasterTile2D
+from geoengine.streaming import merge_streams_ordered
+from geoengine.tiling import DEFAULT_TILE_SIZE, TileGrid
+
+DEFAULT_CACHE_SIZE = 1024**3
+
+# x_min, y_max, x_pixel_size, y_pixel_size, time_start, time_end
+TileKey = tuple[float, float, float, float, int, int]
+# workflow_id, band, tile key
+_PinKey = tuple[str, int, TileKey]
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS tiles (
+    workflow_id TEXT NOT NULL,
+    x_min REAL NOT NULL,
+    y_max REAL NOT NULL,
+    x_pixel_size REAL NOT NULL,
+    y_pixel_size REAL NOT NULL,
+    time_start INTEGER NOT NULL,
+    time_end INTEGER NOT NULL,
+    band INTEGER NOT NULL,
+    frame BLOB NOT NULL,
+    size INTEGER NOT NULL,
+    last_access REAL NOT NULL,
+    PRIMARY KEY (workflow_id, x_min, y_max, x_pixel_size, y_pixel_size, time_start, time_end, band)
+);
+
+CREATE INDEX IF NOT EXISTS tiles_last_access ON tiles (last_access);
+
+CREATE TABLE IF NOT EXISTS coverage (
+    workflow_id TEXT NOT NULL,
+    tile_size_x INTEGER NOT NULL,
+    tile_size_y INTEGER NOT NULL,
+    cell_x INTEGER NOT NULL,
+    cell_y INTEGER NOT NULL,
+    band INTEGER NOT NULL,
+    query_time TEXT NOT NULL,
+    tile_keys TEXT NOT NULL,
+    PRIMARY KEY (workflow_id, tile_size_x, tile_size_y, cell_x, cell_y, band, query_time)
+);
+
+CREATE TABLE IF NOT EXISTS total_size (
+    id INTEGER PRIMARY KEY CHECK (id = 0),
+    size INTEGER NOT NULL
+);
+
+INSERT OR IGNORE INTO total_size (id, size) VALUES (0, 0);
+
+CREATE TRIGGER IF NOT EXISTS tiles_insert AFTER INSERT ON tiles BEGIN
+    UPDATE total_size SET size = size + NEW.size WHERE id = 0;
+END;
+
+CREATE TRIGGER IF NOT EXISTS tiles_delete AFTER DELETE ON tiles BEGIN
+    UPDATE total_size SET size = size - OLD.size WHERE id = 0;
+END;
+"""
+
+
+class TileCache:
+    """
+    An on-disk cache of raster stream tiles, keyed by workflow, tile geo transform, time interval and band.
+
+    Pass it to `Workflow.raster_stream` to serve cached tiles without querying the server.
+    The `tile_size` (in pixels) must match the tiling of the Geo Engine instance.
+    """
+
+    path: Path
+    max_size: int
+    tile_size: int | tuple[int, int]
+
+    def __init__(
+        self,
+        path: str | os.PathLike,
+        max_size: int = DEFAULT_CACHE_SIZE,
+        tile_size: int | tuple[int, int] = DEFAULT_TILE_SIZE,
+    ) -> None:
+        """Open (or create) the cache database at `path` that holds at most `max_size` bytes of tiles"""
+
+        self.path = Path(path)
+        self.max_size = max_size
+        self.tile_size = tile_size
+
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+
+        self.__lock = threading.Lock()
+        # the tiles that streams of this cache still have to read, which are never evicted by this cache
+        self.__pinned: Counter[_PinKey] = Counter()
+        # transactions are managed explicitly, the timeout waits for other processes' write locks
+        self.__connection = sqlite3.connect(self.path, timeout=60, isolation_level=None, check_same_thread=False)
+
+        with self.__lock:
+            self.__connection.execute("PRAGMA journal_mode=WAL")
+            self.__connection.executescript(_SCHEMA)
+
+    def close(self) -> None:
+        """Close the cache database"""
+        with self.__lock:
+            self.__connection.close()
+
+    @property
+    def size(self) -> int:
+        """The total size of all cached tile frames in bytes"""
+        with self.__lock:
+            (size,) = self.__connection.execute("SELECT size FROM total_size WHERE id = 0").fetchone()
+        return size
+
+    def clear(self) -> None:
+        """Remove all tiles from the cache"""
+        with self.__lock, self.__transaction():
+            self.__connection.execute("DELETE FROM coverage")
+            self.__connection.execute("DELETE FROM tiles")
+
+    def put_tile(self, workflow_id: str, tile: RasterTile2D, frame: bytes) -> TileKey:
+        """Store the frame of a tile and evict the least recently used tiles if the cache is too large"""
+
+        key = tile_key(tile)
+
+        if len(frame) > self.max_size:
+            return key
+
+        with self.__lock, self.__transaction():
+            # delete and insert instead of replace, so that the size triggers fire
+            self.__connection.execute(
+                """
+                DELETE FROM tiles WHERE workflow_id = ? AND x_min = ? AND y_max = ? AND x_pixel_size = ?
+                    AND y_pixel_size = ? AND time_start = ? AND time_end = ? AND band = ?
+                """,
+                (workflow_id, *key, tile.band),
+            )
+            self.__connection.execute(
+                "INSERT INTO tiles VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (workflow_id, *key, tile.band, frame, len(frame), time.time()),
+            )
+            self.__evict()
+
+        return key
+
+    def pin(self, workflow_id: str, keys: list[tuple[int, TileKey]]) -> None:
+        """
+        Protect the (band, key) tiles from being evicted by this cache until they are unpinned.
+        Other processes can still evict them.
+        """
+
+        with self.__lock:
+            self.__pinned.update((workflow_id, band, key) for band, key in keys)
+
+    def unpin(self, workflow_id: str, keys: list[tuple[int, TileKey]]) -> None:
+        """Allow the (band, key) tiles to be evicted again"""
+
+        with self.__lock:
+            self.__pinned.subtract((workflow_id, band, key) for band, key in keys)
+            self.__pinned = +self.__pinned
+
+    def get_frame(self, workflow_id: str, key: TileKey, band: int) -> bytes | None:
+        """Return the frame of a tile, if it is cached"""
+
+        with self.__lock:
+            row = self.__connection.execute(
+                """
+                SELECT frame FROM tiles WHERE workflow_id = ? AND x_min = ? AND y_max = ? AND x_pixel_size = ?
+                    AND y_pixel_size = ? AND time_start = ? AND time_end = ? AND band = ?
+                """,
+                (workflow_id, *key, band),
+            ).fetchone()
+
+        return None if row is None else row[0]
+
+    # pylint: disable=too-many-arguments,too-many-positional-arguments
+    def put_coverage(
+        self,
+        workflow_id: str,
+        tile_grid: TileGrid,
+        cell: gety.GridIdx2D,
+        band: int,
+        query_time: str,
+        keys: list[TileKey],
+    ) -> None:
+        """Record that `keys` are all tiles of a cell and band for the query time interval"""
+
+        with self.__lock, self.__transaction():
+            self.__connection.execute(
+                "INSERT OR REPLACE INTO coverage VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    workflow_id,
+                    tile_grid.tile_size_x,
+                    tile_grid.tile_size_y,
+                    cell.x_idx,
+                    cell.y_idx,
+                    band,
+                    query_time,
+                    json.dumps(keys),
+                ),
+            )
+
+    # pylint: disable=too-many-arguments,too-many-positional-arguments
+    def get_coverage(
+        self, workflow_id: str, tile_grid: TileGrid, cell: gety.GridIdx2D, band: int, query_time: str
+    ) -> list[TileKey] | None:
+        """
+        Return the keys of all tiles of a cell and band for the query time interval,
+        if the cell is completely cached.
+
+        The tiles are marked as recently used, so that they are not evicted before they are read.
+        """
+
+        with self.__lock, self.__transaction():
+            row = self.__connection.execute(
+                """
+                SELECT tile_keys FROM coverage WHERE workflow_id = ? AND tile_size_x = ? AND tile_size_y = ?
+                    AND cell_x = ? AND cell_y = ? AND band = ? AND query_time = ?
+                """,
+                (workflow_id, tile_grid.tile_size_x, tile_grid.tile_size_y, cell.x_idx, cell.y_idx, band, query_time),
+            ).fetchone()
+
+            if row is None:
+                return None
+
+            keys: list[TileKey] = [tuple(key) for key in json.loads(row[0])]  # type: ignore[misc]
+
+            now = time.time()
+            for key in keys:
+                updated = self.__connection.execute(
+                    """
+                    UPDATE tiles SET last_access = ? WHERE workflow_id = ? AND x_min = ? AND y_max = ?
+                        AND x_pixel_size = ? AND y_pixel_size = ? AND time_start = ? AND time_end = ? AND band = ?
+                    """,
+                    (now, workflow_id, *key, band),
+                ).rowcount
+
+                if updated == 0:
+                    # a tile of the cell was evicted
+                    self.__connection.execute(
+                        """
+                        DELETE FROM coverage WHERE workflow_id = ? AND tile_size_x = ? AND tile_size_y = ?
+                            AND cell_x = ? AND cell_y = ? AND band = ? AND query_time = ?
+                        """,
+                        (
+                            workflow_id,
+                            tile_grid.tile_size_x,
+                            tile_grid.tile_size_y,
+                            cell.x_idx,
+                            cell.y_idx,
+                            band,
+                            query_time,
+                        ),
+                    )
+                    return None
+
+        return keys
+
+    def __evict(self) -> None:
+        """
+        Delete the least recently used tiles until the cache fits its size limit.
+        Pinned tiles are skipped, so the cache may exceed its limit while they are pinned.
+        """
+
+        (size,) = self.__connection.execute("SELECT size FROM total_size WHERE id = 0").fetchone()
+        if size <= self.max_size:
+            return
+
+        excess = size - self.max_size
+        rowids = []
+        for rowid, tile_size, workflow_id, band, *key in self.__connection.execute(
+            """
+            SELECT rowid, size, workflow_id, band, x_min, y_max, x_pixel_size, y_pixel_size, time_start, time_end
+            FROM tiles ORDER BY last_access
+            """
+        ):
+            if (workflow_id, band, tuple(key)) in self.__pinned:
+                continue
+            rowids.append(rowid)
+            excess -= tile_size
+            if excess <= 0:
+                break
+
+        self.__connection.executemany("DELETE FROM tiles WHERE rowid = ?", [(rowid,) for rowid in rowids])
+
+    def __transaction(self) -> _Transaction:
+        return _Transaction(self.__connection)
+
+
+class _Transaction:
+    """An immediate transaction, so that concurrent writers wait for each other instead of failing"""
+
+    def __init__(self, connection: sqlite3.Connection) -> None:
+        self.__connection = connection
+
+    def __enter__(self) -> None:
+        self.__connection.execute("BEGIN IMMEDIATE")
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        self.__connection.execute("COMMIT" if exc_type is None else "ROLLBACK")
+
+
+def tile_key(tile: RasterTile2D) -> TileKey:
+    """The cache key of a tile without its workflow and band"""
+    return (
+        tile.geo_transform.x_min,
+        tile.geo_transform.y_max,
+        tile.geo_transform.x_pixel_size,
+        tile.geo_transform.y_pixel_size,
+        int(tile.time.start.astype("datetime64[ms]").astype(int)),
+        int(tile.time.end.astype("datetime64[ms]").astype(int)) if tile.time.end is not None else 0,
+    )
+
+
+# pylint: disable=too-many-arguments,too-many-positional-arguments,too-many-locals
+async def cached_raster_stream(
+    cache: TileCache,
+    workflow_id: str,
+    tile_grid: TileGrid,
+    query_rectangle: gety.RasterQueryRectangle,
+    server_stream: Callable[[gety.RasterQueryRectangle], AsyncIterator[tuple[bytes, RasterTile2D]]],
+    decode: Callable[[bytes], Awaitable[RasterTile2D | None]],
+) -> AsyncIterator[RasterTile2D]:
+    """
+    Stream the tiles of a query rectangle from the cache and query the server only for the missing cells.
+
+    `server_stream` streams the (frame, tile) pairs of a query rectangle from the server
+    and `decode` decodes a cached frame.
+    The tiles are yielded in the order of the server, i.e., ordered by time, then by tile (row-major)
+    and then by band.
+    The cached tiles are pinned while the stream runs, so that the tiles that are fetched from the server
+    do not evict them before they are read.
+    """
+
+    query_time = query_rectangle.time_str
+    bands = query_rectangle.raster_bands
+    band_order = {band: i for i, band in enumerate(bands)}
+
+    cells = tile_grid.intersecting_tiles(query_rectangle.spatial_bounds)
+
+    cached: dict[tuple[int, int], list[tuple[int, TileKey]]] = {}
+    missing: list[gety.GridIdx2D] = []
+
+    for y_idx in range(cells.top_left_idx.y_idx, cells.bottom_right_idx.y_idx + 1):
+        for x_idx in range(cells.top_left_idx.x_idx, cells.bottom_right_idx.x_idx + 1):
+            cell = gety.GridIdx2D(x_idx=x_idx, y_idx=y_idx)
+            cell_keys: list[tuple[int, TileKey]] = []
+            for band in bands:
+                keys = await backports.to_thread(cache.get_coverage, workflow_id, tile_grid, cell, band, query_time)
+                if keys is None:
+                    missing.append(cell)
+                    break
+                cell_keys.extend((band, key) for key in keys)
+            else:
+                cached[(x_idx, y_idx)] = cell_keys
+
+    streams: list[AsyncIterator[RasterTile2D]] = []
+
+    if missing:
+        # query the bounding box of the missing cells and take all of its cells from the server
+        missing_cells = gety.GridBoundingBox2D(
+            gety.GridIdx2D(x_idx=min(c.x_idx for c in missing), y_idx=min(c.y_idx for c in missing)),
+            gety.GridIdx2D(x_idx=max(c.x_idx for c in missing), y_idx=max(c.y_idx for c in missing)),
+        )
+        cached = {
+            cell: keys
+            for cell, keys in cached.items()
+            if not missing_cells.contains_idx(gety.GridIdx2D(x_idx=cell[0], y_idx=cell[1]))
+        }
+
+        streams.append(
+            _caching_server_stream(cache, workflow_id, tile_grid, query_rectangle, missing_cells, server_stream)
+        )
+
+    # yield the cached tiles in the order of the server
+    cached_keys = sorted(
+        (key for keys in cached.values() for key in keys),
+        key=lambda band_key: (band_key[1][4], -band_key[1][1], band_key[1][0], band_order[band_key[0]]),
+    )
+    if cached_keys:
+        streams.append(
+            _cached_stream(cache, workflow_id, tile_grid, query_rectangle, cached_keys, server_stream, decode)
+        )
+
+    cache.pin(workflow_id, cached_keys)
+    try:
+        if len(streams) == 1:
+            async for tile in streams[0]:
+                yield tile
+            return
+
+        async for tile in merge_streams_ordered(
+            streams,
+            key=lambda tile: (
+                tile.time.start,
+                -tile.geo_transform.y_max,
+                tile.geo_transform.x_min,
+                band_order[tile.band],
+            ),
+        ):
+            yield tile
+    finally:
+        cache.unpin(workflow_id, cached_keys)
+
+
+# pylint: disable=too-many-arguments,too-many-positional-arguments
+async def _cached_stream(
+    cache: TileCache,
+    workflow_id: str,
+    tile_grid: TileGrid,
+    query_rectangle: gety.RasterQueryRectangle,
+    keys: list[tuple[int, TileKey]],
+    server_stream: Callable[[gety.RasterQueryRectangle], AsyncIterator[tuple[bytes, RasterTile2D]]],
+    decode: Callable[[bytes], Awaitable[RasterTile2D | None]],
+) -> AsyncIterator[RasterTile2D]:
+    """
+    Stream cached tiles.
+    If another process evicted a tile, the band of its cell is queried from the server again.
+    """
+
+    # the frames of the cells that were queried again, by band and key
+    refetched: dict[tuple[int, TileKey], bytes] = {}
+
+    for band, key in keys:
+        frame = refetched.pop((band, key), None)
+        if frame is None:
+            frame = await backports.to_thread(cache.get_frame, workflow_id, key, band)
+
+        if frame is None:
+            cell = tile_grid.tile_idx_of_tile(gety.GeoTransform(key[0], key[1], key[2], key[3]))
+            cell_query = _cells_query(
+                tile_grid, query_rectangle, gety.GridBoundingBox2D(cell, cell), raster_bands=[band]
+            )
+            async for server_frame, server_tile in server_stream(cell_query):
+                if tile_grid.tile_idx_of_raster_tile(server_tile) == cell:
+                    refetched[(server_tile.band, tile_key(server_tile))] = server_frame
+
+            frame = refetched.pop((band, key), None)
+            if frame is None:
+                raise TileCacheEvictedException()
+
+        tile = await decode(frame)
+        if tile is not None:
+            yield tile
+
+
+def _cells_query(
+    tile_grid: TileGrid,
+    query_rectangle: gety.RasterQueryRectangle,
+    cells: gety.GridBoundingBox2D,
+    raster_bands: list[int] | None = None,
+) -> gety.RasterQueryRectangle:
+    """The part of a query rectangle that lies in some cells, optionally for other bands"""
+
+    cells_bounds = tile_grid.tile_bounds(cells)
+    spatial_bounds = query_rectangle.spatial_bounds
+    return gety.RasterQueryRectangle(
+        gety.BoundingBox2D(
+            max(cells_bounds.xmin, spatial_bounds.xmin),
+            max(cells_bounds.ymin, spatial_bounds.ymin),
+            min(cells_bounds.xmax, spatial_bounds.xmax),
+            min(cells_bounds.ymax, spatial_bounds.ymax),
+        ),
+        query_rectangle.time,
+        query_rectangle.raster_bands if raster_bands is None else raster_bands,
+        query_rectangle.srs,
+    )
+
+
+# pylint: disable=too-many-arguments,too-many-positional-arguments
+async def _caching_server_stream(
+    cache: TileCache,
+    workflow_id: str,
+    tile_grid: TileGrid,
+    query_rectangle: gety.RasterQueryRectangle,
+    cells: gety.GridBoundingBox2D,
+    server_stream: Callable[[gety.RasterQueryRectangle], AsyncIterator[tuple[bytes, RasterTile2D]]],
+) -> AsyncIterator[RasterTile2D]:
+    """Stream the tiles of some cells from the server, store them in the cache and record the complete cells"""
+
+    cells_query = _cells_query(tile_grid, query_rectangle, cells)
+
+    keys: dict[tuple[int, int, int], list[TileKey]] = {}
+
+    async for frame, tile in server_stream(cells_query):
+        cell = tile_grid.tile_idx_of_raster_tile(tile)
+        if not cells.contains_idx(cell):
+            continue
+
+        key = await backports.to_thread(cache.put_tile, workflow_id, tile, frame)
+        keys.setdefault((cell.x_idx, cell.y_idx, tile.band), []).append(key)
+
+        yield tile
+
+    # the stream is complete, so the cells can be served from the cache from now on
+    for y_idx in range(cells.top_left_idx.y_idx, cells.bottom_right_idx.y_idx + 1):
+        for x_idx in range(cells.top_left_idx.x_idx, cells.bottom_right_idx.x_idx + 1):
+            for band in query_rectangle.raster_bands:
+                await backports.to_thread(
+                    cache.put_coverage,
+                    workflow_id,
+                    tile_grid,
+                    gety.GridIdx2D(x_idx=x_idx, y_idx=y_idx),
+                    band,
+                    query_rectangle.time_str,
+                    keys.get((x_idx, y_idx, band), []),
+                )
@@ -0,0 +1,147 @@
+"""The tile grid of raster results and how queries are split along it"""
+
+from __future__ import annotations
+
+import math
+
+import numpy as np
+
+from geoengine.raster import RasterTile2D
+from geoengine.types import (
+    BoundingBox2D,
+    GeoTransform,
+    GridBoundingBox2D,
+    GridIdx2D,
+    RasterQueryRectangle,
+    SpatialPartition2D,
+)
+
+DEFAULT_TILE_SIZE = 512
+
+# tolerance (in tiles) for floating point noise when converting coordinates to tile indices
+_TILE_EPSILON = 1e-9
+
+
+class TileGrid:
+    """
+    The grid of tiles that the Geo Engine splits a raster result into.
+
+    The tiles are aligned to the origin of the result's geo transform and have a fixed size in pixels.
+    """
+
+    geo_transform: GeoTransform
+    tile_size_x: int
+    tile_size_y: int
+
+    def __init__(self, geo_transform: GeoTransform, tile_size: int | tuple[int, int] = DEFAULT_TILE_SIZE) -> None:
+        """Create a tile grid from a geo transform and a tile size in pixels (either `size` or `(size_y, size_x)`)"""
+        if isinstance(tile_size, int):
+            tile_size = (tile_size, tile_size)
+
+        self.geo_transform = geo_transform
+        (self.tile_size_y, self.tile_size_x) = tile_size
+
+    @property
+    def tile_width(self) -> float:
+        """The width of a tile in coordinate units"""
+        return self.geo_transform.x_pixel_size * self.tile_size_x
+
+    @property
+    def tile_height(self) -> float:
+        """The (positive) height of a tile in coordinate units"""
+        return -self.geo_transform.y_pixel_size * self.tile_size_y
+
+    def tile_idx_of_coord(self, x_coord: float, y_coord: float) -> GridIdx2D:
+        """Return the index of the tile that contains the coordinate"""
+        return GridIdx2D(
+            x_idx=math.floor((x_coord - self.geo_transform.x_min) / self.tile_width + _TILE_EPSILON),
+            y_idx=math.floor((self.geo_transform.y_max - y_coord) / self.tile_height + _TILE_EPSILON),
+        )
+
+    def tile_idx_of_tile(self, tile_geo_transform: GeoTransform) -> GridIdx2D:
+        """Return the index of a tile given its own geo transform, i.e., its upper left corner"""
+        return GridIdx2D(
+            x_idx=round((tile_geo_transform.x_min - self.geo_transform.x_min) / self.tile_width),
+            y_idx=round((self.geo_transform.y_max - tile_geo_transform.y_max) / self.tile_height),
+        )
+
+    def tile_idx_of_raster_tile(self, tile: RasterTile2D) -> GridIdx2D:
+        """Return the index of a tile, from its grid index if it was decoded with one"""
+        if tile.pixel_idx is None:
+            return self.tile_idx_of_tile(tile.geo_transform)
+        return GridIdx2D(
+            x_idx=tile.pixel_idx.x_idx // self.tile_size_x,
+            y_idx=tile.pixel_idx.y_idx // self.tile_size_y,
+        )
+
+    def tile_bounds(self, tile_bounds: GridBoundingBox2D) -> SpatialPartition2D:
+        """Return the spatial bounds of a (inclusive) range of tiles"""
+        x_min = self.geo_transform.x_min + tile_bounds.top_left_idx.x_idx * self.tile_width
+        x_max = self.geo_transform.x_min + (tile_bounds.bottom_right_idx.x_idx + 1) * self.tile_width
+        y_max = self.geo_transform.y_max - tile_bounds.top_left_idx.y_idx * self.tile_height
+        y_min = self.geo_transform.y_max - (tile_bounds.bottom_right_idx.y_idx + 1) * self.tile_height
+        return SpatialPartition2D(x_min, y_min, x_max, y_max)
+
+    def intersecting_tiles(self, bounds: BoundingBox2D | SpatialPartition2D) -> GridBoundingBox2D:
+        """Return the (inclusive) range of tiles that intersect the bounds"""
+        x_start = math.floor((bounds.xmin - self.geo_transform.x_min) / self.tile_width + _TILE_EPSILON)
+        x_end = math.ceil((bounds.xmax - self.geo_transform.x_min) / self.tile_width - _TILE_EPSILON) - 1
+        y_start = math.floor((self.geo_transform.y_max - bounds.ymax) / self.tile_height + _TILE_EPSILON)
+        y_end = math.ceil((self.geo_transform.y_max - bounds.ymin) / self.tile_height - _TILE_EPSILON) - 1
+
+        return GridBoundingBox2D(
+            top_left_idx=GridIdx2D(x_idx=x_start, y_idx=y_start),
+            bottom_right_idx=GridIdx2D(x_idx=max(x_start, x_end), y_idx=max(y_start, y_end)),
+        )
+
+    def partition(
+        self, query: RasterQueryRectangle, num_partitions: int
+    ) -> list[tuple[RasterQueryRectangle, GridBoundingBox2D]]:
+        """
+        Split a query into (at most) `num_partitions` tile-aligned sub-queries.
+
+        Returns each sub-query together with the range of tiles it is responsible for.
+        The sub-queries are ordered from top to bottom and then left to right.
+        """
+
+        tiles = self.intersecting_tiles(query.spatial_bounds)
+
+        num_rows = tiles.bottom_right_idx.y_idx - tiles.top_left_idx.y_idx + 1
+        num_cols = tiles.bottom_right_idx.x_idx - tiles.top_left_idx.x_idx + 1
+
+        partition_rows = max(1, min(num_partitions, num_rows))
+        partition_cols = max(1, min(num_partitions // partition_rows, num_cols))
+
+        row_chunks = np.array_split(
+            np.arange(tiles.top_left_idx.y_idx, tiles.bottom_right_idx.y_idx + 1), partition_rows
+        )
+        col_chunks = np.array_split(
+            np.arange(tiles.top_left_idx.x_idx, tiles.bottom_right_idx.x_idx + 1), partition_cols
+        )
+
+        query_bounds = query.spatial_bounds
+        partitions = []
+
+        for rows in row_chunks:
+            for cols in col_chunks:
+                tile_range = GridBoundingBox2D(
+                    top_left_idx=GridIdx2D(x_idx=int(cols[0]), y_idx=int(rows[0])),
+                    bottom_right_idx=GridIdx2D(x_idx=int(cols[-1]), y_idx=int(rows[-1])),
+                )
+                tile_range_bounds = self.tile_bounds(tile_range)
+
+                sub_query = RasterQueryRectangle(
+                    BoundingBox2D(
+                        max(query_bounds.xmin, tile_range_bounds.xmin),
+                        max(query_bounds.ymin, tile_range_bounds.ymin),
+                        min(query_bounds.xmax, tile_range_bounds.xmax),
+                        min(query_bounds.ymax, tile_range_bounds.ymax),
+                    ),
+                    query.time,
+                    query.raster_bands,
+                    query.srs,
+                )
+
+                partitions.append((sub_query, tile_range))
+
+        return partitions
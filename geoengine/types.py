@@ -965,6 +965,34 @@ class RegularTimeDimension(TimeDimension):
         step = TimeStep.from_response(actual.step)
         return RegularTimeDimension(step=step, origin=origin)
 
+    def num_time_steps(self, time_interval: TimeInterval) -> int:
+        """Return the number of time steps that intersect a time interval (at least one)"""
+
+        start = time_interval.start.astype("datetime64[ms]")
+        end = start if time_interval.end is None else time_interval.end.astype("datetime64[ms]")
+
+        if end <= start:
+            return 1
+
+        # the index of the time step that contains the last millisecond of the interval
+        return self.__step_idx(end - np.timedelta64(1, "ms")) - self.__step_idx(start) + 1
+
+    def __step_idx(self, time: np.datetime64) -> int:
+        """Return the index of the time step that contains `time`, relative to the origin"""
+
+        origin = self.origin.astype("datetime64[ms]")
+        granularity = TimeStepGranularity(self.step.granularity)
+
+        if granularity in (TimeStepGranularity.MONTHS, TimeStepGranularity.YEARS):
+            months_per_step = self.step.step * (12 if granularity == TimeStepGranularity.YEARS else 1)
+            origin_month = origin.astype("datetime64[M]")
+            # shift by the origin's offset into its month, so that steps start at the origin's day and time
+            month = (time - (origin - origin_month.astype("datetime64[ms]"))).astype("datetime64[M]")
+            return int((month - origin_month).astype(np.int64)) // months_per_step
+
+        step = np.timedelta64(self.step.step * _GRANULARITY_MILLIS[granularity], "ms")
+        return int((time - origin) // step)
+
 
 class IrregularTimeDimension(TimeDimension):
     """The irregular time dimension"""
@@ -1111,6 +1139,10 @@ class RasterResultDescriptor(ResultDescriptor):
     def geo_transform(self) -> GeoTransform:
         return self.spatial_grid.spatial_grid.geo_transform
 
+    @property
+    def time(self) -> TimeDescriptor:
+        return self.__time
+
     @property
     def spatial_reference(self) -> str:
         """Return the spatial reference"""
@@ -1259,6 +1291,15 @@ class TimeStepGranularity(Enum):
         return geoengine_openapi_client.TimeGranularity(self.value)
 
 
+_GRANULARITY_MILLIS = {
+    TimeStepGranularity.MILLIS: 1,
+    TimeStepGranularity.SECONDS: 1000,
+    TimeStepGranularity.MINUTES: 60 * 1000,
+    TimeStepGranularity.HOURS: 60 * 60 * 1000,
+    TimeStepGranularity.DAYS: 24 * 60 * 60 * 1000,
+}
+
+
 @dataclass
 class TimeStep:
     """A time step that consists of a granularity and a step size"""
@@ -1741,6 +1782,8 @@ class ClassificationMeasurement(Measurement):
 class GeoTransform:
     """The `GeoTransform` specifies the relationship between pixel coordinates and geographic coordinates."""
 
+    __slots__ = ("x_min", "y_max", "x_pixel_size", "y_pixel_size")
+
     x_min: float
     y_max: float
     """In Geo Engine, x_pixel_size is always positive."""
@@ -1836,6 +1879,16 @@ class GeoTransform:
         (x, y) = self.pixel_ul_to_coord(x_pixel, y_pixel)
         return (x + self.x_half_pixel_size, y + self.y_half_pixel_size)
 
+    def pixel_idx_of(self, other: GeoTransform) -> GridIdx2D:
+        """
+        Return the index of the pixel whose upper left corner is the origin of another geo transform.
+        The other geo transform must be aligned to the pixels of this one.
+        """
+        return GridIdx2D(
+            x_idx=round((other.x_min - self.x_min) / self.x_pixel_size),
+            y_idx=round((other.y_max - self.y_max) / self.y_pixel_size),
+        )
+
     def spatial_resolution(self) -> SpatialResolution:
         return SpatialResolution(x_resolution=abs(self.x_pixel_size), y_resolution=abs(self.y_pixel_size))
 
@@ -0,0 +1,159 @@
+"""
+Decoding of the geometries of vector results.
+
+The server encodes the geometries of a vector stream as WKT, WKB or native GeoArrow arrays.
+All encodings are decoded with shapely's vectorized constructors directly from the Arrow column,
+so that no Python object is created per feature before the geometry itself.
+The geometries of parsed GeoJSON features (e.g., of a WFS response) are decoded from their coordinates
+with the same constructors.
+"""
+
+from __future__ import annotations
+
+import itertools
+from enum import Enum
+from typing import Any
+
+import numpy as np
+import pyarrow as pa
+import shapely
+
+from geoengine.error import TypeException
+
+GEOARROW_EXTENSION_NAME_KEY = b"ARROW:extension:name"
+
+
+class GeometryEncoding(str, Enum):
+    """The encoding of the geometries in a vector stream"""
+
+    WKT = "wkt"
+    WKB = "wkb"
+    GEOARROW = "geoArrow"
+
+
+_GEOARROW_GEOMETRY_TYPES = {
+    "geoarrow.point": shapely.GeometryType.POINT,
+    "geoarrow.linestring": shapely.GeometryType.LINESTRING,
+    "geoarrow.polygon": shapely.GeometryType.POLYGON,
+    "geoarrow.multipoint": shapely.GeometryType.MULTIPOINT,
+    "geoarrow.multilinestring": shapely.GeometryType.MULTILINESTRING,
+    "geoarrow.multipolygon": shapely.GeometryType.MULTIPOLYGON,
+}
+
+# The Geo Engine only has multi geometries, so the nesting of an untagged native array determines its type
+_MULTI_GEOMETRY_TYPES_BY_DEPTH = {
+    1: shapely.GeometryType.MULTIPOINT,
+    2: shapely.GeometryType.MULTILINESTRING,
+    3: shapely.GeometryType.MULTIPOLYGON,
+}
+
+
+# the GeoJSON geometry types and the nesting depth of their coordinates
+_GEOJSON_GEOMETRY_TYPES = {
+    "Point": (shapely.GeometryType.POINT, 0),
+    "LineString": (shapely.GeometryType.LINESTRING, 1),
+    "Polygon": (shapely.GeometryType.POLYGON, 2),
+    "MultiPoint": (shapely.GeometryType.MULTIPOINT, 1),
+    "MultiLineString": (shapely.GeometryType.MULTILINESTRING, 2),
+    "MultiPolygon": (shapely.GeometryType.MULTIPOLYGON, 3),
+}
+
+
+def geometries_from_arrow(column: pa.Array | pa.ChunkedArray, field: pa.Field) -> np.ndarray:
+    """
+    Decode a geometry column into an array of shapely geometries.
+
+    The encoding is determined by the column type: strings are WKT, binaries are WKB,
+    and (nested) lists of coordinates are native GeoArrow arrays.
+    """
+
+    if pa.types.is_string(column.type) or pa.types.is_large_string(column.type):
+        return shapely.from_wkt(column.to_numpy(zero_copy_only=False))
+
+    if pa.types.is_binary(column.type) or pa.types.is_large_binary(column.type):
+        return shapely.from_wkb(column.to_numpy(zero_copy_only=False))
+
+    if isinstance(column, pa.ChunkedArray):
+        column = column.combine_chunks()
+
+    return _geometries_from_geoarrow(column, field)
+
+
+def _geometries_from_geoarrow(array: pa.Array, field: pa.Field) -> np.ndarray:
+    """Decode a native GeoArrow array into an array of shapely geometries"""
+
+    offsets: list[np.ndarray] = []
+    coordinates = array
+    while pa.types.is_list(coordinates.type) or pa.types.is_large_list(coordinates.type):
+        level_offsets = coordinates.offsets.to_numpy()
+        # the offsets of a sliced array do not start at zero, but its flattened values do
+        offsets.append(level_offsets - level_offsets[0])
+        coordinates = coordinates.flatten()
+
+    if pa.types.is_fixed_size_list(coordinates.type):
+        xy = coordinates.flatten().to_numpy().reshape(-1, coordinates.type.list_size)
+    elif pa.types.is_struct(coordinates.type):
+        xy = np.column_stack([dimension.to_numpy() for dimension in coordinates.flatten()])
+    else:
+        raise TypeException(f"Unsupported geometry column type: {array.type}")
+
+    geometry_type = _geoarrow_geometry_type(field, len(offsets))
+
+    # shapely expects the offsets from the innermost to the outermost level
+    geometries = shapely.from_ragged_array(geometry_type, xy, tuple(reversed(offsets)) if offsets else None)
+
+    if array.null_count > 0:
+        geometries[array.is_null().to_numpy(zero_copy_only=False)] = None
+
+    return geometries
+
+
+def _geoarrow_geometry_type(field: pa.Field, depth: int) -> shapely.GeometryType:
+    """Determine the geometry type of a native GeoArrow array from its extension name or its nesting"""
+
+    metadata = field.metadata or {}
+    extension_name = metadata.get(GEOARROW_EXTENSION_NAME_KEY)
+
+    if extension_name is not None and extension_name.decode("utf-8") in _GEOARROW_GEOMETRY_TYPES:
+        return _GEOARROW_GEOMETRY_TYPES[extension_name.decode("utf-8")]
+
+    if depth in _MULTI_GEOMETRY_TYPES_BY_DEPTH:
+        return _MULTI_GEOMETRY_TYPES_BY_DEPTH[depth]
+
+    raise TypeException(f"Unsupported geometry column type: {field.type}")
+
+
+def geometries_from_geojson(geometries: list[dict[str, Any] | None]) -> np.ndarray:
+    """
+    Decode parsed GeoJSON geometries (which may be `None`) into an array of shapely geometries.
+
+    If all geometries have the same type, their coordinates are flattened level by level into a ragged array,
+    so that no shapely object is created per part. Otherwise, they are decoded one by one.
+    """
+
+    present = [geometry for geometry in geometries if geometry is not None]
+    geometry_types = {geometry["type"] for geometry in present}
+
+    if len(geometry_types) != 1 or next(iter(geometry_types)) not in _GEOJSON_GEOMETRY_TYPES:
+        return np.array(
+            [None if geometry is None else shapely.geometry.shape(geometry) for geometry in geometries], dtype=object
+        )
+
+    (geometry_type, depth) = _GEOJSON_GEOMETRY_TYPES[next(iter(geometry_types))]
+
+    # the offsets of each nesting level, from the outermost to the innermost one
+    offsets: list[np.ndarray] = []
+    level: list[Any] = [geometry["coordinates"] for geometry in present]
+    for _ in range(depth):
+        offsets.append(np.concatenate([[0], np.cumsum([len(part) for part in level])]))
+        level = list(itertools.chain.from_iterable(level))
+
+    coordinates = np.array(level, dtype=np.float64).reshape(len(level), -1)
+    decoded = shapely.from_ragged_array(geometry_type, coordinates, tuple(reversed(offsets)) if offsets else None)
+
+    if len(present) == len(geometries):
+        return decoded
+
+    result = np.full(len(geometries), None, dtype=object)
+    result[[geometry is not None for geometry in geometries]] = decoded
+    return result
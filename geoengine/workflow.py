@@ -6,14 +6,15 @@ A workflow representation and methods on workflows
 
 from __future__ import annotations
 
-import asyncio
+import functools
+import itertools
 import json
 from collections import defaultdict
-from collections.abc import AsyncIterator
+from collections.abc import AsyncIterator, Callable, Iterator, Sequence
 from io import BytesIO
 from logging import debug
 from os import PathLike
-from typing import Any, TypedDict, cast
+from typing import Any, TypedDict, TypeVar, cast
 from uuid import UUID
 
 import geoengine_openapi_client as geoc
@@ -21,6 +22,7 @@ import geopandas as gpd
 import numpy as np
 import pandas as pd
 import pyarrow as pa
+import pyarrow.compute as pc
 import rasterio.io
 import requests as req
 import rioxarray
@@ -32,35 +34,84 @@ from owslib.wcs import WebCoverageService
 from PIL import Image
 from vega import VegaLite
 
-from geoengine import api, backports
+from geoengine import api
 from geoengine.auth import get_session
+from geoengine.decode_executor import run_in_decode_executor
 from geoengine.error import (
-    GeoEngineException,
     InputException,
     MethodNotCalledOnPlotException,
     MethodNotCalledOnRasterException,
     MethodNotCalledOnVectorException,
     OGCXMLError,
+    TypeException,
+)
+from geoengine.raster import RasterTile2D, raster_tile_schema
+from geoengine.raster_memmap import MemmapMosaicWriter, RasterMemmap
+from geoengine.raster_mosaic import (
+    MosaicGrid,
+    MosaicTimeStack,
+    RasterMosaic,
+    concatenate_time_chunks,
+    nan_masked,
+    raster_stream_into_mosaics,
+    time_chunked_data,
+)
+from geoengine.raster_points import PointIndex, PointValues, chain_streams, point_coordinates
+from geoengine.raster_statistics import (
+    DEFAULT_STATISTICS,
+    BandStatistics,
+    HistogramBins,
+    check_statistics,
+    statistics_to_xarray,
+    tile_band_statistics,
+)
+from geoengine.raster_zarr import ZarrRasterWriter, ZarrStore, raster_stream_into_zarr
+from geoengine.resumable import (
+    ReconnectPolicy,
+    decode_with_feature_keys,
+    resumable_feature_stream,
+    resumable_raster_stream,
+)
+from geoengine.streaming import (
+    DEFAULT_DECODERS,
+    DEFAULT_PREFETCH,
+    StreamStatistics,
+    iterate_in_background,
+    merge_streams_as_completed,
+    merge_streams_ordered,
+    websocket_frame_stream,
 )
-from geoengine.raster import RasterTile2D
 from geoengine.tasks import Task, TaskId
+from geoengine.tile_cache import TileCache, cached_raster_stream
+from geoengine.tiling import DEFAULT_TILE_SIZE, TileGrid
 from geoengine.types import (
     ClassificationMeasurement,
+    GeoTransform,
+    GridBoundingBox2D,
     ProvenanceEntry,
     QueryRectangle,
     RasterColorizer,
     RasterQueryRectangle,
     RasterResultDescriptor,
+    RegularTimeDimension,
     ResultDescriptor,
     SpatialPartition2D,
     SpatialResolution,
     VectorResultDescriptor,
 )
+from geoengine.util import clamp_datetime_ms_ns
+from geoengine.vector_geometry import GeometryEncoding, geometries_from_arrow, geometries_from_geojson
 from geoengine.workflow_builder.operators import Operator as WorkflowBuilderOperator
 
 # TODO: Define as recursive type when supported in mypy: https://github.com/python/mypy/issues/731
 JsonType = dict[str, Any] | list[Any] | int | str | float | bool | type[None]
 
+T = TypeVar("T")
+
+# the range of nanosecond timestamps in milliseconds (the minimum of int64 is NaT, so it is excluded)
+MIN_NANOSECOND_MS = np.iinfo(np.int64).min // 1_000_000 + 1
+MAX_NANOSECOND_MS = np.iinfo(np.int64).max // 1_000_000
+
 
 class Axis(TypedDict):
     title: str
@@ -149,26 +200,90 @@ class RasterStreamProcessing:
 
     @classmethod
     def read_arrow_ipc(cls, arrow_ipc: bytes) -> pa.RecordBatch:
-        """Read an Arrow IPC file from a byte array"""
+        """
+        Read an Arrow IPC file from a byte array.
 
-        reader = pa.ipc.open_file(arrow_ipc)
+        The record batch references the byte array's memory instead of copying it.
+        """
+
+        reader = pa.ipc.open_file(pa.py_buffer(arrow_ipc))
         # We know from the backend that there is only one record batch
         record_batch = reader.get_record_batch(0)
         return record_batch
 
     @classmethod
-    def process_bytes(cls, tile_bytes: bytes | None) -> RasterTile2D | None:
-        """Process a tile from a byte array"""
+    def process_bytes(
+        cls, tile_bytes: bytes | None, grid_geo_transform: GeoTransform | None = None
+    ) -> RasterTile2D | None:
+        """
+        Process a tile from a byte array.
+
+        If the geo transform of the result's spatial grid is given, the tile's grid index is computed.
+        """
 
         if tile_bytes is None:
             return None
 
         # process the received data
         record_batch = RasterStreamProcessing.read_arrow_ipc(tile_bytes)
-        tile = RasterTile2D.from_ge_record_batch(record_batch)
+        tile = RasterTile2D.from_ge_record_batch(record_batch, grid_geo_transform)
 
         return tile
 
+    @classmethod
+    def process_bytes_with_frame(
+        cls, tile_bytes: bytes | None, grid_geo_transform: GeoTransform | None = None
+    ) -> tuple[bytes, RasterTile2D] | None:
+        """Process a tile from a byte array and keep the byte array, e.g., for caching"""
+
+        tile = RasterStreamProcessing.process_bytes(tile_bytes, grid_geo_transform)
+
+        if tile_bytes is None or tile is None:
+            return None
+
+        return (tile_bytes, tile)
+
+    # pylint: disable=too-many-arguments,too-many-positional-arguments
+    @classmethod
+    def process_bytes_into_band_statistics(
+        cls,
+        tile_bytes: bytes | None,
+        grid_geo_transform: GeoTransform,
+        grid: MosaicGrid,
+        statistics: frozenset[str],
+        histogram_bins: HistogramBins | None,
+    ) -> tuple[np.datetime64, int, bool, BandStatistics | None] | None:
+        """
+        Reduce a tile from a byte array to the statistics of its pixels in a grid.
+        Also returns whether the tile is empty, so that the stream can count its empty tiles.
+        The statistics are `None` if the tile does not intersect the grid.
+        """
+
+        tile = RasterStreamProcessing.process_bytes(tile_bytes, grid_geo_transform)
+        if tile is None:
+            return None
+
+        return (
+            tile.time.start,
+            tile.band,
+            tile.is_empty(),
+            tile_band_statistics(tile, grid, statistics, histogram_bins),
+        )
+
+    @classmethod
+    async def count_empty_tiles(
+        cls, tiles: AsyncIterator[RasterTile2D], skip_empty: bool, statistics: StreamStatistics | None
+    ) -> AsyncIterator[RasterTile2D]:
+        """Count the empty tiles of a stream and optionally skip them"""
+
+        async for tile in tiles:
+            if tile.is_empty():
+                if statistics is not None:
+                    statistics.empty_tiles += 1
+                if skip_empty:
+                    continue
+            yield tile
+
     @classmethod
     def merge_tiles(cls, tiles: list[xr.DataArray]) -> xr.DataArray | None:
         """Merge a list of tiles into a single xarray"""
@@ -197,6 +312,209 @@ class RasterStreamProcessing:
         return combined_tile
 
 
+class VectorStreamProcessing:
+    """
+    Helper class to process vector stream data
+    """
+
+    @classmethod
+    def read_arrow_ipc(cls, arrow_ipc: bytes) -> pa.RecordBatch:
+        """Read an Arrow IPC file from a byte array"""
+
+        reader = pa.ipc.open_file(arrow_ipc)
+        # We know from the backend that there is only one record batch
+        record_batch = reader.get_record_batch(0)
+        return record_batch
+
+    @classmethod
+    def filter_features(cls, chunk: T, mask: np.ndarray) -> T:
+        """Select the features of a chunk (a record batch, a table or a data frame) by a boolean mask"""
+
+        if isinstance(chunk, pa.RecordBatch | pa.Table):
+            return cast(T, chunk.filter(pa.array(mask)))
+
+        if isinstance(chunk, pd.DataFrame):
+            return cast(T, chunk[mask].reset_index(drop=True))
+
+        raise TypeException(f"Cannot select the features of a {type(chunk).__name__}")
+
+    @classmethod
+    def concat_record_batches(cls, record_batches: list[pa.RecordBatch]) -> pa.Table:
+        """
+        Concatenate record batches into a table without copying their data.
+        Columns that are null in some batches take the type of the other batches.
+        """
+
+        return pa.concat_tables(
+            [pa.Table.from_batches([record_batch]) for record_batch in record_batches], promote_options="default"
+        )
+
+    @classmethod
+    def split_time_column(
+        cls,
+        record_batch: pa.RecordBatch | pa.Table,
+        time_start_column: str,
+        time_end_column: str,
+        clip_to_nanoseconds: bool = False,
+    ) -> pa.RecordBatch | pa.Table:
+        """
+        Replace the time column of a record batch (or a table of them) by a start and an end column
+        of UTC timestamps (in milliseconds).
+        The other columns and the schema metadata, e.g., the spatial reference, are kept.
+
+        If `clip_to_nanoseconds` is true, the instants are clipped to the range of nanosecond timestamps,
+        e.g., the beginning and end of time of the Geo Engine.
+        """
+
+        time_index = record_batch.schema.get_field_index(api.TIME_COLUMN_NAME)
+        time = record_batch.column(time_index)
+
+        # the time intervals are either structs or lists of their start and end
+        if pa.types.is_struct(time.type):
+            (time_start, time_end) = (pc.struct_field(time, [0]), pc.struct_field(time, [1]))
+        else:
+            (time_start, time_end) = (pc.list_element(time, 0), pc.list_element(time, 1))
+
+        if clip_to_nanoseconds:
+            (time_start, time_end) = (
+                pc.min_element_wise(
+                    pc.max_element_wise(instants, MIN_NANOSECOND_MS, skip_nulls=False),
+                    MAX_NANOSECOND_MS,
+                    skip_nulls=False,
+                )
+                for instants in (time_start, time_end)
+            )
+
+        time_type = pa.timestamp("ms", tz="UTC")
+        schema = (
+            record_batch.schema.remove(time_index)
+            .append(pa.field(time_start_column, time_type))
+            .append(pa.field(time_end_column, time_type))
+        )
+
+        from_arrays = pa.Table.from_arrays if isinstance(record_batch, pa.Table) else pa.RecordBatch.from_arrays
+
+        return from_arrays(
+            [
+                *record_batch.drop_columns([api.TIME_COLUMN_NAME]).columns,
+                time_start.cast(time_type),
+                time_end.cast(time_type),
+            ],
+            schema=schema,
+        )
+
+    @classmethod
+    def empty_schema(cls, spatial_reference: str, time_start_column: str, time_end_column: str) -> pa.Schema:
+        """The schema of the record batches of an empty vector result"""
+
+        time_type = pa.timestamp("ms", tz="UTC")
+
+        return pa.schema(
+            [pa.field(time_start_column, time_type), pa.field(time_end_column, time_type)],
+            metadata={"spatialReference": spatial_reference},
+        )
+
+    @classmethod
+    def classification_to_categorical(cls, values: pd.Series, classes: dict[int, str]) -> pd.Categorical:
+        """
+        Map the class codes of a column to their labels with one vectorized lookup.
+        Codes that are missing or not in `classes` become missing values.
+        """
+
+        labels = list(classes.values())
+        categories = pd.Index(labels).unique()
+
+        # several codes may share a label, and the appended -1 is the category of the codes that were not found
+        label_codes = np.append(categories.get_indexer(labels), -1)
+        class_positions = pd.Index(list(classes.keys())).get_indexer(values)
+
+        return pd.Categorical.from_codes(label_codes[class_positions], categories=categories)
+
+    @classmethod
+    def resolve_classifications(
+        cls, data_frame: gpd.GeoDataFrame, classifications: dict[str, dict[int, str]]
+    ) -> gpd.GeoDataFrame:
+        """Replace the class codes of the classification columns by categorical columns of their labels"""
+
+        for column, classes in classifications.items():
+            if column in data_frame:
+                data_frame[column] = VectorStreamProcessing.classification_to_categorical(data_frame[column], classes)
+
+        return data_frame
+
+    @classmethod
+    def create_geo_data_frame(
+        cls,
+        record_batch: pa.RecordBatch | pa.Table,
+        time_start_column: str,
+        time_end_column: str,
+        classifications: dict[str, dict[int, str]] | None = None,
+    ) -> gpd.GeoDataFrame:
+        """
+        Create a `GeoDataFrame` from an Arrow record batch (or a table of them) recieved from the Geo Engine.
+        The class codes of the columns in `classifications` are resolved to categorical columns of their labels.
+        """
+
+        metadata = record_batch.schema.metadata
+        spatial_reference = metadata[b"spatialReference"].decode("utf-8")
+
+        # the time instants are clipped to the range of pandas' nanosecond timestamps, so that the beginning and
+        # end of time stay ordered instants that can be converted to nanoseconds without overflowing.
+        # This differs from `get_dataframe`, whose time columns are naive nanoseconds with NaT for them.
+        record_batch = VectorStreamProcessing.split_time_column(
+            record_batch, time_start_column, time_end_column, clip_to_nanoseconds=True
+        )
+
+        geometry_index = record_batch.schema.get_field_index(api.GEOMETRY_COLUMN_NAME)
+        geometry = geometries_from_arrow(record_batch.column(geometry_index), record_batch.schema.field(geometry_index))
+
+        # the geometries are decoded from the Arrow column, so they are not converted to Python objects first,
+        # and the time columns become `datetime64[ms, UTC]` columns without any Python objects
+        data_frame = record_batch.drop_columns([api.GEOMETRY_COLUMN_NAME]).to_pandas(coerce_temporal_nanoseconds=False)
+
+        geo_data_frame = gpd.GeoDataFrame(
+            data_frame,
+            geometry=geometry,
+            crs=spatial_reference,
+        )
+
+        if classifications:
+            geo_data_frame = VectorStreamProcessing.resolve_classifications(geo_data_frame, classifications)
+
+        return geo_data_frame
+
+    @classmethod
+    def process_bytes(
+        cls,
+        batch_bytes: bytes,
+        time_start_column: str,
+        time_end_column: str,
+        classifications: dict[str, dict[int, str]] | None = None,
+    ) -> gpd.GeoDataFrame:
+        """Process a chunk from a byte array"""
+
+        # process the received data
+        record_batch = VectorStreamProcessing.read_arrow_ipc(batch_bytes)
+        return VectorStreamProcessing.create_geo_data_frame(
+            record_batch,
+            time_start_column=time_start_column,
+            time_end_column=time_end_column,
+            classifications=classifications,
+        )
+
+    @classmethod
+    def process_bytes_into_record_batch(
+        cls, batch_bytes: bytes, time_start_column: str, time_end_column: str
+    ) -> pa.RecordBatch:
+        """Process a chunk from a byte array into a record batch with separate time columns"""
+
+        return VectorStreamProcessing.split_time_column(
+            VectorStreamProcessing.read_arrow_ipc(batch_bytes),
+            time_start_column=time_start_column,
+            time_end_column=time_end_column,
+        )
+
+
 class Workflow:
     """
     Holds a workflow id and allows querying data
@@ -264,7 +582,8 @@ class Workflow:
 
         with geoc.ApiClient(session.configuration) as api_client:
             wfs_api = geoc.OGCWFSApi(api_client)
-            response = wfs_api.wfs_handler(
+            # the raw response is parsed directly into columns instead of into the (much slower) `GeoJson` model
+            response = wfs_api.wfs_handler_without_preload_content(
                 workflow=self.__workflow_id.to_dict(),
                 service=geoc.WfsService(geoc.WfsService.WFS),
                 request=geoc.WfsRequest(geoc.WfsRequest.GETFEATURE),
@@ -275,44 +594,61 @@ class Workflow:
                 srs_name=bbox.srs,
                 _request_timeout=timeout,
             )
+            geo_json = response.data
+
+        if not 200 <= response.status <= 299:
+            raise geoc.ApiException.from_response(http_resp=response, body=geo_json.decode("utf-8"), data=None)
 
-        def geo_json_with_time_to_geopandas(geo_json):
+        def geo_json_with_time_to_geopandas(geo_json: bytes) -> gpd.GeoDataFrame:
             """
             GeoJson has no standard for time, so we parse the when field
             separately and attach it to the data frame as columns `start`
             and `end`.
             """
 
-            data = gpd.GeoDataFrame.from_features(geo_json)
-            data = data.set_crs(bbox.srs, allow_override=True)
+            # the body is parsed once and each feature is split into its columns in a single pass
+            features = json.loads(geo_json)["features"]
 
-            start = [f["when"]["start"] for f in geo_json["features"]]
-            end = [f["when"]["end"] for f in geo_json["features"]]
+            geometries: list[dict | None] = []
+            properties: list[dict] = []
+            starts: list[str | None] = []
+            ends: list[str | None] = []
+            for feature in features:
+                geometries.append(feature.get("geometry"))
+                properties.append(feature.get("properties") or {})
+                when = feature.get("when") or {}
+                starts.append(when.get("start"))
+                ends.append(when.get("end"))
 
-            # TODO: find a good way to infer BoT/EoT
-
-            data["start"] = gpd.pd.to_datetime(start, errors="coerce")
-            data["end"] = gpd.pd.to_datetime(end, errors="coerce")
+            data = pd.DataFrame.from_records(properties, index=pd.RangeIndex(len(features)))
+            data.insert(0, "geometry", geometries_from_geojson(geometries))
+            data = gpd.GeoDataFrame(data, geometry="geometry", crs=bbox.srs)
 
-            return data
+            # TODO: find a good way to infer BoT/EoT
 
-        def transform_classifications(data: gpd.GeoDataFrame):
-            result_descriptor: VectorResultDescriptor = self.__result_descriptor  # type: ignore
-            for column, info in result_descriptor.columns.items():
-                if isinstance(info.measurement, ClassificationMeasurement):
-                    measurement: ClassificationMeasurement = info.measurement
-                    classes = measurement.classes
-                    data[column] = data[column].apply(lambda x, classes=classes: classes[x])  # pylint: disable=cell-var-from-loop
+            data["start"] = pd.to_datetime(np.array(starts, dtype=object), errors="coerce")
+            data["end"] = pd.to_datetime(np.array(ends, dtype=object), errors="coerce")
 
             return data
 
-        result = geo_json_with_time_to_geopandas(response.to_dict())
+        result = geo_json_with_time_to_geopandas(geo_json)
 
         if resolve_classifications:
-            result = transform_classifications(result)
+            result = VectorStreamProcessing.resolve_classifications(result, self.__classifications())
 
         return result
 
+    def __classifications(self) -> dict[str, dict[int, str]]:
+        """The classes of the classification columns of the (vector) result"""
+
+        result_descriptor = cast(VectorResultDescriptor, self.__result_descriptor)
+
+        return {
+            column: info.measurement.classes
+            for column, info in result_descriptor.columns.items()
+            if isinstance(info.measurement, ClassificationMeasurement)
+        }
+
     def wms_get_map_as_image(
         self,
         bbox: QueryRectangle,
@@ -635,12 +971,273 @@ class Workflow:
 
         return Task(TaskId.from_response(response))
 
+    # pylint: disable=too-many-arguments,too-many-positional-arguments
     async def raster_stream(
         self,
         query_rectangle: QueryRectangle | RasterQueryRectangle,
         open_timeout: int = 60,
+        prefetch: int = DEFAULT_PREFETCH,
+        decoders: int = DEFAULT_DECODERS,
+        statistics: StreamStatistics | None = None,
+        cache: TileCache | None = None,
+        reconnect: ReconnectPolicy | None = None,
+        skip_empty: bool = False,
+    ) -> AsyncIterator[RasterTile2D]:
+        """
+        Stream the workflow result as series of RasterTile2D (transformable to numpy and xarray)
+
+        Up to `prefetch` tiles are requested ahead of the consumer and up to `decoders` tiles are decoded concurrently.
+        Pass a `StreamStatistics` object to collect counters about the stream.
+        Pass a `TileCache` to serve cached tiles from disk and only query the parts of the query rectangle
+        that are not cached yet.
+        Pass a `ReconnectPolicy` to reconnect if the connection drops.
+        The stream then resumes with the remaining time steps and skips the tiles that were already yielded.
+        If `skip_empty` is true, tiles whose pixels are all nodata are not yielded.
+        """
+
+        query_rectangle = self.__raster_query_rectangle(query_rectangle)
+
+        async for tile in RasterStreamProcessing.count_empty_tiles(
+            self.__raster_tile_stream(query_rectangle, open_timeout, prefetch, decoders, statistics, cache, reconnect),
+            skip_empty,
+            statistics,
+        ):
+            yield tile
+
+    # pylint: disable=too-many-arguments,too-many-positional-arguments
+    async def __raster_tile_stream(
+        self,
+        query_rectangle: RasterQueryRectangle,
+        open_timeout: int,
+        prefetch: int,
+        decoders: int,
+        statistics: StreamStatistics | None,
+        cache: TileCache | None,
+        reconnect: ReconnectPolicy | None,
+    ) -> AsyncIterator[RasterTile2D]:
+        """Stream the tiles of a query rectangle from the cache (if given) or the server"""
+
+        result_descriptor = cast(RasterResultDescriptor, self.__result_descriptor)
+        # the tiles are decoded with their index in the result's spatial grid
+        grid_geo_transform = result_descriptor.geo_transform
+
+        if cache is not None:
+
+            async def decode(frame: bytes) -> RasterTile2D | None:
+                return await run_in_decode_executor(RasterStreamProcessing.process_bytes, frame, grid_geo_transform)
+
+            async for tile in cached_raster_stream(
+                cache,
+                str(self.__workflow_id),
+                TileGrid(result_descriptor.geo_transform, cache.tile_size),
+                query_rectangle,
+                lambda cells_query: self.__raster_frame_stream(
+                    cells_query,
+                    functools.partial(
+                        RasterStreamProcessing.process_bytes_with_frame, grid_geo_transform=grid_geo_transform
+                    ),
+                    lambda frame_and_tile: frame_and_tile[1],
+                    open_timeout=open_timeout,
+                    prefetch=prefetch,
+                    decoders=decoders,
+                    statistics=statistics,
+                    reconnect=reconnect,
+                ),
+                decode,
+            ):
+                yield tile
+            return
+
+        async for tile in self.__raster_frame_stream(
+            query_rectangle,
+            functools.partial(RasterStreamProcessing.process_bytes, grid_geo_transform=grid_geo_transform),
+            lambda tile: tile,
+            open_timeout=open_timeout,
+            prefetch=prefetch,
+            decoders=decoders,
+            statistics=statistics,
+            reconnect=reconnect,
+        ):
+            yield tile
+
+    # pylint: disable=too-many-arguments,too-many-positional-arguments
+    def iter_raster_tiles(
+        self,
+        query_rectangle: QueryRectangle | RasterQueryRectangle,
+        open_timeout: int = 60,
+        prefetch: int = DEFAULT_PREFETCH,
+        decoders: int = DEFAULT_DECODERS,
+        statistics: StreamStatistics | None = None,
+        cache: TileCache | None = None,
+        reconnect: ReconnectPolicy | None = None,
+        skip_empty: bool = False,
+        buffer_size: int = DEFAULT_PREFETCH,
+    ) -> Iterator[RasterTile2D]:
+        """
+        Iterate synchronously over the tiles of `raster_stream`.
+
+        The stream runs in a background thread and buffers up to `buffer_size` tiles ahead of the consumer.
+        Breaking out of the iteration closes the stream.
+        """
+
+        return iterate_in_background(
+            lambda: self.raster_stream(
+                query_rectangle,
+                open_timeout=open_timeout,
+                prefetch=prefetch,
+                decoders=decoders,
+                statistics=statistics,
+                cache=cache,
+                reconnect=reconnect,
+                skip_empty=skip_empty,
+            ),
+            buffer_size=buffer_size,
+        )
+
+    # pylint: disable=too-many-arguments,too-many-positional-arguments
+    async def raster_stream_arrow(
+        self,
+        query_rectangle: QueryRectangle | RasterQueryRectangle,
+        open_timeout: int = 60,
+        prefetch: int = DEFAULT_PREFETCH,
+        decoders: int = DEFAULT_DECODERS,
+        statistics: StreamStatistics | None = None,
+        reconnect: ReconnectPolicy | None = None,
+    ) -> AsyncIterator[pa.RecordBatch]:
+        """
+        Stream the workflow result as the Arrow record batches of the server, one per tile.
+
+        The pixels of a tile are the only column of its batch and its geo transform, size, spatial reference,
+        time and band are in the schema metadata, like `RasterTile2D.from_ge_record_batch` expects them.
+        The batches reference the received frames, so nothing is converted or copied.
+        """
+
+        query_rectangle = self.__raster_query_rectangle(query_rectangle)
+
+        async for record_batch in self.__raster_frame_stream(
+            query_rectangle,
+            RasterStreamProcessing.read_arrow_ipc,
+            RasterTile2D.from_ge_record_batch,
+            open_timeout=open_timeout,
+            prefetch=prefetch,
+            decoders=decoders,
+            statistics=statistics,
+            reconnect=reconnect,
+        ):
+            yield record_batch
+
+    # pylint: disable=too-many-arguments,too-many-positional-arguments
+    def raster_stream_arrow_reader(
+        self,
+        query_rectangle: QueryRectangle | RasterQueryRectangle,
+        open_timeout: int = 60,
+        prefetch: int = DEFAULT_PREFETCH,
+        decoders: int = DEFAULT_DECODERS,
+        statistics: StreamStatistics | None = None,
+        cache: TileCache | None = None,
+        reconnect: ReconnectPolicy | None = None,
+        skip_empty: bool = False,
+        buffer_size: int = DEFAULT_PREFETCH,
+    ) -> pa.RecordBatchReader:
+        """
+        Read the tiles of `raster_stream` as a `pyarrow.RecordBatchReader`, e.g., for DuckDB or Polars.
+
+        Each tile is one row of the schema `raster_tile_schema`, with its metadata as columns
+        and its pixels (row-major) as a list that references the received data without copying it.
+        The stream runs in a background thread like `iter_raster_tiles`.
+        """
+
+        result_descriptor = cast(RasterResultDescriptor, self.__result_descriptor)
+        data_type = pa.from_numpy_dtype(result_descriptor.data_type.to_np_dtype())
+
+        tiles = self.iter_raster_tiles(
+            query_rectangle,
+            open_timeout=open_timeout,
+            prefetch=prefetch,
+            decoders=decoders,
+            statistics=statistics,
+            cache=cache,
+            reconnect=reconnect,
+            skip_empty=skip_empty,
+            buffer_size=buffer_size,
+        )
+
+        return pa.RecordBatchReader.from_batches(raster_tile_schema(data_type), (tile.to_arrow_row() for tile in tiles))
+
+    # pylint: disable=too-many-arguments,too-many-positional-arguments
+    async def raster_stream_parallel(
+        self,
+        query_rectangle: QueryRectangle | RasterQueryRectangle,
+        connections: int = 4,
+        ordered: bool = True,
+        tile_size: int | tuple[int, int] = DEFAULT_TILE_SIZE,
+        open_timeout: int = 60,
+        prefetch: int = DEFAULT_PREFETCH,
+        decoders: int = DEFAULT_DECODERS,
+        statistics: StreamStatistics | None = None,
+        reconnect: ReconnectPolicy | None = None,
+        skip_empty: bool = False,
     ) -> AsyncIterator[RasterTile2D]:
-        """Stream the workflow result as series of RasterTile2D (transformable to numpy and xarray)"""
+        """
+        Stream the workflow result as series of RasterTile2D using multiple connections at once.
+
+        The query rectangle is split along the tile grid of the result into (at most) `connections` parts
+        that are queried concurrently.
+        If `ordered` is true, the tiles are yielded in the order of `raster_stream`: by time, then by tile
+        (row-major from the top left) and then by band.
+        Otherwise, they are yielded as soon as they arrive.
+        The `tile_size` (in pixels) must match the tiling of the Geo Engine instance.
+        The `prefetch`, `decoders`, `statistics` and `reconnect` parameters apply to each connection
+        and `skip_empty` skips empty tiles (see `raster_stream`).
+        """
+
+        query_rectangle = self.__raster_query_rectangle(query_rectangle)
+        result_descriptor = cast(RasterResultDescriptor, self.__result_descriptor)
+
+        tile_grid = TileGrid(result_descriptor.geo_transform, tile_size)
+        partitions = tile_grid.partition(query_rectangle, connections)
+
+        async def partition_stream(
+            partition_query: RasterQueryRectangle, tile_range: GridBoundingBox2D
+        ) -> AsyncIterator[RasterTile2D]:
+            async for tile in self.__raster_frame_stream(
+                partition_query,
+                functools.partial(
+                    RasterStreamProcessing.process_bytes, grid_geo_transform=result_descriptor.geo_transform
+                ),
+                lambda tile: tile,
+                open_timeout=open_timeout,
+                prefetch=prefetch,
+                decoders=decoders,
+                statistics=statistics,
+                reconnect=reconnect,
+            ):
+                # neighboring partitions may both return tiles on their common border
+                if tile_range.contains_idx(tile_grid.tile_idx_of_raster_tile(tile)):
+                    yield tile
+
+        streams = [
+            RasterStreamProcessing.count_empty_tiles(
+                partition_stream(partition_query, tile_range), skip_empty, statistics
+            )
+            for (partition_query, tile_range) in partitions
+        ]
+
+        if not ordered:
+            async for tile in merge_streams_as_completed(streams):
+                yield tile
+            return
+
+        band_order = {band: i for i, band in enumerate(query_rectangle.raster_bands)}
+
+        def tile_order(tile: RasterTile2D) -> tuple[np.datetime64, float, float, int]:
+            return (tile.time.start, -tile.geo_transform.y_max, tile.geo_transform.x_min, band_order[tile.band])
+
+        async for tile in merge_streams_ordered(streams, key=tile_order):
+            yield tile
+
+    def __raster_query_rectangle(self, query_rectangle: QueryRectangle | RasterQueryRectangle) -> RasterQueryRectangle:
+        """Check that the workflow is a raster workflow and add the bands to the query rectangle"""
 
         # Currently, it only works for raster results
         if not self.__result_descriptor.is_raster_result():
@@ -654,6 +1251,49 @@ class Workflow:
                 list(range(0, len(result_descriptor.bands)))
             )
 
+        return query_rectangle
+
+    # pylint: disable=too-many-arguments,too-many-positional-arguments
+    def __raster_frame_stream(
+        self,
+        query_rectangle: RasterQueryRectangle,
+        decode: Callable[[bytes], T | None],
+        tile_of: Callable[[T], RasterTile2D],
+        open_timeout: int = 60,
+        prefetch: int = DEFAULT_PREFETCH,
+        decoders: int = DEFAULT_DECODERS,
+        statistics: StreamStatistics | None = None,
+        reconnect: ReconnectPolicy | None = None,
+    ) -> AsyncIterator[T]:
+        """Stream the (decoded) frames of a raster query rectangle and resume it if a `ReconnectPolicy` is given"""
+
+        def open_stream(query: RasterQueryRectangle) -> AsyncIterator[T]:
+            return self.__raster_stream_connection(
+                query,
+                decode,
+                open_timeout=open_timeout,
+                prefetch=prefetch,
+                decoders=decoders,
+                statistics=statistics,
+            )
+
+        if reconnect is None:
+            return open_stream(query_rectangle)
+
+        return resumable_raster_stream(open_stream, query_rectangle, reconnect, tile_of)
+
+    # pylint: disable=too-many-arguments,too-many-positional-arguments
+    async def __raster_stream_connection(
+        self,
+        query_rectangle: RasterQueryRectangle,
+        decode: Callable[[bytes], T | None],
+        open_timeout: int = 60,
+        prefetch: int = DEFAULT_PREFETCH,
+        decoders: int = DEFAULT_DECODERS,
+        statistics: StreamStatistics | None = None,
+    ) -> AsyncIterator[T]:
+        """Stream the (decoded) frames of a raster query rectangle via a single websocket connection"""
+
         session = get_session()
 
         url = (
@@ -680,44 +1320,57 @@ class Workflow:
             open_timeout=open_timeout,
             max_size=None,
         ) as websocket:
-            tile_bytes: bytes | None = None
-
-            while websocket.state == websockets.protocol.State.OPEN:
-
-                async def read_new_bytes() -> bytes | None:
-                    # already send the next request to speed up the process
-                    try:
-                        await websocket.send("NEXT")
-                    except websockets.exceptions.ConnectionClosed:
-                        # the websocket connection is already closed, we cannot read anymore
-                        return None
-
-                    try:
-                        data: str | bytes = await websocket.recv()
-
-                        if isinstance(data, str):
-                            # the server sent an error message
-                            raise GeoEngineException({"error": data})
-
-                        return data
-                    except websockets.exceptions.ConnectionClosedOK:
-                        # the websocket connection closed gracefully, so we stop reading
-                        return None
-
-                (tile_bytes, tile) = await asyncio.gather(
-                    read_new_bytes(),
-                    # asyncio.to_thread(process_bytes, tile_bytes), # TODO: use this when min Python version is 3.9
-                    backports.to_thread(RasterStreamProcessing.process_bytes, tile_bytes),
-                )
+            async for tile in websocket_frame_stream(
+                websocket,
+                decode,
+                prefetch=prefetch,
+                decoders=decoders,
+                statistics=statistics,
+            ):
+                yield tile
 
-                if tile is not None:
-                    yield tile
+    # pylint: disable=too-many-arguments,too-many-positional-arguments
+    async def raster_stream_timesteps(
+        self,
+        query_rectangle: QueryRectangle | RasterQueryRectangle,
+        clip_to_query_rectangle: bool = False,
+        open_timeout: int = 60,
+        prefetch: int = DEFAULT_PREFETCH,
+        decoders: int = DEFAULT_DECODERS,
+        statistics: StreamStatistics | None = None,
+        cache: TileCache | None = None,
+        reconnect: ReconnectPolicy | None = None,
+    ) -> AsyncIterator[RasterMosaic]:
+        """
+        Stream the workflow result as one mosaic per time step, which covers the same pixels as
+        `raster_stream_into_xarray` and is transformable to a (band, y, x) numpy array or xarray.
 
-            # process the last tile
-            tile = RasterStreamProcessing.process_bytes(tile_bytes)
+        A mosaic is yielded as soon as the last tile of its time step arrived, while the next tiles are prefetched.
+        Each mosaic is allocated separately, so only the time steps that are still referenced are kept in memory.
+        """
 
-            if tile is not None:
-                yield tile
+        query_rectangle = self.__raster_query_rectangle(query_rectangle)
+        result_descriptor = cast(RasterResultDescriptor, self.__result_descriptor)
+        dtype = result_descriptor.data_type.to_np_dtype()
+
+        async for mosaic in raster_stream_into_mosaics(
+            self.raster_stream(
+                query_rectangle,
+                open_timeout=open_timeout,
+                prefetch=prefetch,
+                decoders=decoders,
+                statistics=statistics,
+                cache=cache,
+                reconnect=reconnect,
+            ),
+            result_descriptor.geo_transform,
+            query_rectangle,
+            lambda grid, time, crs: RasterMosaic.allocate(
+                grid, time, query_rectangle.raster_bands, crs, dtype, with_mask=False
+            ),
+            clip_to_query_rectangle=clip_to_query_rectangle,
+        ):
+            yield mosaic
 
     async def raster_stream_into_xarray(
         self,
@@ -728,134 +1381,468 @@ class Workflow:
         """
         Stream the workflow result into memory and output a single xarray.
 
+        The tiles are written into one preallocated (time, band, y, x) array if the workflow has a regular
+        time dimension. Otherwise, the time steps are written into chunks that the result concatenates lazily,
+        so that they are never copied.
+        Without clipping, the array covers all tiles that intersect the query rectangle.
+        With clipping, it only covers the pixels that intersect the query rectangle.
+
         NOTE: You can run out of memory if the query rectangle is too large.
         """
 
-        tile_stream = self.raster_stream(query_rectangle, open_timeout=open_timeout)
+        (grid, stack) = await self.__raster_stream_into_time_stack(
+            query_rectangle, clip_to_query_rectangle, open_timeout, with_mask=False
+        )
+        (grid, data_chunks, mask_chunks) = stack.finish(grid)
+        masks: list[np.ndarray | None] = [None] * len(data_chunks) if mask_chunks is None else list(mask_chunks)
+
+        # the time chunks of an irregular time dimension are concatenated lazily, so that they are not copied
+        output = xr.DataArray(
+            time_chunked_data([nan_masked(data, mask) for data, mask in zip(data_chunks, masks, strict=True)]),
+            dims=["time", "band", "y", "x"],
+            coords={
+                "x": grid.coords_x(),
+                "y": grid.coords_y(),
+                "time": np.array(
+                    [clamp_datetime_ms_ns(time.start.astype("datetime64[ms]")) for time in stack.times],
+                    dtype="datetime64[ns]",
+                ),
+                "band": stack.bands,
+            },
+        )
 
-        timestep_xarrays: list[xr.DataArray] = []
+        result_descriptor = cast(RasterResultDescriptor, self.__result_descriptor)
+        output.rio.write_crs(result_descriptor.spatial_reference, inplace=True)
 
-        spatial_clip_bounds = query_rectangle.spatial_bounds if clip_to_query_rectangle else None
+        return output
 
-        async def read_tiles(
-            remainder_tile: RasterTile2D | None,
-        ) -> tuple[list[xr.DataArray], RasterTile2D | None]:
-            last_timestep: np.datetime64 | None = None
-            tiles = []
+    async def raster_stream_into_numpy(
+        self,
+        query_rectangle: RasterQueryRectangle,
+        clip_to_query_rectangle: bool = False,
+        open_timeout: int = 60,
+    ) -> np.ma.MaskedArray:
+        """
+        Stream the workflow result into memory and output a single (time, band, y, x) masked numpy array.
 
-            if remainder_tile is not None:
-                last_timestep = remainder_tile.time_start_ms
-                xr_tile = remainder_tile.to_xarray(clip_with_bounds=spatial_clip_bounds)
-                tiles.append(xr_tile)
+        The array has the data type of the workflow result and covers the same pixels as `raster_stream_into_xarray`.
 
-            async for tile in tile_stream:
-                timestep: np.datetime64 = tile.time_start_ms
-                if last_timestep is None:
-                    last_timestep = timestep
-                elif last_timestep != timestep:
-                    return tiles, tile
+        NOTE: You can run out of memory if the query rectangle is too large.
+        """
 
-                xr_tile = tile.to_xarray(clip_with_bounds=spatial_clip_bounds)
-                tiles.append(xr_tile)
+        (grid, stack) = await self.__raster_stream_into_time_stack(
+            query_rectangle, clip_to_query_rectangle, open_timeout, with_mask=True
+        )
+        (_, data_chunks, mask_chunks) = stack.finish(grid)
 
-            # this seems to be the last time step, so just return tiles
-            return tiles, None
+        # a numpy array is contiguous, so the time chunks of an irregular time dimension are concatenated
+        data = concatenate_time_chunks(data_chunks)
+        mask = None if mask_chunks is None else concatenate_time_chunks(mask_chunks)
 
-        (tiles, remainder_tile) = await read_tiles(None)
+        return np.ma.masked_array(data, mask=np.zeros(data.shape, dtype=np.bool_) if mask is None else mask)
 
-        while len(tiles):
-            ((new_tiles, new_remainder_tile), new_timestep_xarray) = await asyncio.gather(
-                read_tiles(remainder_tile),
-                backports.to_thread(RasterStreamProcessing.merge_tiles, tiles),
-                # asyncio.to_thread(merge_tiles, tiles), # TODO: use this when min Python version is 3.9
-            )
+    # pylint: disable=too-many-arguments,too-many-positional-arguments
+    async def raster_stream_into_memmap(
+        self,
+        query_rectangle: QueryRectangle | RasterQueryRectangle,
+        path: str | PathLike,
+        clip_to_query_rectangle: bool = False,
+        fill_value: int | float | None = None,
+        open_timeout: int = 60,
+    ) -> RasterMemmap:
+        """
+        Stream the workflow result into a (time, band, y, x) `numpy.memmap` in the file at `path`.
 
-            tiles = new_tiles
-            remainder_tile = new_remainder_tile
+        The array has the data type of the workflow result and covers the same pixels as `raster_stream_into_xarray`.
+        It is filled time step by time step, so the result can be larger than the available memory.
+        Nodata pixels are written as `fill_value`, which defaults to NaN for floating point data and 0 otherwise.
 
-            if new_timestep_xarray is not None:
-                timestep_xarrays.append(new_timestep_xarray)
+        Returns the memmap together with the geo transform of its upper left pixel and its time steps.
+        """
+
+        query_rectangle = self.__raster_query_rectangle(query_rectangle)
+        result_descriptor = cast(RasterResultDescriptor, self.__result_descriptor)
+
+        writer = MemmapMosaicWriter(
+            path, query_rectangle.raster_bands, result_descriptor.data_type.to_np_dtype(), fill_value=fill_value
+        )
+
+        async for _mosaic in raster_stream_into_mosaics(
+            self.raster_stream(query_rectangle, open_timeout=open_timeout),
+            result_descriptor.geo_transform,
+            query_rectangle,
+            writer.allocate,
+            clip_to_query_rectangle=clip_to_query_rectangle,
+        ):
+            pass
 
-        output: xr.DataArray = cast(
-            xr.DataArray,
-            # await asyncio.to_thread( # TODO: use this when min Python version is 3.9
-            await backports.to_thread(
-                xr.concat,
-                # TODO: This is a typings error, since the method accepts also a `xr.DataArray` and returns one
-                cast(list[xr.Dataset], timestep_xarrays),
-                dim="time",
+        return writer.finish(MosaicGrid.from_bounds(result_descriptor.geo_transform, query_rectangle.spatial_bounds))
+
+    # pylint: disable=too-many-arguments,too-many-positional-arguments
+    async def raster_stream_into_zarr(
+        self,
+        query_rectangle: QueryRectangle | RasterQueryRectangle,
+        store: ZarrStore,
+        variable_name: str = "data",
+        fill_value: int | float | None = None,
+        open_timeout: int = 60,
+    ) -> None:
+        """
+        Stream the workflow result into a Zarr (version 2) store without keeping it in memory.
+
+        The `store` is either a directory path or a mutable mapping from keys to bytes (like the stores of `zarr`).
+        The (time, band, y, x) array `variable_name` covers all tiles that intersect the query rectangle,
+        with one uncompressed chunk per tile.
+        Nodata pixels are written as `fill_value`, which defaults to NaN for floating point data.
+        Integer data has no fill value by default and its nodata pixels are written as 0.
+        Time, band, CRS and coordinate metadata is written once all tiles are written.
+
+        The result can be opened lazily with `xarray.open_zarr(store)`.
+        """
+
+        query_rectangle = self.__raster_query_rectangle(query_rectangle)
+        result_descriptor = cast(RasterResultDescriptor, self.__result_descriptor)
+
+        writer = ZarrRasterWriter(
+            store,
+            result_descriptor.geo_transform,
+            query_rectangle,
+            result_descriptor.data_type.to_np_dtype(),
+            variable_name=variable_name,
+            fill_value=fill_value,
+        )
+
+        await raster_stream_into_zarr(self.raster_stream(query_rectangle, open_timeout=open_timeout), writer)
+
+    # pylint: disable=too-many-arguments,too-many-positional-arguments,too-many-locals
+    async def raster_stream_statistics(
+        self,
+        query_rectangle: QueryRectangle | RasterQueryRectangle,
+        bands: list[int] | None = None,
+        stats: Sequence[str] = DEFAULT_STATISTICS,
+        histogram_bins: HistogramBins | None = None,
+        open_timeout: int = 60,
+        prefetch: int = DEFAULT_PREFETCH,
+        decoders: int = DEFAULT_DECODERS,
+        statistics: StreamStatistics | None = None,
+    ) -> xr.Dataset:
+        """
+        Compute statistics of the workflow result per time step and band without keeping the result in memory.
+
+        The `stats` are any of `count`, `min`, `max`, `mean`, `std` (the population standard deviation)
+        and `histogram`, which requires `histogram_bins`.
+        They only cover the valid (not nodata and not NaN) pixels that intersect the query rectangle.
+        The `bands` default to the bands of the query rectangle.
+
+        Each tile is decoded and reduced to mergeable partial statistics in the decode executor.
+        The `prefetch`, `decoders` and `statistics` parameters are the same as for `raster_stream`.
+
+        Returns a dataset with one variable per statistic and the dimensions (time, band).
+        The histogram has the additional dimension `bin`, whose coordinate is the center of each bin.
+        """
+
+        requested = check_statistics(stats, histogram_bins)
+
+        query_rectangle = self.__raster_query_rectangle(query_rectangle)
+        if bands is not None:
+            query_rectangle = query_rectangle.with_raster_bands(bands)
+
+        result_descriptor = cast(RasterResultDescriptor, self.__result_descriptor)
+        grid = MosaicGrid.from_bounds(result_descriptor.geo_transform, query_rectangle.spatial_bounds)
+
+        results: dict[np.datetime64, dict[int, BandStatistics]] = {}
+
+        async for time, band, is_empty, band_statistics in self.__raster_stream_connection(
+            query_rectangle,
+            functools.partial(
+                RasterStreamProcessing.process_bytes_into_band_statistics,
+                grid_geo_transform=result_descriptor.geo_transform,
+                grid=grid,
+                statistics=requested,
+                histogram_bins=histogram_bins,
             ),
+            open_timeout=open_timeout,
+            prefetch=prefetch,
+            decoders=decoders,
+            statistics=statistics,
+        ):
+            # the tiles are only decoded in the decode executor, so they are counted like in `raster_stream` here
+            if is_empty and statistics is not None:
+                statistics.empty_tiles += 1
+            if band_statistics is None:
+                continue
+
+            time_results = results.setdefault(time, {})
+            if band in time_results:
+                time_results[band].merge(band_statistics)
+            else:
+                time_results[band] = band_statistics
+
+        return statistics_to_xarray(results, query_rectangle.raster_bands, requested, histogram_bins)
+
+    # pylint: disable=too-many-arguments,too-many-positional-arguments
+    async def extract_points(
+        self,
+        points: gpd.GeoDataFrame | gpd.GeoSeries,
+        query_rectangle: QueryRectangle | RasterQueryRectangle,
+        tile_size: int | tuple[int, int] = DEFAULT_TILE_SIZE,
+        connections: int = 4,
+        open_timeout: int = 60,
+        reconnect: ReconnectPolicy | None = None,
+    ) -> pd.DataFrame:
+        """
+        Extract the values of the workflow result at point locations as a tidy data frame.
+
+        The data frame has the columns `point` (the index label of the point), `time`, `band` and `value`,
+        where nodata values are NaN.
+
+        See `extract_points_into_xarray` for the parameters.
+        """
+
+        (labels, times, values, mask) = await self.__extract_points(
+            points, query_rectangle, tile_size, connections, open_timeout, reconnect
+        )
+        (num_times, num_bands, num_points) = values.shape
+        query_bands = self.__raster_query_rectangle(query_rectangle).raster_bands
+
+        # the rows are ordered by point, then time and then band
+        return pd.DataFrame(
+            {
+                "point": np.repeat(labels, num_times * num_bands),
+                "time": np.tile(np.repeat(times, num_bands), num_points),
+                "band": np.tile(np.array(query_bands, dtype=np.int64), num_times * num_points),
+                "value": nan_masked(values, mask).transpose(2, 0, 1).reshape(-1),
+            }
         )
 
-        return output
+    # pylint: disable=too-many-arguments,too-many-positional-arguments
+    async def extract_points_into_xarray(
+        self,
+        points: gpd.GeoDataFrame | gpd.GeoSeries,
+        query_rectangle: QueryRectangle | RasterQueryRectangle,
+        tile_size: int | tuple[int, int] = DEFAULT_TILE_SIZE,
+        connections: int = 4,
+        open_timeout: int = 60,
+        reconnect: ReconnectPolicy | None = None,
+    ) -> xr.DataArray:
+        """
+        Extract the values of the workflow result at point locations as a (point, time, band) xarray.DataArray.
+
+        The points are reprojected to the spatial reference of the query rectangle if they have a CRS.
+        Nodata values and the values of points outside of the pixels that intersect the query rectangle are NaN.
+
+        The points are indexed by the tiles of the result once and only the rows of tiles that contain points
+        are queried, using up to `connections` connections at once.
+        The `tile_size` (in pixels) must match the tiling of the Geo Engine instance.
+        The memory usage is proportional to the number of points and time steps, not to the queried extent.
+        """
+
+        (labels, times, values, mask) = await self.__extract_points(
+            points, query_rectangle, tile_size, connections, open_timeout, reconnect
+        )
+        query_bands = self.__raster_query_rectangle(query_rectangle).raster_bands
+
+        return xr.DataArray(
+            nan_masked(values, mask).transpose(2, 0, 1),
+            dims=["point", "time", "band"],
+            coords={"point": labels, "time": times, "band": query_bands},
+        )
+
+    # pylint: disable=too-many-arguments,too-many-positional-arguments,too-many-locals
+    async def __extract_points(
+        self,
+        points: gpd.GeoDataFrame | gpd.GeoSeries,
+        query_rectangle: QueryRectangle | RasterQueryRectangle,
+        tile_size: int | tuple[int, int],
+        connections: int,
+        open_timeout: int,
+        reconnect: ReconnectPolicy | None,
+    ) -> tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+        """Extract the point labels, time steps and the (time, band, point) values and nodata mask"""
+
+        query_rectangle = self.__raster_query_rectangle(query_rectangle)
+        result_descriptor = cast(RasterResultDescriptor, self.__result_descriptor)
+        grid_geo_transform = result_descriptor.geo_transform
+
+        (x, y) = point_coordinates(points, query_rectangle.srs)
+
+        index = PointIndex(
+            grid_geo_transform, x, y, MosaicGrid.from_bounds(grid_geo_transform, query_rectangle.spatial_bounds)
+        )
+        queries = index.tile_queries(TileGrid(grid_geo_transform, tile_size), query_rectangle)
+
+        collector = PointValues(query_rectangle.raster_bands, len(x), result_descriptor.data_type.to_np_dtype())
+
+        # each connection streams its share of the rows one after the other
+        num_connections = max(1, min(connections, len(queries)))
+        streams = [
+            chain_streams(
+                [
+                    self.raster_stream(row_query, open_timeout=open_timeout, reconnect=reconnect)
+                    for row_query in queries[i::num_connections]
+                ]
+            )
+            for i in range(num_connections)
+        ]
+
+        async for tile in merge_streams_as_completed(streams):
+            (tile_points, values, mask) = index.gather(tile)
+            collector.add(tile, tile_points, values, mask)
+
+        (times, values, mask) = collector.finish()
+
+        xarray_times = np.array([clamp_datetime_ms_ns(time) for time in times], dtype="datetime64[ns]")
+
+        return (points.index.to_numpy(), xarray_times, values, mask)
+
+    async def __raster_stream_into_time_stack(
+        self,
+        query_rectangle: QueryRectangle | RasterQueryRectangle,
+        clip_to_query_rectangle: bool,
+        open_timeout: int,
+        with_mask: bool,
+    ) -> tuple[MosaicGrid, MosaicTimeStack]:
+        """
+        Stream the workflow result into a stack of the mosaics of all time steps.
+        Returns the stack and the grid to use if there are no time steps.
+        """
 
+        query_rectangle = self.__raster_query_rectangle(query_rectangle)
+        result_descriptor = cast(RasterResultDescriptor, self.__result_descriptor)
+
+        time_dimension = result_descriptor.time.dimension
+        expected_time_steps = (
+            time_dimension.num_time_steps(query_rectangle.time)
+            if isinstance(time_dimension, RegularTimeDimension)
+            else None
+        )
+
+        stack = MosaicTimeStack(
+            query_rectangle.raster_bands,
+            result_descriptor.data_type.to_np_dtype(),
+            with_mask=with_mask,
+            expected_time_steps=expected_time_steps,
+        )
+
+        async for _mosaic in raster_stream_into_mosaics(
+            self.raster_stream(query_rectangle, open_timeout=open_timeout),
+            result_descriptor.geo_transform,
+            query_rectangle,
+            stack.allocate,
+            clip_to_query_rectangle=clip_to_query_rectangle,
+        ):
+            pass
+
+        return (MosaicGrid.from_bounds(result_descriptor.geo_transform, query_rectangle.spatial_bounds), stack)
+
+    # pylint: disable=too-many-arguments,too-many-positional-arguments
     async def vector_stream(
         self,
         query_rectangle: QueryRectangle,
         time_start_column: str = "time_start",
         time_end_column: str = "time_end",
         open_timeout: int = 60,
+        prefetch: int = DEFAULT_PREFETCH,
+        decoders: int = DEFAULT_DECODERS,
+        statistics: StreamStatistics | None = None,
+        reconnect: ReconnectPolicy | None = None,
+        geometry_encoding: GeometryEncoding = GeometryEncoding.WKT,
+        resolve_classifications: bool = False,
     ) -> AsyncIterator[gpd.GeoDataFrame]:
-        """Stream the workflow result as series of `GeoDataFrame`s"""
-
-        def read_arrow_ipc(arrow_ipc: bytes) -> pa.RecordBatch:
-            reader = pa.ipc.open_file(arrow_ipc)
-            # We know from the backend that there is only one record batch
-            record_batch = reader.get_record_batch(0)
-            return record_batch
-
-        def create_geo_data_frame(
-            record_batch: pa.RecordBatch, time_start_column: str, time_end_column: str
-        ) -> gpd.GeoDataFrame:
-            metadata = record_batch.schema.metadata
-            spatial_reference = metadata[b"spatialReference"].decode("utf-8")
-
-            data_frame = record_batch.to_pandas()
-
-            geometry = gpd.GeoSeries.from_wkt(data_frame[api.GEOMETRY_COLUMN_NAME])
-            # delete the duplicated column
-            del data_frame[api.GEOMETRY_COLUMN_NAME]
-
-            geo_data_frame = gpd.GeoDataFrame(
-                data_frame,
-                geometry=geometry,
-                crs=spatial_reference,
-            )
-
-            # split time column
-            geo_data_frame[[time_start_column, time_end_column]] = geo_data_frame[api.TIME_COLUMN_NAME].tolist()
-            # delete the duplicated column
-            del geo_data_frame[api.TIME_COLUMN_NAME]
-
-            # parse time columns
-            for time_column in [time_start_column, time_end_column]:
-                geo_data_frame[time_column] = pd.to_datetime(
-                    geo_data_frame[time_column],
-                    utc=True,
-                    unit="ms",
-                    # TODO: solve time conversion problem from Geo Engine to Python for large (+/-) time instances
-                    errors="coerce",
-                )
-
-            return geo_data_frame
+        """
+        Stream the workflow result as series of `GeoDataFrame`s
+
+        Up to `prefetch` chunks are requested ahead of the consumer and up to `decoders` chunks are decoded
+        concurrently. Pass a `StreamStatistics` object to collect counters about the stream.
+        Pass a `ReconnectPolicy` to reconnect if the connection drops.
+        Since the server neither orders the features nor fixes the boundaries of its chunks, the stream then
+        queries (and downloads) the whole query rectangle again and skips the features that were already yielded,
+        which it recognizes by a hash of all their values.
+        The server sends the geometries as `geometry_encoding`. WKB and GeoArrow are smaller and faster to decode
+        than WKT, which is the default.
+        If `resolve_classifications` is true, the class codes of classification columns are resolved
+        to categorical columns of their labels.
+        """
 
-        def process_bytes(batch_bytes: bytes | None) -> gpd.GeoDataFrame | None:
-            if batch_bytes is None:
-                return None
+        # Currently, it only works for raster results
+        if not self.__result_descriptor.is_vector_result():
+            raise MethodNotCalledOnVectorException()
 
-            # process the received data
-            record_batch = read_arrow_ipc(batch_bytes)
-            tile = create_geo_data_frame(
-                record_batch,
+        async for batch in self.__vector_frame_stream(
+            query_rectangle,
+            functools.partial(
+                VectorStreamProcessing.process_bytes,
                 time_start_column=time_start_column,
                 time_end_column=time_end_column,
+                classifications=self.__classifications() if resolve_classifications else None,
+            ),
+            open_timeout=open_timeout,
+            prefetch=prefetch,
+            decoders=decoders,
+            statistics=statistics,
+            reconnect=reconnect,
+            geometry_encoding=geometry_encoding,
+        ):
+            yield batch
+
+    # pylint: disable=too-many-arguments,too-many-positional-arguments
+    def __vector_frame_stream(
+        self,
+        query_rectangle: QueryRectangle,
+        decode: Callable[[bytes], T | None],
+        open_timeout: int = 60,
+        prefetch: int = DEFAULT_PREFETCH,
+        decoders: int = DEFAULT_DECODERS,
+        statistics: StreamStatistics | None = None,
+        reconnect: ReconnectPolicy | None = None,
+        geometry_encoding: GeometryEncoding = GeometryEncoding.WKT,
+    ) -> AsyncIterator[T]:
+        """
+        Stream the (decoded) chunks of a vector query rectangle and resume it if a `ReconnectPolicy` is given.
+        A resumed stream queries the whole query rectangle again and skips the features that were already yielded.
+        """
+
+        if reconnect is None:
+            return self.__vector_stream_connection(
+                query_rectangle,
+                decode,
+                open_timeout=open_timeout,
+                prefetch=prefetch,
+                decoders=decoders,
+                statistics=statistics,
+                geometry_encoding=geometry_encoding,
             )
 
-            return tile
+        # the features are hashed while decoding, so that they can be recognized after a reconnect
+        keyed_decode = functools.partial(
+            decode_with_feature_keys, decode=decode, read=VectorStreamProcessing.read_arrow_ipc
+        )
 
-        # Currently, it only works for raster results
-        if not self.__result_descriptor.is_vector_result():
-            raise MethodNotCalledOnVectorException()
+        def open_stream() -> AsyncIterator[tuple[T, np.ndarray]]:
+            return self.__vector_stream_connection(
+                query_rectangle,
+                keyed_decode,
+                open_timeout=open_timeout,
+                prefetch=prefetch,
+                decoders=decoders,
+                statistics=statistics,
+                geometry_encoding=geometry_encoding,
+            )
+
+        return resumable_feature_stream(open_stream, reconnect, VectorStreamProcessing.filter_features)
+
+    # pylint: disable=too-many-arguments,too-many-positional-arguments
+    async def __vector_stream_connection(
+        self,
+        query_rectangle: QueryRectangle,
+        decode: Callable[[bytes], T | None],
+        open_timeout: int,
+        prefetch: int,
+        decoders: int,
+        statistics: StreamStatistics | None,
+        geometry_encoding: GeometryEncoding,
+    ) -> AsyncIterator[T]:
+        """Stream the (decoded) chunks of a vector query rectangle via a single websocket connection"""
 
         session = get_session()
 
@@ -865,6 +1852,10 @@ class Workflow:
             "timeInterval": query_rectangle.time_str,
         }
 
+        # WKT is the server's default, so the parameter is only sent for the binary encodings
+        if geometry_encoding != GeometryEncoding.WKT:
+            params["geometryEncoding"] = geometry_encoding.value
+
         url = (
             req.Request("GET", url=f"{session.server_url}/workflow/{self.__workflow_id}/vectorStream", params=params)
             .prepare()
@@ -880,96 +1871,226 @@ class Workflow:
             open_timeout=open_timeout,
             max_size=None,  # allow arbitrary large messages, since it is capped by the server's chunk size
         ) as websocket:
-            batch_bytes: bytes | None = None
-
-            while websocket.state == websockets.protocol.State.OPEN:
-
-                async def read_new_bytes() -> bytes | None:
-                    # already send the next request to speed up the process
-                    try:
-                        await websocket.send("NEXT")
-                    except websockets.exceptions.ConnectionClosed:
-                        # the websocket connection is already closed, we cannot read anymore
-                        return None
-
-                    try:
-                        data: str | bytes = await websocket.recv()
-
-                        if isinstance(data, str):
-                            # the server sent an error message
-                            raise GeoEngineException({"error": data})
-
-                        return data
-                    except websockets.exceptions.ConnectionClosedOK:
-                        # the websocket connection closed gracefully, so we stop reading
-                        return None
-
-                (batch_bytes, batch) = await asyncio.gather(
-                    read_new_bytes(),
-                    # asyncio.to_thread(process_bytes, batch_bytes), # TODO: use this when min Python version is 3.9
-                    backports.to_thread(process_bytes, batch_bytes),
-                )
+            async for batch in websocket_frame_stream(
+                websocket,
+                decode,
+                prefetch=prefetch,
+                decoders=decoders,
+                statistics=statistics,
+            ):
+                yield batch
 
-                if batch is not None:
-                    yield batch
+    # pylint: disable=too-many-arguments,too-many-positional-arguments
+    def iter_vector_chunks(
+        self,
+        query_rectangle: QueryRectangle,
+        time_start_column: str = "time_start",
+        time_end_column: str = "time_end",
+        open_timeout: int = 60,
+        prefetch: int = DEFAULT_PREFETCH,
+        decoders: int = DEFAULT_DECODERS,
+        statistics: StreamStatistics | None = None,
+        reconnect: ReconnectPolicy | None = None,
+        buffer_size: int = DEFAULT_PREFETCH,
+        geometry_encoding: GeometryEncoding = GeometryEncoding.WKT,
+        resolve_classifications: bool = False,
+    ) -> Iterator[gpd.GeoDataFrame]:
+        """
+        Iterate synchronously over the chunks of `vector_stream`.
 
-            # process the last tile
-            batch = process_bytes(batch_bytes)
+        The stream runs in a background thread and buffers up to `buffer_size` chunks ahead of the consumer.
+        Breaking out of the iteration closes the stream.
+        """
 
-            if batch is not None:
-                yield batch
+        return iterate_in_background(
+            lambda: self.vector_stream(
+                query_rectangle,
+                time_start_column=time_start_column,
+                time_end_column=time_end_column,
+                open_timeout=open_timeout,
+                prefetch=prefetch,
+                decoders=decoders,
+                statistics=statistics,
+                reconnect=reconnect,
+                geometry_encoding=geometry_encoding,
+                resolve_classifications=resolve_classifications,
+            ),
+            buffer_size=buffer_size,
+        )
 
+    # pylint: disable=too-many-arguments,too-many-positional-arguments
     async def vector_stream_into_geopandas(
         self,
         query_rectangle: QueryRectangle,
         time_start_column: str = "time_start",
         time_end_column: str = "time_end",
         open_timeout: int = 60,
+        geometry_encoding: GeometryEncoding = GeometryEncoding.WKT,
+        resolve_classifications: bool = False,
     ) -> gpd.GeoDataFrame:
         """
         Stream the workflow result into memory and output a single geo data frame.
+        If `resolve_classifications` is true, the class codes of classification columns are resolved
+        to categorical columns of their labels.
 
         NOTE: You can run out of memory if the query rectangle is too large.
         """
 
-        chunk_stream = self.vector_stream(
+        # the chunks are only read, so that they are concatenated and converted once instead of chunk by chunk
+        record_batches = [
+            record_batch
+            async for record_batch in self.__vector_frame_stream(
+                query_rectangle,
+                VectorStreamProcessing.read_arrow_ipc,
+                open_timeout=open_timeout,
+                geometry_encoding=geometry_encoding,
+            )
+        ]
+
+        if not record_batches:
+            return gpd.GeoDataFrame(
+                columns=[time_start_column, time_end_column],
+                geometry=gpd.GeoSeries(),
+                crs=self.__result_descriptor.spatial_reference,
+            )
+
+        return await run_in_decode_executor(
+            VectorStreamProcessing.create_geo_data_frame,
+            VectorStreamProcessing.concat_record_batches(record_batches),
+            time_start_column,
+            time_end_column,
+            self.__classifications() if resolve_classifications else None,
+        )
+
+    # pylint: disable=too-many-arguments,too-many-positional-arguments
+    async def vector_stream_arrow(
+        self,
+        query_rectangle: QueryRectangle,
+        time_start_column: str = "time_start",
+        time_end_column: str = "time_end",
+        open_timeout: int = 60,
+        prefetch: int = DEFAULT_PREFETCH,
+        decoders: int = DEFAULT_DECODERS,
+        statistics: StreamStatistics | None = None,
+        reconnect: ReconnectPolicy | None = None,
+        geometry_encoding: GeometryEncoding = GeometryEncoding.WKT,
+    ) -> AsyncIterator[pa.RecordBatch]:
+        """
+        Stream the workflow result as Arrow record batches, one per chunk of the server.
+
+        The time column is split into the UTC timestamp columns `time_start_column` and `time_end_column`.
+        The geometries stay encoded as `geometry_encoding` in the column `__geometry` and the spatial reference
+        is in the schema metadata under `spatialReference`.
+        Nothing is converted to pandas, so the batches can be written to Parquet or handed to DuckDB as they are.
+        """
+
+        if not self.__result_descriptor.is_vector_result():
+            raise MethodNotCalledOnVectorException()
+
+        async for record_batch in self.__vector_frame_stream(
             query_rectangle,
-            time_start_column=time_start_column,
-            time_end_column=time_end_column,
+            functools.partial(
+                VectorStreamProcessing.process_bytes_into_record_batch,
+                time_start_column=time_start_column,
+                time_end_column=time_end_column,
+            ),
             open_timeout=open_timeout,
+            prefetch=prefetch,
+            decoders=decoders,
+            statistics=statistics,
+            reconnect=reconnect,
+            geometry_encoding=geometry_encoding,
+        ):
+            yield record_batch
+
+    # pylint: disable=too-many-arguments,too-many-positional-arguments
+    def vector_stream_arrow_reader(
+        self,
+        query_rectangle: QueryRectangle,
+        time_start_column: str = "time_start",
+        time_end_column: str = "time_end",
+        open_timeout: int = 60,
+        prefetch: int = DEFAULT_PREFETCH,
+        decoders: int = DEFAULT_DECODERS,
+        statistics: StreamStatistics | None = None,
+        reconnect: ReconnectPolicy | None = None,
+        buffer_size: int = DEFAULT_PREFETCH,
+        geometry_encoding: GeometryEncoding = GeometryEncoding.WKT,
+    ) -> pa.RecordBatchReader:
+        """
+        Read the record batches of `vector_stream_arrow` as a `pyarrow.RecordBatchReader`, e.g., for DuckDB.
+
+        The schema of the reader is the one of the first chunk. Later chunks are cast to it, so a column that
+        has no values in the first chunk (and thus the null type) can only be read with `vector_stream_into_arrow`.
+        The stream runs in a background thread like `iter_vector_chunks`.
+        """
+
+        record_batches = iterate_in_background(
+            lambda: self.vector_stream_arrow(
+                query_rectangle,
+                time_start_column=time_start_column,
+                time_end_column=time_end_column,
+                open_timeout=open_timeout,
+                prefetch=prefetch,
+                decoders=decoders,
+                statistics=statistics,
+                reconnect=reconnect,
+                geometry_encoding=geometry_encoding,
+            ),
+            buffer_size=buffer_size,
         )
 
-        data_frame: gpd.GeoDataFrame | None = None
-        chunk: gpd.GeoDataFrame | None = None
+        first_record_batch = next(record_batches, None)
+
+        if first_record_batch is None:
+            return pa.RecordBatchReader.from_batches(
+                VectorStreamProcessing.empty_schema(
+                    self.__result_descriptor.spatial_reference, time_start_column, time_end_column
+                ),
+                [],
+            )
+
+        schema = first_record_batch.schema
 
-        async def read_dataframe() -> gpd.GeoDataFrame | None:
-            try:
-                return await chunk_stream.__anext__()
-            except StopAsyncIteration:
-                return None
+        def cast_to_schema(record_batch: pa.RecordBatch) -> pa.RecordBatch:
+            return record_batch if record_batch.schema.equals(schema) else record_batch.cast(schema)
 
-        def merge_dataframes(df_a: gpd.GeoDataFrame | None, df_b: gpd.GeoDataFrame | None) -> gpd.GeoDataFrame | None:
-            if df_a is None:
-                return df_b
+        return pa.RecordBatchReader.from_batches(
+            schema, itertools.chain([first_record_batch], map(cast_to_schema, record_batches))
+        )
 
-            if df_b is None:
-                return df_a
+    async def vector_stream_into_arrow(
+        self,
+        query_rectangle: QueryRectangle,
+        time_start_column: str = "time_start",
+        time_end_column: str = "time_end",
+        open_timeout: int = 60,
+        geometry_encoding: GeometryEncoding = GeometryEncoding.WKT,
+    ) -> pa.Table:
+        """
+        Stream the workflow result into memory and output a single Arrow table of the record batches of
+        `vector_stream_arrow`. Columns that are null in some chunks take the type of the other chunks.
 
-            return pd.concat([df_a, df_b], ignore_index=True)
+        NOTE: You can run out of memory if the query rectangle is too large.
+        """
 
-        while True:
-            (chunk, data_frame) = await asyncio.gather(
-                read_dataframe(),
-                backports.to_thread(merge_dataframes, data_frame, chunk),
-                # TODO: use this when min Python version is 3.9
-                # asyncio.to_thread(merge_dataframes, data_frame, chunk),
+        record_batches = [
+            record_batch
+            async for record_batch in self.vector_stream_arrow(
+                query_rectangle,
+                time_start_column=time_start_column,
+                time_end_column=time_end_column,
+                open_timeout=open_timeout,
+                geometry_encoding=geometry_encoding,
             )
+        ]
 
-            # we can stop when the chunk stream is exhausted
-            if chunk is None:
-                break
+        if not record_batches:
+            return VectorStreamProcessing.empty_schema(
+                self.__result_descriptor.spatial_reference, time_start_column, time_end_column
+            ).empty_table()
 
-        return data_frame
+        return VectorStreamProcessing.concat_record_batches(record_batches)
 
     def __replace_http_with_ws(self, url: str) -> str:
         """
@@ -0,0 +1,65 @@
+"""Tests for the decode executor"""
+
+import asyncio
+import unittest
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from datetime import datetime
+
+import numpy as np
+
+import geoengine as ge
+from geoengine.decode_executor import run_in_decode_executor
+from geoengine.workflow import RasterStreamProcessing
+
+from .test_workflow_raster_stream import arrow_bytes, read_data
+
+
+class DecodeExecutorTests(unittest.TestCase):
+    """Test runner for the decode executor"""
+
+    def tearDown(self) -> None:
+        ge.set_decode_executor("thread")
+
+    def test_thread_executor(self):
+        ge.set_decode_executor("thread", max_workers=2)
+
+        self.assertIsInstance(ge.get_decode_executor(), ThreadPoolExecutor)
+
+        result = asyncio.run(run_in_decode_executor(np.arange, 10))
+        np.testing.assert_array_equal(result, np.arange(10))
+
+    def test_process_executor(self):
+        ge.set_decode_executor("process", max_workers=1)
+
+        self.assertIsInstance(ge.get_decode_executor(), ProcessPoolExecutor)
+
+        tile_bytes = arrow_bytes(read_data()[0], ge.TimeInterval(start=datetime(2014, 1, 1)), 0)
+
+        async def inner():
+            return await asyncio.gather(
+                run_in_decode_executor(np.arange, 1_000_000),
+                run_in_decode_executor(RasterStreamProcessing.process_bytes, tile_bytes),
+                run_in_decode_executor(int, "42"),
+            )
+
+        (array, tile, number) = asyncio.run(inner())
+
+        # the array was handed back through shared memory
+        np.testing.assert_array_equal(array, np.arange(1_000_000))
+
+        expected_tile = RasterStreamProcessing.process_bytes(tile_bytes)
+        assert expected_tile is not None
+        self.assertEqual(tile.shape, expected_tile.shape)
+        self.assertEqual(tile.geo_transform, expected_tile.geo_transform)
+        self.assertEqual(tile.time, expected_tile.time)
+        np.testing.assert_array_equal(tile.to_numpy_data_array(), expected_tile.to_numpy_data_array())
+
+        self.assertEqual(number, 42)
+
+    def test_invalid_kind(self):
+        with self.assertRaises(ValueError):
+            ge.set_decode_executor("fibers")  # type: ignore
+
+
+if __name__ == "__main__":
+    unittest.main()
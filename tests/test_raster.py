@@ -1,5 +1,6 @@
 """Tests regarding raster tiles"""
 
+import asyncio
 import json
 import unittest
 from datetime import datetime
@@ -140,3 +141,163 @@ class RasterTests(unittest.TestCase):
         self.assertEqual(raster_tile.has_null_values, self.test_data.has_null_values)
         self.assertEqual(raster_tile.pixel_size, self.test_data.pixel_size)
         self.assertEqual(raster_tile.data, self.test_data.data)
+
+    def test_shared_metadata(self) -> None:
+        """Test that tiles decoded from the same metadata share its parsed objects"""
+        time = np.datetime64(datetime(2020, 1, 1, 0, 0, 0, 0), "ms").astype(np.int64)
+
+        def record_batch(x: float) -> pa.RecordBatch:
+            metadata = {
+                "geoTransform": json.dumps(
+                    {"originCoordinate": {"x": x, "y": 0.0}, "xPixelSize": 1.0, "yPixelSize": -1.0}
+                ),
+                "xSize": "2",
+                "ySize": "2",
+                "spatialReference": "EPSG:4326",
+                "time": json.dumps({"start": int(time), "end": int(time)}),
+                "band": "0",
+            }
+            return pa.RecordBatch.from_arrays([pa.array([1, 2, 3, 4], type=pa.uint8())], ["data"], metadata=metadata)
+
+        first = ge.RasterTile2D.from_ge_record_batch(record_batch(0.0))
+        second = ge.RasterTile2D.from_ge_record_batch(record_batch(2.0))
+        third = ge.RasterTile2D.from_ge_record_batch(record_batch(0.0))
+
+        self.assertIs(first.time, second.time)
+        self.assertIs(first.crs, second.crs)
+        self.assertIsNot(first.geo_transform, second.geo_transform)
+        self.assertIs(first.geo_transform, third.geo_transform)
+        self.assertEqual(second.geo_transform.x_min, 2.0)
+
+        # the tiles have no per-object attribute dictionaries
+        self.assertFalse(hasattr(first, "__dict__"))
+        self.assertFalse(hasattr(first.geo_transform, "__dict__"))
+
+    def test_zero_copy_values_view(self) -> None:
+        """Test that the values of a decoded tile are not copied"""
+        time = np.datetime64(datetime(2020, 1, 1, 0, 0, 0, 0), "ms").astype(np.int64)
+        array = pa.array(np.arange(16, dtype=np.float32))
+        metadata = {
+            "geoTransform": json.dumps(
+                {"originCoordinate": {"x": 0.0, "y": 0.0}, "xPixelSize": 1.0, "yPixelSize": -1.0}
+            ),
+            "xSize": "4",
+            "ySize": "4",
+            "spatialReference": "EPSG:4326",
+            "time": json.dumps({"start": int(time), "end": int(time)}),
+            "band": "0",
+        }
+        batch = pa.RecordBatch.from_arrays([array], names=["data"], metadata=metadata)
+
+        sink = pa.BufferOutputStream()
+        with pa.ipc.new_file(sink, batch.schema) as writer:
+            writer.write_batch(batch)
+        frame = sink.getvalue().to_pybytes()
+
+        tile = ge.workflow.RasterStreamProcessing.process_bytes(frame)
+        assert tile is not None
+
+        values = tile.to_numpy_data_array()
+        self.assertFalse(values.flags.writeable)
+        np.testing.assert_array_equal(values, np.arange(16, dtype=np.float32).reshape(4, 4))
+
+        # the values are a view on the websocket frame
+        frame_view = np.frombuffer(frame, dtype=np.uint8)
+        self.assertTrue(np.shares_memory(values, frame_view))
+
+        self.assertIsNone(tile.to_numpy_mask_array())
+
+    def test_mask_from_validity_bitmap(self) -> None:
+        """Test that the mask matches the null values, also for sliced arrays"""
+        mask = self.test_data.to_numpy_mask_array()
+        assert mask is not None
+        np.testing.assert_array_equal(mask, self.test_data.data.is_null().to_numpy(zero_copy_only=False).reshape(8, 8))
+        self.assertFalse(mask.flags.writeable)
+
+        sliced = ge.RasterTile2D(
+            shape=(4, 4),
+            data=pa.array([1.0, None, np.nan, 4.0] * 5, type=pa.float64()).slice(3, 16),
+            geo_transform=self.test_data.geo_transform,
+            crs="EPSG:4326",
+            time=self.test_data.time,
+            band=0,
+        )
+
+        expected_nulls = np.array([False, False, True, False] * 4).reshape(4, 4)
+        np.testing.assert_array_equal(sliced.to_numpy_mask_array(), expected_nulls)
+        np.testing.assert_array_equal(
+            sliced.to_numpy_mask_array(nan_is_null=True),
+            expected_nulls | np.array([False, False, False, True] * 4).reshape(4, 4),
+        )
+        np.testing.assert_array_equal(sliced.to_numpy_values_view()[0, 0], 4.0)
+
+    def test_tile_stack(self) -> None:
+        """Test that the bands of a stack are contiguous and that its views do not copy them"""
+
+        def band_tile(band: int) -> ge.RasterTile2D:
+            return ge.RasterTile2D(
+                shape=self.test_data.shape,
+                data=self.test_data.data if band == 1 else pa.array(np.full(64, band, dtype=np.uint8)),
+                geo_transform=self.test_data.geo_transform,
+                crs="EPSG:4326",
+                time=self.test_data.time,
+                band=band,
+            )
+
+        async def tiles():
+            for band in [0, 1, 2, 0, 1, 2]:
+                yield band_tile(band)
+
+        async def inner():
+            return [stack async for stack in ge.raster.tile_stream_to_stack_stream(tiles())]
+
+        stacks = asyncio.run(inner())
+        self.assertEqual(len(stacks), 2)
+
+        stack = stacks[0]
+        self.assertEqual(stack.shape, (3, 8, 8))
+        self.assertEqual(stack.bands, [0, 1, 2])
+        self.assertTrue(stack.values.flags.c_contiguous)
+
+        masked = stack.to_numpy_masked_array_stack()
+        self.assertTrue(np.shares_memory(masked.data, stack.values))
+        expected = self.test_data.to_numpy_masked_array()
+        np.testing.assert_array_equal(masked[1].mask, expected.mask)
+        np.testing.assert_array_equal(masked[1].filled(0), expected.filled(0))
+        self.assertFalse(masked[0].mask.any())
+        np.testing.assert_array_equal(masked[2], 2)
+
+        # the bands as Arrow arrays share the stack's memory
+        band = stack.single_band(1)
+        self.assertEqual(band.data.null_count, self.test_data.data.null_count)
+        np.testing.assert_array_equal(band.to_numpy_mask_array(), self.test_data.to_numpy_mask_array())
+        self.assertTrue(np.shares_memory(band.to_numpy_values_view(), stack.values))
+
+        xarray = stack.to_xarray()
+        self.assertEqual(xarray.dims, ("band", "y", "x"))
+        self.assertEqual(list(xarray.band.values), [0, 1, 2])
+        self.assertTrue(np.isnan(xarray.sel(band=1).values[expected.mask]).all())
+        xr_band = stack.single_band(1).to_xarray()
+        np.testing.assert_array_equal(xarray.sel(band=1).values, xr_band.values)
+        np.testing.assert_array_equal(xarray.x.values, xr_band.x.values)
+        np.testing.assert_array_equal(xarray.y.values, xr_band.y.values)
+        self.assertEqual(xarray.rio.crs, xr_band.rio.crs)
+
+        # without nodata, the xarray is a view on the stack
+        unmasked = ge.raster.RasterTileStack2D.from_tiles([band_tile(0), band_tile(2)])
+        self.assertIsNone(unmasked.mask)
+        self.assertTrue(np.shares_memory(unmasked.to_xarray().values, unmasked.values))
+
+        # the Arrow-based construction yields the same stack
+        from_arrow = ge.raster.RasterTileStack2D.from_arrow_bands(
+            self.test_data.shape,
+            [band_tile(band).data for band in [0, 1, 2]],
+            self.test_data.geo_transform,
+            "EPSG:4326",
+            self.test_data.time,
+            [0, 1, 2],
+        )
+        self.assertEqual(from_arrow.bands, [0, 1, 2])
+        np.testing.assert_array_equal(from_arrow.values, stack.values)
+        np.testing.assert_array_equal(from_arrow.mask, stack.mask)
+        self.assertEqual([band.to_pylist() for band in from_arrow.data], [band.to_pylist() for band in stack.data])
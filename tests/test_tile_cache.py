@@ -0,0 +1,196 @@
+"""Tests for the persistent tile cache"""
+
+import asyncio
+import tempfile
+import unittest
+import unittest.mock
+from datetime import datetime
+from pathlib import Path
+from urllib.parse import parse_qs, urlparse
+
+import numpy as np
+
+import geoengine as ge
+from geoengine.raster import tile_stream_to_stack_stream
+
+from .test_workflow_raster_stream import BoundsMockWebsocket, MultiBandMockWebsocket, WorkflowRasterStreamTests
+
+
+def tile_key(tile: ge.RasterTile2D):
+    return (tile.time.start, tile.band, tile.geo_transform.y_max, tile.geo_transform.x_min)
+
+
+class TileCacheTests(unittest.TestCase):
+    """Test runner for the tile cache"""
+
+    def setUp(self) -> None:
+        ge.reset(False)
+        self.workflow = WorkflowRasterStreamTests.mock_workflow(self)  # type: ignore[arg-type]
+        self.directory = tempfile.TemporaryDirectory()  # pylint: disable=consider-using-with
+
+    def tearDown(self) -> None:
+        self.directory.cleanup()
+
+    def query(self, xmax: float) -> ge.QueryRectangle:
+        return ge.QueryRectangle(
+            spatial_bounds=ge.BoundingBox2D(-180.0, -90.0, xmax, 90.0),
+            time_interval=ge.TimeInterval(datetime(2014, 1, 1, 0, 0, 0), datetime(2014, 1, 3, 0, 0, 0)),
+        )
+
+    def stream(
+        self, query: ge.QueryRectangle, cache: ge.TileCache | None, workflow=None, websocket=BoundsMockWebsocket
+    ):
+        workflow = workflow if workflow is not None else self.workflow
+
+        with unittest.mock.patch("websockets.asyncio.client.connect", side_effect=websocket) as connect:
+
+            async def inner():
+                return [tile async for tile in workflow.raster_stream(query, cache=cache)]
+
+            tiles = asyncio.run(inner())
+
+        requested_bounds = [
+            parse_qs(urlparse(call.kwargs["uri"]).query)["spatialBounds"][0] for call in connect.call_args_list
+        ]
+
+        return tiles, requested_bounds
+
+    def test_cached_stream(self):
+        cache = ge.TileCache(Path(self.directory.name) / "cache.sqlite", tile_size=4)
+
+        (uncached, _) = self.stream(self.query(180.0), None)
+        (first, first_requests) = self.stream(self.query(180.0), cache)
+        (second, second_requests) = self.stream(self.query(180.0), cache)
+
+        self.assertEqual(len(first_requests), 1)
+        self.assertEqual(second_requests, [])
+
+        self.assertEqual(list(map(tile_key, first)), list(map(tile_key, uncached)))
+        self.assertEqual(list(map(tile_key, second)), list(map(tile_key, uncached)))
+        for cached_tile, tile in zip(second, uncached, strict=True):
+            np.testing.assert_array_equal(cached_tile.to_numpy_data_array(), tile.to_numpy_data_array())
+
+        self.assertGreater(cache.size, 0)
+
+        # another process sees the cached tiles
+        other_cache = ge.TileCache(Path(self.directory.name) / "cache.sqlite", tile_size=4)
+        (_, other_requests) = self.stream(self.query(180.0), other_cache)
+        self.assertEqual(other_requests, [])
+
+        cache.close()
+        other_cache.close()
+
+    def test_partially_cached_stream(self):
+        cache = ge.TileCache(Path(self.directory.name) / "cache.sqlite", tile_size=4)
+
+        # cache the left column of tiles
+        self.stream(self.query(-10.0), cache)
+
+        (uncached, _) = self.stream(self.query(180.0), None)
+        (tiles, requests) = self.stream(self.query(180.0), cache)
+
+        # only the right column of tiles is requested
+        self.assertEqual(requests, ["0.0,-90.0,180.0,90.0"])
+        self.assertEqual(list(map(tile_key, tiles)), list(map(tile_key, uncached)))
+
+        cache.close()
+
+    def test_partially_cached_stream_with_bands(self):
+        cache = ge.TileCache(Path(self.directory.name) / "cache.sqlite", tile_size=4)
+        workflow = WorkflowRasterStreamTests.mock_workflow(self, bands=2)  # type: ignore[arg-type]
+
+        def stream(query: ge.QueryRectangle, cache: ge.TileCache | None):
+            return self.stream(query, cache, workflow=workflow, websocket=MultiBandMockWebsocket)
+
+        # cache the left column of tiles
+        stream(self.query(-10.0), cache)
+
+        (uncached, _) = stream(self.query(180.0), None)
+        (tiles, requests) = stream(self.query(180.0), cache)
+
+        self.assertEqual(requests, ["0.0,-90.0,180.0,90.0"])
+
+        # the cached and the queried tiles are merged in the order of the server: time, tile and then band
+        def server_order(tile: ge.RasterTile2D):
+            return (tile.time.start, -tile.geo_transform.y_max, tile.geo_transform.x_min, tile.band)
+
+        self.assertEqual(len(tiles), 16)
+        self.assertEqual(list(map(server_order, tiles)), list(map(server_order, uncached)))
+
+        async def stack(tiles):
+            async def tile_stream():
+                for tile in tiles:
+                    yield tile
+
+            return [stack async for stack in tile_stream_to_stack_stream(tile_stream())]
+
+        stacks = asyncio.run(stack(tiles))
+        self.assertEqual(len(stacks), 8)
+        self.assertTrue(all(stack.bands == [0, 1] for stack in stacks))
+
+        cache.close()
+
+    def test_partially_cached_stream_with_small_cache(self):
+        cache = ge.TileCache(Path(self.directory.name) / "cache.sqlite", tile_size=4)
+        self.stream(self.query(-10.0), cache)
+        column_size = cache.size
+        cache.close()
+
+        # the cache only holds the left column of tiles, so the fetched tiles of the right column evict them
+        cache = ge.TileCache(Path(self.directory.name) / "small.sqlite", max_size=column_size, tile_size=4)
+        self.stream(self.query(-10.0), cache)
+
+        (uncached, _) = self.stream(self.query(180.0), None)
+        (tiles, requests) = self.stream(self.query(180.0), cache)
+
+        # the cached tiles of the stream are not evicted before they are read
+        self.assertEqual(requests, ["0.0,-90.0,180.0,90.0"])
+        self.assertEqual(list(map(tile_key, tiles)), list(map(tile_key, uncached)))
+        for cached_tile, tile in zip(tiles, uncached, strict=True):
+            np.testing.assert_array_equal(cached_tile.to_numpy_data_array(), tile.to_numpy_data_array())
+        self.assertLessEqual(cache.size, column_size)
+
+        cache.close()
+
+    def test_cached_stream_evicted_by_other_process(self):
+        cache = ge.TileCache(Path(self.directory.name) / "cache.sqlite", tile_size=4)
+
+        # cache the left column of tiles
+        self.stream(self.query(-10.0), cache)
+
+        (uncached, _) = self.stream(self.query(180.0), None)
+
+        # another process evicts the cached tiles after the stream found them
+        with unittest.mock.patch.object(cache, "get_frame", return_value=None):
+            (tiles, requests) = self.stream(self.query(180.0), cache)
+
+        # the cells of the evicted tiles are queried from the server again
+        self.assertEqual(requests, ["0.0,-90.0,180.0,90.0", "-180.0,0.0,0.0,90.0", "-180.0,-90.0,0.0,0.0"])
+        self.assertEqual(list(map(tile_key, tiles)), list(map(tile_key, uncached)))
+        for cached_tile, tile in zip(tiles, uncached, strict=True):
+            np.testing.assert_array_equal(cached_tile.to_numpy_data_array(), tile.to_numpy_data_array())
+
+        cache.close()
+
+    def test_eviction(self):
+        cache = ge.TileCache(Path(self.directory.name) / "cache.sqlite", tile_size=4)
+        self.stream(self.query(180.0), cache)
+        tile_frame_size = cache.size // 8
+        cache.close()
+
+        cache = ge.TileCache(Path(self.directory.name) / "small.sqlite", max_size=3 * tile_frame_size, tile_size=4)
+
+        (tiles, _) = self.stream(self.query(180.0), cache)
+        self.assertEqual(len(tiles), 8)
+        self.assertLessEqual(cache.size, 3 * tile_frame_size)
+
+        # evicted tiles are queried again
+        (tiles, requests) = self.stream(self.query(180.0), cache)
+        self.assertEqual(len(tiles), 8)
+        self.assertEqual(len(requests), 1)
+
+        cache.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
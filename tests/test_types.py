@@ -181,6 +181,20 @@ class TypesTests(unittest.TestCase):
         self.assertEqual(x, 150.0)
         self.assertEqual(y, 100.0)
 
+    def test_regular_time_dimension_time_steps(self):
+        """Test counting the time steps of a regular time dimension that intersect a time interval."""
+
+        days = ge.RegularTimeDimension(ge.TimeStep(1, "days"))
+        self.assertEqual(days.num_time_steps(ge.TimeInterval(datetime(2014, 1, 1), datetime(2014, 1, 3))), 2)
+        self.assertEqual(days.num_time_steps(ge.TimeInterval(datetime(2014, 1, 1, 12), datetime(2014, 1, 3, 1))), 3)
+        self.assertEqual(days.num_time_steps(ge.TimeInterval(datetime(2014, 1, 1, 12))), 1)
+
+        months = ge.RegularTimeDimension(ge.TimeStep(1, "months"), np.datetime64("2014-01-15"))
+        self.assertEqual(months.num_time_steps(ge.TimeInterval(datetime(2014, 1, 1), datetime(2014, 4, 1))), 4)
+
+        years = ge.RegularTimeDimension(ge.TimeStep(2, "years"), np.datetime64("2000-01-01"))
+        self.assertEqual(years.num_time_steps(ge.TimeInterval(datetime(2014, 1, 1), datetime(2018, 1, 1))), 2)
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -2,17 +2,31 @@
 
 import asyncio
 import json
+import tempfile
 import unittest
 import unittest.mock
 from datetime import datetime
+from pathlib import Path
+from urllib.parse import parse_qs, urlparse
 from uuid import UUID
 
+import geopandas as gpd
+import numpy as np
 import pyarrow as pa
 import rioxarray
+import websockets.exceptions
 import websockets.protocol
 import xarray as xr
 
 import geoengine as ge
+from geoengine.raster import tile_stream_to_stack_stream
+from geoengine.raster_mosaic import (
+    MosaicGrid,
+    MosaicTimeStack,
+    RasterMosaic,
+    concatenate_time_chunks,
+    time_chunked_data,
+)
 from geoengine.types import RasterBandDescriptor
 
 from . import UrllibMocker
@@ -42,6 +56,9 @@ class MockWebsocket:
         return websockets.protocol.State.OPEN if len(self.__tiles) > 0 else websockets.protocol.State.CLOSED
 
     async def recv(self):
+        if len(self.__tiles) == 0:
+            # the server closes the connection after the last tile
+            raise websockets.exceptions.ConnectionClosedOK(None, None)
         return self.__tiles.pop()
 
     async def send(self, *args):
@@ -51,6 +68,125 @@ class MockWebsocket:
         pass
 
 
+class BoundsMockWebsocket(MockWebsocket):
+    """Mock for websockets.client.connect that only returns the tiles intersecting the requested bounds"""
+
+    def __init__(self, uri: str, **_kwargs):
+        """Create a mock websocket with the data of the requested bounds in the order of the Geo Engine"""
+
+        super().__init__()
+
+        (xmin, ymin, xmax, ymax) = map(float, parse_qs(urlparse(uri).query)["spatialBounds"][0].split(","))
+
+        # the Geo Engine returns the tiles of a time step in row-major order
+        row_major_tiles = sorted(read_data(), key=lambda tile: (-tile.rio.bounds()[3], tile.rio.bounds()[0]))
+
+        self.tiles = []
+        for time in [datetime(2014, 1, 1, 0, 0, 0), datetime(2014, 1, 2, 0, 0, 0)]:
+            for tile in row_major_tiles:
+                (tile_xmin, tile_ymin, tile_xmax, tile_ymax) = tile.rio.bounds()
+                if tile_xmin < xmax and xmin < tile_xmax and tile_ymin < ymax and ymin < tile_ymax:
+                    self.tiles.append(arrow_bytes(tile, ge.TimeInterval(start=time), 0))
+
+    @property
+    def state(self) -> websockets.protocol.State:
+        """Mock open impl"""
+        return websockets.protocol.State.OPEN if len(self.tiles) > 0 else websockets.protocol.State.CLOSED
+
+    async def recv(self):
+        if len(self.tiles) == 0:
+            # the server closes the connection after the last tile
+            raise websockets.exceptions.ConnectionClosedOK(None, None)
+        return self.tiles.pop(0)
+
+
+class MultiBandMockWebsocket(BoundsMockWebsocket):
+    """Mock for websockets.client.connect that returns two bands in the order of the Geo Engine"""
+
+    def __init__(self, uri: str, **kwargs):
+        """Create a mock websocket with the tiles ordered by time, then by position (row-major) and then by band"""
+
+        super().__init__(uri, **kwargs)
+
+        (xmin, ymin, xmax, ymax) = map(float, parse_qs(urlparse(uri).query)["spatialBounds"][0].split(","))
+
+        row_major_tiles = sorted(read_data(), key=lambda tile: (-tile.rio.bounds()[3], tile.rio.bounds()[0]))
+
+        self.tiles = []
+        for time in [datetime(2014, 1, 1, 0, 0, 0), datetime(2014, 1, 2, 0, 0, 0)]:
+            for tile in row_major_tiles:
+                (tile_xmin, tile_ymin, tile_xmax, tile_ymax) = tile.rio.bounds()
+                if tile_xmin < xmax and xmin < tile_xmax and tile_ymin < ymax and ymin < tile_ymax:
+                    for band in [0, 1]:
+                        self.tiles.append(arrow_bytes(tile + band, ge.TimeInterval(start=time), band))
+
+
+class StallingMockWebsocket(BoundsMockWebsocket):
+    """Mock for websockets.client.connect that stops sending after the four tiles of the first time step"""
+
+    async def recv(self):
+        if len(self.tiles) <= 4:
+            await asyncio.Event().wait()
+        return await super().recv()
+
+
+class DroppingMockWebsocket(BoundsMockWebsocket):
+    """Mock for websockets.client.connect whose connection drops after some tiles"""
+
+    def __init__(self, uri: str, drop_after: int, **kwargs):
+        super().__init__(uri, **kwargs)
+        self.__remaining = drop_after
+
+    async def recv(self):
+        if self.__remaining == 0:
+            raise websockets.exceptions.ConnectionClosedError(None, None)
+        self.__remaining -= 1
+        return await super().recv()
+
+
+class NextOnlyMockWebsocket(BoundsMockWebsocket):
+    """Mock for websockets.client.connect that, like the Geo Engine, only sends a tile after a `NEXT` request"""
+
+    def __init__(self, uri: str, **kwargs):
+        super().__init__(uri, **kwargs)
+        self.requests = asyncio.Semaphore(0)
+
+    async def recv(self):
+        if len(self.tiles) > 0:
+            await self.requests.acquire()
+        return await super().recv()
+
+    async def send(self, *args):
+        self.requests.release()
+
+
+class DroppingNextOnlyMockWebsocket(NextOnlyMockWebsocket):
+    """Mock for websockets.client.connect that only answers `NEXT` requests and drops after some tiles"""
+
+    def __init__(self, uri: str, drop_after: int, **kwargs):
+        super().__init__(uri, **kwargs)
+        self.__remaining = drop_after
+
+    async def recv(self):
+        if self.__remaining == 0:
+            raise websockets.exceptions.ConnectionClosedError(None, None)
+        self.__remaining -= 1
+        return await super().recv()
+
+
+class SparseMockWebsocket(BoundsMockWebsocket):
+    """Mock for websockets.client.connect whose tiles of the second day are empty"""
+
+    def __init__(self, uri: str, **kwargs):
+        super().__init__(uri, **kwargs)
+
+        first_day = len(self.tiles) // 2
+        self.tiles = self.tiles[:first_day] + [
+            arrow_bytes(tile, ge.TimeInterval(start=datetime(2014, 1, 2, 0, 0, 0)), 0, empty=True)
+            for tile in read_data()
+        ]
+
+
 def read_data() -> list[xr.DataArray]:
     """Slice a raster into 4 parts"""
     whole = rioxarray.open_rasterio("tests/responses/ndvi.tiff")
@@ -70,10 +206,11 @@ def read_data() -> list[xr.DataArray]:
     return parts
 
 
-def arrow_bytes(data: xr.DataArray, time: ge.TimeInterval, band: int) -> bytes:
-    """Convert a xarray.DataArray into an Arrow record batch within an IPC file"""
+def arrow_bytes(data: xr.DataArray, time: ge.TimeInterval, band: int, empty: bool = False) -> bytes:
+    """Convert a xarray.DataArray into an Arrow record batch within an IPC file, optionally with only nodata"""
 
-    array = pa.array(data.to_numpy().reshape(-1))
+    values = data.to_numpy().reshape(-1)
+    array = pa.array(values, mask=np.ones(values.shape, dtype=np.bool_) if empty else None)
     batch = pa.RecordBatch.from_arrays([array], ["data"])
     schema = batch.schema.with_metadata(
         {
@@ -114,7 +251,8 @@ class WorkflowRasterStreamTests(unittest.TestCase):
     def setUp(self) -> None:
         ge.reset(False)
 
-    def test_streaming_workflow(self):
+    def mock_workflow(self, time_dimension=None, bands=1):
+        """Create a raster workflow with the result descriptor of the test data"""
         with UrllibMocker() as m:
             m.get(
                 "http://localhost:3030/session",
@@ -128,7 +266,7 @@ class WorkflowRasterStreamTests(unittest.TestCase):
             "geoengine.Workflow._Workflow__query_result_descriptor",
             return_value=ge.RasterResultDescriptor(
                 "U8",
-                [RasterBandDescriptor("band", ge.UnitlessMeasurement())],
+                [RasterBandDescriptor(f"band{i}" if i > 0 else "band", ge.UnitlessMeasurement()) for i in range(bands)],
                 "EPSG:4326",
                 spatial_grid=ge.SpatialGridDescriptor(
                     descriptor="source",
@@ -139,10 +277,19 @@ class WorkflowRasterStreamTests(unittest.TestCase):
                         ),
                     ),
                 ),
-                time=ge.TimeDescriptor(dimension=ge.IrregularTimeDimension(), bounds=None),
+                time=ge.TimeDescriptor(
+                    dimension=ge.IrregularTimeDimension() if time_dimension is None else time_dimension, bounds=None
+                ),
             ),
         ):
-            workflow = ge.Workflow(UUID("00000000-0000-0000-0000-000000000000"))
+            return ge.Workflow(UUID("00000000-0000-0000-0000-000000000000"))
+
+    @staticmethod
+    async def collect(stream):
+        return [item async for item in stream]
+
+    def test_streaming_workflow(self):
+        workflow = self.mock_workflow()
 
         query_rect = ge.QueryRectangle(
             spatial_bounds=ge.BoundingBox2D(-180.0, -90.0, 180.0, 90.0),
@@ -175,3 +322,708 @@ class WorkflowRasterStreamTests(unittest.TestCase):
                 assert array.isel({"band": 0, "time": 0}, drop=True).equals(original_array)
 
             asyncio.run(inner2())
+
+    def test_streaming_workflow_into_numpy_and_clip(self):
+        workflow = self.mock_workflow()
+
+        query_rect = ge.QueryRectangle(
+            spatial_bounds=ge.BoundingBox2D(-170.0, -80.0, -10.0, 80.0),
+            time_interval=ge.TimeInterval(datetime(2014, 1, 1, 0, 0, 0), datetime(2014, 1, 3, 0, 0, 0)),
+        )
+
+        original_array = rioxarray.open_rasterio("tests/responses/ndvi.tiff").isel(band=0, drop=True)
+
+        with unittest.mock.patch("websockets.asyncio.client.connect", side_effect=BoundsMockWebsocket):
+
+            async def inner():
+                return (
+                    await workflow.raster_stream_into_numpy(query_rect),
+                    await workflow.raster_stream_into_xarray(query_rect, clip_to_query_rectangle=True),
+                )
+
+            (array, clipped) = asyncio.run(inner())
+
+        # the left column of tiles
+        self.assertEqual(array.shape, (2, 1, 8, 4))
+        self.assertEqual(array.dtype, np.uint8)
+        self.assertFalse(array.mask.any())
+        np.testing.assert_array_equal(array.data[0, 0], original_array.to_numpy()[:, :4])
+
+        # the pixels that intersect the query rectangle
+        self.assertEqual(clipped.shape, (2, 1, 8, 4))
+        self.assertTrue(clipped.isel({"band": 0, "time": 0}, drop=True).equals(original_array.isel(x=slice(0, 4))))
+
+    def test_streaming_workflow_into_time_stack(self):
+        regular_workflow = self.mock_workflow(ge.RegularTimeDimension(ge.TimeStep(1, "days")))
+        irregular_workflow = self.mock_workflow()
+
+        query_rect = ge.QueryRectangle(
+            spatial_bounds=ge.BoundingBox2D(-180.0, -90.0, 180.0, 90.0),
+            time_interval=ge.TimeInterval(datetime(2014, 1, 1, 0, 0, 0), datetime(2014, 1, 3, 0, 0, 0)),
+        )
+
+        with unittest.mock.patch("websockets.asyncio.client.connect", side_effect=BoundsMockWebsocket):
+
+            async def inner():
+                return (
+                    await regular_workflow.raster_stream_into_xarray(query_rect),
+                    await irregular_workflow.raster_stream_into_xarray(query_rect),
+                    await irregular_workflow.raster_stream_into_numpy(query_rect),
+                )
+
+            (regular, irregular, array) = asyncio.run(inner())
+
+        self.assertEqual(regular.shape, (2, 1, 8, 8))
+        self.assertTrue(regular.equals(irregular))
+        np.testing.assert_array_equal(regular.to_numpy(), array.data)
+        self.assertEqual(
+            list(regular.time.to_numpy()), [np.datetime64("2014-01-01", "ns"), np.datetime64("2014-01-02", "ns")]
+        )
+
+        grid = MosaicGrid(ge.GeoTransform(0.0, 2.0, 1.0, -1.0), width=2, height=2)
+
+        # a preallocated stack is allocated once and returned without copying
+        stack = MosaicTimeStack([0], np.dtype(np.float32), with_mask=False, expected_time_steps=3)
+        first = stack.allocate(grid, ge.TimeInterval(np.datetime64("2014-01-01")), "EPSG:4326")
+        second = stack.allocate(grid, ge.TimeInterval(np.datetime64("2014-01-02")), "EPSG:4326")
+        self.assertIs(first.data.base, second.data.base)
+        (_, data_chunks, mask_chunks) = stack.finish(grid)
+        self.assertEqual(len(data_chunks), 1)
+        self.assertEqual(data_chunks[0].shape, (2, 1, 2, 2))
+        self.assertIs(data_chunks[0].base, first.data.base)
+        self.assertIsNone(mask_chunks)
+        self.assertTrue(np.isnan(data_chunks[0]).all())
+
+        # a growing stack adds geometrically growing chunks and never copies a time step
+        stack = MosaicTimeStack([0], np.dtype(np.uint8), with_mask=False)
+        mosaics = [
+            stack.allocate(grid, ge.TimeInterval(np.datetime64(f"2014-01-0{day}")), "EPSG:4326") for day in range(1, 6)
+        ]
+        for day, mosaic in enumerate(mosaics, start=1):
+            mosaic.data[...] = day
+            mosaic.mask[...] = False  # type: ignore[index]
+        (_, data_chunks, mask_chunks) = stack.finish(grid)
+        self.assertEqual([len(chunk) for chunk in data_chunks], [1, 1, 2, 1])
+        # the chunks start with the time steps 0, 1, 2 and 4
+        chunk_mosaics = [mosaics[0], mosaics[1], mosaics[2], mosaics[4]]
+        self.assertTrue(
+            all(np.shares_memory(chunk, mosaic.data) for chunk, mosaic in zip(data_chunks, chunk_mosaics, strict=True))
+        )
+        np.testing.assert_array_equal(concatenate_time_chunks(data_chunks)[:, 0, 0, 0], [1, 2, 3, 4, 5])
+        self.assertFalse(concatenate_time_chunks(mask_chunks).any())  # type: ignore[arg-type]
+
+        # xarray concatenates the chunks lazily and selects within a chunk without copying
+        lazy = xr.DataArray(time_chunked_data(data_chunks), dims=["time", "band", "y", "x"])
+        self.assertEqual(lazy.shape, (5, 1, 2, 2))
+        self.assertTrue(np.shares_memory(lazy.isel(time=slice(2, 4)).values, mosaics[2].data))
+        self.assertTrue(np.shares_memory(lazy.isel(time=4).values, mosaics[4].data))
+        np.testing.assert_array_equal(lazy.isel(band=0, y=0, x=0).values, [1, 2, 3, 4, 5])
+        np.testing.assert_array_equal(lazy.isel(time=slice(None, None, -2)).values[:, 0, 0, 0], [5, 3, 1])
+        np.testing.assert_array_equal(lazy.isel(time=slice(3, 1, -1)).values[:, 0, 0, 0], [4, 3])
+        np.testing.assert_array_equal(lazy.isel(time=[4, 0]).values[:, 0, 0, 0], [5, 1])
+
+    def test_streaming_timesteps(self):
+        workflow = self.mock_workflow()
+
+        query_rect = ge.QueryRectangle(
+            spatial_bounds=ge.BoundingBox2D(-180.0, -90.0, 180.0, 90.0),
+            time_interval=ge.TimeInterval(datetime(2014, 1, 1, 0, 0, 0), datetime(2014, 1, 3, 0, 0, 0)),
+        )
+
+        with unittest.mock.patch("websockets.asyncio.client.connect", side_effect=BoundsMockWebsocket):
+
+            async def inner():
+                return (
+                    await self.collect(workflow.raster_stream_timesteps(query_rect)),
+                    await workflow.raster_stream_into_xarray(query_rect),
+                )
+
+            (mosaics, array) = asyncio.run(inner())
+
+        self.assertEqual(len(mosaics), 2)
+        for time_idx, mosaic in enumerate(mosaics):
+            self.assertTrue(mosaic.to_xarray().equals(array.isel(time=time_idx)))
+
+        # a time step is yielded once its last tile arrived, without waiting for the next time step
+        with unittest.mock.patch("websockets.asyncio.client.connect", side_effect=StallingMockWebsocket):
+
+            async def first_time_step():
+                stream = workflow.raster_stream_timesteps(query_rect)
+                mosaic = await asyncio.wait_for(anext(stream), timeout=10)
+                await stream.aclose()
+                return mosaic
+
+            mosaic = asyncio.run(first_time_step())
+
+        self.assertEqual(mosaic.time, ge.TimeInterval(datetime(2014, 1, 1, 0, 0, 0)))
+        self.assertTrue(mosaic.to_xarray().equals(array.isel(time=0)))
+
+    def test_streaming_workflow_into_zarr(self):
+        workflow = self.mock_workflow()
+
+        query_rect = ge.QueryRectangle(
+            spatial_bounds=ge.BoundingBox2D(-180.0, -90.0, 180.0, 90.0),
+            time_interval=ge.TimeInterval(datetime(2014, 1, 1, 0, 0, 0), datetime(2014, 1, 3, 0, 0, 0)),
+        )
+
+        with (
+            tempfile.TemporaryDirectory() as directory,
+            unittest.mock.patch("websockets.asyncio.client.connect", side_effect=BoundsMockWebsocket),
+        ):
+            asyncio.run(workflow.raster_stream_into_zarr(query_rect, directory))
+
+            store = Path(directory)
+
+            zarray = json.loads((store / "data" / ".zarray").read_text())
+            self.assertEqual(zarray["shape"], [2, 1, 8, 8])
+            self.assertEqual(zarray["chunks"], [1, 1, 4, 4])
+            self.assertEqual(zarray["dtype"], "|u1")
+
+            zattrs = json.loads((store / "data" / ".zattrs").read_text())
+            self.assertEqual(zattrs["_ARRAY_DIMENSIONS"], ["time", "band", "y", "x"])
+            self.assertEqual(zattrs["grid_mapping"], "spatial_ref")
+
+            zmetadata = json.loads((store / ".zmetadata").read_text())
+            self.assertEqual(zmetadata["metadata"]["data/.zarray"], zarray)
+            self.assertIn("crs_wkt", zmetadata["metadata"]["spatial_ref/.zattrs"])
+
+            # reassemble the first time step from its chunks
+            first_time_step = np.block(
+                [
+                    [
+                        np.frombuffer((store / "data" / f"0.0.{y}.{x}").read_bytes(), dtype=np.uint8).reshape(4, 4)
+                        for x in range(2)
+                    ]
+                    for y in range(2)
+                ]
+            )
+
+            times = np.frombuffer((store / "time" / "0").read_bytes(), dtype=np.int64)
+            x_coords = np.frombuffer((store / "x" / "0").read_bytes(), dtype=np.float64)
+
+        original_array = rioxarray.open_rasterio("tests/responses/ndvi.tiff").isel(band=0, drop=True)
+
+        np.testing.assert_array_equal(first_time_step, original_array.to_numpy())
+        np.testing.assert_array_equal(x_coords, original_array.x.to_numpy())
+        np.testing.assert_array_equal(
+            times.astype("datetime64[ms]"), np.array(["2014-01-01", "2014-01-02"], dtype="datetime64[ms]")
+        )
+
+    def test_streaming_workflow_into_memmap(self):
+        workflow = self.mock_workflow()
+
+        query_rect = ge.QueryRectangle(
+            spatial_bounds=ge.BoundingBox2D(-180.0, -90.0, 180.0, 90.0),
+            time_interval=ge.TimeInterval(datetime(2014, 1, 1, 0, 0, 0), datetime(2014, 1, 3, 0, 0, 0)),
+        )
+
+        original_array = rioxarray.open_rasterio("tests/responses/ndvi.tiff").isel(band=0, drop=True)
+
+        with (
+            tempfile.TemporaryDirectory() as directory,
+            unittest.mock.patch("websockets.asyncio.client.connect", side_effect=BoundsMockWebsocket),
+        ):
+            path = Path(directory) / "raster.bin"
+
+            result = asyncio.run(workflow.raster_stream_into_memmap(query_rect, path))
+
+            self.assertIsInstance(result.array, np.memmap)
+            self.assertEqual(result.array.shape, (2, 1, 8, 8))
+            self.assertEqual(result.array.dtype, np.uint8)
+            self.assertEqual(path.stat().st_size, 2 * 8 * 8)
+            np.testing.assert_array_equal(result.array[1, 0], original_array.to_numpy())
+
+            del result.array
+
+        self.assertEqual(
+            result.geo_transform, ge.GeoTransform(x_min=-180.0, y_max=90.0, x_pixel_size=45.0, y_pixel_size=-22.5)
+        )
+        np.testing.assert_array_equal(result.time, np.array(["2014-01-01", "2014-01-02"], dtype="datetime64[ms]"))
+        self.assertEqual(result.bands, [0])
+        self.assertEqual(result.crs, "EPSG:4326")
+
+    def test_mosaic_with_nodata(self):
+        geo_transform = ge.GeoTransform(x_min=-180.0, y_max=90.0, x_pixel_size=45.0, y_pixel_size=-22.5)
+        time = ge.TimeInterval(datetime(2014, 1, 1, 0, 0, 0))
+        tile = ge.RasterTile2D(
+            shape=(2, 2),
+            data=pa.array([None, 2, 3, 4], type=pa.uint8()),
+            geo_transform=ge.GeoTransform(x_min=-135.0, y_max=67.5, x_pixel_size=45.0, y_pixel_size=-22.5),
+            crs="EPSG:4326",
+            time=time,
+            band=0,
+        )
+
+        # the grid starts one pixel left of the tile and ends one pixel before its right column
+        grid = MosaicGrid.from_bounds(geo_transform, ge.BoundingBox2D(-170.0, 30.0, -100.0, 60.0))
+        self.assertEqual(grid.shape, (2, 2))
+        self.assertEqual(grid.geo_transform.x_min, -180.0)
+
+        mosaic = RasterMosaic.allocate(grid, time, [0], "EPSG:4326", np.dtype(np.uint8), with_mask=False)
+        mosaic.add_tile(tile)
+
+        masked = mosaic.to_numpy_masked_array()
+        np.testing.assert_array_equal(masked.mask[0], [[True, True], [True, False]])
+        self.assertEqual(masked.data[0, 1, 1], 3)
+
+        # uncovered and null pixels become NaN
+        array = mosaic.to_xarray()
+        self.assertEqual(array.dtype, np.float32)
+        np.testing.assert_array_equal(array.isel(band=0).to_numpy(), [[np.nan, np.nan], [np.nan, 3.0]])
+
+    def test_empty_tiles(self):
+        workflow = self.mock_workflow()
+
+        query_rect = ge.QueryRectangle(
+            spatial_bounds=ge.BoundingBox2D(-180.0, -90.0, 180.0, 90.0),
+            time_interval=ge.TimeInterval(datetime(2014, 1, 1, 0, 0, 0), datetime(2014, 1, 3, 0, 0, 0)),
+        )
+
+        statistics = ge.StreamStatistics()
+        skipped_statistics = ge.StreamStatistics()
+        reduced_statistics = ge.StreamStatistics()
+
+        with unittest.mock.patch("websockets.asyncio.client.connect", side_effect=SparseMockWebsocket):
+
+            async def inner():
+                return (
+                    await self.collect(workflow.raster_stream(query_rect, statistics=statistics)),
+                    await self.collect(
+                        workflow.raster_stream(query_rect, statistics=skipped_statistics, skip_empty=True)
+                    ),
+                    await workflow.raster_stream_into_numpy(query_rect),
+                    await workflow.raster_stream_statistics(query_rect, stats=["count"], statistics=reduced_statistics),
+                )
+
+            (tiles, non_empty_tiles, array, band_statistics) = asyncio.run(inner())
+
+        self.assertEqual(len(tiles), 8)
+        self.assertEqual(statistics.empty_tiles, 4)
+        self.assertEqual(len(non_empty_tiles), 4)
+        self.assertEqual(skipped_statistics.empty_tiles, 4)
+        self.assertEqual(reduced_statistics.empty_tiles, 4)
+        self.assertEqual(list(band_statistics["count"].values[:, 0]), [64, 0])
+        self.assertFalse(any(tile.is_empty() for tile in non_empty_tiles))
+
+        empty_tile = tiles[-1]
+        self.assertTrue(empty_tile.is_empty())
+        self.assertTrue(empty_tile.to_numpy_mask_array().all())
+        np.testing.assert_array_equal(empty_tile.to_numpy_data_array(7), np.full((4, 4), 7))
+
+        # the empty time step is still part of the mosaics
+        self.assertEqual(array.shape, (2, 1, 8, 8))
+        self.assertFalse(array.mask[0].any())
+        self.assertTrue(array.mask[1].all())
+
+    def test_tile_grid_index(self):
+        workflow = self.mock_workflow()
+
+        query_rect = ge.QueryRectangle(
+            spatial_bounds=ge.BoundingBox2D(-180.0, -90.0, 180.0, 90.0),
+            time_interval=ge.TimeInterval(datetime(2014, 1, 1, 0, 0, 0), datetime(2014, 1, 3, 0, 0, 0)),
+        )
+
+        with unittest.mock.patch("websockets.asyncio.client.connect", side_effect=BoundsMockWebsocket):
+            tiles = asyncio.run(self.collect(workflow.raster_stream(query_rect)))
+
+        # the grid of the result has its origin at (-180, 90)
+        self.assertEqual(
+            [(tile.pixel_idx.x_idx, tile.pixel_idx.y_idx) for tile in tiles[:4] if tile.pixel_idx is not None],
+            [(0, 0), (4, 0), (0, 4), (4, 4)],
+        )
+        self.assertEqual(tiles[3].tile_idx, ge.GridIdx2D(x_idx=1, y_idx=1))
+
+        grid = MosaicGrid.from_bounds(
+            ge.GeoTransform(x_min=-180.0, y_max=90.0, x_pixel_size=45.0, y_pixel_size=-22.5),
+            ge.BoundingBox2D(-135.0, -90.0, 180.0, 67.5),
+        )
+        self.assertEqual(grid.pixel_idx, ge.GridIdx2D(x_idx=1, y_idx=1))
+        self.assertEqual(grid.tile_offset(tiles[3]), (3, 3))
+        self.assertEqual(grid.tile_offset(tiles[3]), grid.pixel_offset(tiles[3].geo_transform))
+
+    def test_streaming_statistics(self):
+        workflow = self.mock_workflow()
+
+        query_rect = ge.QueryRectangle(
+            spatial_bounds=ge.BoundingBox2D(-170.0, -80.0, 100.0, 80.0),
+            time_interval=ge.TimeInterval(datetime(2014, 1, 1, 0, 0, 0), datetime(2014, 1, 3, 0, 0, 0)),
+        )
+        histogram_bins = ge.HistogramBins(8, (0.0, 256.0))
+
+        with unittest.mock.patch("websockets.asyncio.client.connect", side_effect=BoundsMockWebsocket):
+
+            async def inner():
+                return (
+                    await workflow.raster_stream_statistics(
+                        query_rect,
+                        stats=["count", "min", "max", "mean", "std", "histogram"],
+                        histogram_bins=histogram_bins,
+                    ),
+                    await workflow.raster_stream_into_numpy(query_rect, clip_to_query_rectangle=True),
+                )
+
+            (statistics, array) = asyncio.run(inner())
+
+        self.assertEqual(dict(statistics.sizes), {"time": 2, "band": 1, "bin": 8})
+        self.assertEqual(list(statistics.band.values), [0])
+
+        # the statistics only cover the pixels of the query rectangle
+        for time_idx in range(2):
+            values = array[time_idx, 0].compressed().astype(np.float64)
+            result = statistics.isel(time=time_idx, band=0)
+
+            self.assertEqual(int(result["count"]), len(values))
+            self.assertEqual(float(result["min"]), values.min())
+            self.assertEqual(float(result["max"]), values.max())
+            self.assertAlmostEqual(float(result["mean"]), values.mean())
+            self.assertAlmostEqual(float(result["std"]), values.std())
+            np.testing.assert_array_equal(
+                result["histogram"].values, np.histogram(values, bins=8, range=(0.0, 256.0))[0]
+            )
+
+        with self.assertRaises(ge.InputException):
+            asyncio.run(workflow.raster_stream_statistics(query_rect, stats=["histogram"]))
+
+    def test_extract_points(self):
+        workflow = self.mock_workflow()
+
+        query_rect = ge.QueryRectangle(
+            spatial_bounds=ge.BoundingBox2D(-180.0, -90.0, 130.0, 90.0),
+            time_interval=ge.TimeInterval(datetime(2014, 1, 1, 0, 0, 0), datetime(2014, 1, 3, 0, 0, 0)),
+        )
+
+        points = gpd.GeoDataFrame(
+            geometry=gpd.points_from_xy([-170.0, 100.0, -100.0, 175.0], [80.0, -50.0, 30.0, 0.0]),
+            index=["a", "b", "c", "outside"],
+            crs="EPSG:4326",
+        )
+
+        with unittest.mock.patch("websockets.asyncio.client.connect", side_effect=BoundsMockWebsocket) as connect:
+
+            async def inner():
+                return (
+                    await workflow.extract_points_into_xarray(points, query_rect, tile_size=4),
+                    await workflow.extract_points(points.iloc[:2], query_rect, tile_size=4),
+                )
+
+            (array, data_frame) = asyncio.run(inner())
+
+            # the points "a" and "c" are in the top row of tiles and "b" in the bottom row
+            self.assertEqual(connect.call_count, 2 + 2)
+
+        original_array = rioxarray.open_rasterio("tests/responses/ndvi.tiff").isel(band=0, drop=True).to_numpy()
+
+        self.assertEqual(array.dims, ("point", "time", "band"))
+        self.assertEqual(array.shape, (4, 2, 1))
+        self.assertEqual(list(array.point.values), ["a", "b", "c", "outside"])
+        for time_idx in range(2):
+            np.testing.assert_array_equal(
+                array.isel(time=time_idx, band=0).values,
+                [original_array[0, 0], original_array[6, 6], original_array[2, 1], np.nan],
+            )
+
+        self.assertEqual(list(data_frame.columns), ["point", "time", "band", "value"])
+        self.assertEqual(list(data_frame.point), ["a", "a", "b", "b"])
+        self.assertEqual(list(data_frame.value), [original_array[0, 0]] * 2 + [original_array[6, 6]] * 2)
+        self.assertEqual(data_frame.time.iloc[0], np.datetime64("2014-01-01"))
+
+    def test_parallel_streaming_workflow(self):
+        workflow = self.mock_workflow()
+
+        query_rect = ge.QueryRectangle(
+            spatial_bounds=ge.BoundingBox2D(-180.0, -90.0, 180.0, 90.0),
+            time_interval=ge.TimeInterval(datetime(2014, 1, 1, 0, 0, 0), datetime(2014, 1, 3, 0, 0, 0)),
+        )
+
+        def tile_key(tile: ge.RasterTile2D):
+            return (tile.time.start, tile.band, tile.geo_transform.y_max, tile.geo_transform.x_min)
+
+        with unittest.mock.patch("websockets.asyncio.client.connect", side_effect=BoundsMockWebsocket) as connect:
+
+            async def inner():
+                ordered = [tile async for tile in workflow.raster_stream_parallel(query_rect, tile_size=4)]
+                as_completed = [
+                    tile async for tile in workflow.raster_stream_parallel(query_rect, ordered=False, tile_size=4)
+                ]
+                return ordered, as_completed
+
+            (ordered, as_completed) = asyncio.run(inner())
+
+            # 2 rows x 2 columns of tiles for both queries
+            self.assertEqual(connect.call_count, 8)
+
+        self.assertEqual(len(ordered), 8)
+        self.assertEqual([tile.time_start_ms for tile in ordered[:4]], [ordered[0].time_start_ms] * 4)
+        self.assertTrue(ordered[0].time_start_ms < ordered[4].time_start_ms)
+        self.assertEqual(
+            [(tile.geo_transform.x_min, tile.geo_transform.y_max) for tile in ordered[:4]],
+            [(-180.0, 90.0), (0.0, 90.0), (-180.0, 0.0), (0.0, 0.0)],
+        )
+
+        self.assertEqual(sorted(map(tile_key, as_completed)), sorted(map(tile_key, ordered)))
+
+    def test_parallel_streaming_workflow_with_bands(self):
+        workflow = self.mock_workflow(bands=2)
+
+        query_rect = ge.QueryRectangle(
+            spatial_bounds=ge.BoundingBox2D(-180.0, -90.0, 180.0, 90.0),
+            time_interval=ge.TimeInterval(datetime(2014, 1, 1, 0, 0, 0), datetime(2014, 1, 3, 0, 0, 0)),
+        )
+
+        def tile_key(tile: ge.RasterTile2D):
+            return (tile.time.start, tile.geo_transform.y_max, tile.geo_transform.x_min, tile.band)
+
+        with unittest.mock.patch("websockets.asyncio.client.connect", side_effect=MultiBandMockWebsocket):
+
+            async def inner():
+                sequential = await self.collect(workflow.raster_stream(query_rect))
+                parallel = await self.collect(workflow.raster_stream_parallel(query_rect, tile_size=4))
+                stacks = await self.collect(
+                    tile_stream_to_stack_stream(workflow.raster_stream_parallel(query_rect, tile_size=4))
+                )
+                return (sequential, parallel, stacks)
+
+            (sequential, parallel, stacks) = asyncio.run(inner())
+
+        self.assertEqual(len(parallel), 16)
+        self.assertEqual(list(map(tile_key, parallel)), list(map(tile_key, sequential)))
+        self.assertEqual(len(stacks), 8)
+        self.assertTrue(all(stack.bands == [0, 1] for stack in stacks))
+
+    def test_prefetching_pipeline(self):
+        workflow = self.mock_workflow()
+
+        query_rect = ge.QueryRectangle(
+            spatial_bounds=ge.BoundingBox2D(-180.0, -90.0, 180.0, 90.0),
+            time_interval=ge.TimeInterval(datetime(2014, 1, 1, 0, 0, 0), datetime(2014, 1, 3, 0, 0, 0)),
+        )
+
+        def tile_key(tile: ge.RasterTile2D):
+            return (tile.time.start, tile.band, tile.geo_transform.y_max, tile.geo_transform.x_min)
+
+        statistics = ge.StreamStatistics()
+
+        with unittest.mock.patch("websockets.asyncio.client.connect", side_effect=BoundsMockWebsocket):
+
+            async def inner():
+                sequential = [tile async for tile in workflow.raster_stream(query_rect, prefetch=1, decoders=1)]
+                pipelined = [
+                    tile
+                    async for tile in workflow.raster_stream(query_rect, prefetch=3, decoders=3, statistics=statistics)
+                ]
+                return sequential, pipelined
+
+            (sequential, pipelined) = asyncio.run(inner())
+
+        # the decoded tiles are in the original order
+        self.assertEqual(list(map(tile_key, pipelined)), list(map(tile_key, sequential)))
+
+        self.assertEqual(statistics.received_frames, 8)
+        self.assertEqual(statistics.yielded_items, 8)
+        self.assertGreaterEqual(statistics.requested_frames, 8)
+        self.assertLessEqual(statistics.max_pending_requests, 3)
+        self.assertLessEqual(statistics.max_pending_decodes, 3)
+        self.assertGreater(statistics.received_bytes, 0)
+
+    def test_shared_statistics(self):
+        workflow = self.mock_workflow()
+
+        query_rect = ge.QueryRectangle(
+            spatial_bounds=ge.BoundingBox2D(-180.0, -90.0, 180.0, 90.0),
+            time_interval=ge.TimeInterval(datetime(2014, 1, 1, 0, 0, 0), datetime(2014, 1, 3, 0, 0, 0)),
+        )
+
+        statistics = ge.StreamStatistics()
+
+        with unittest.mock.patch("websockets.asyncio.client.connect", side_effect=NextOnlyMockWebsocket):
+
+            async def inner():
+                # the connections of the partitions share the statistics
+                parallel = await self.collect(
+                    workflow.raster_stream_parallel(query_rect, tile_size=4, prefetch=2, statistics=statistics)
+                )
+                # the statistics of the previous streams are reused
+                sequential = await self.collect(workflow.raster_stream(query_rect, prefetch=2, statistics=statistics))
+                return (parallel, sequential)
+
+            (parallel, sequential) = asyncio.run(asyncio.wait_for(inner(), timeout=10))
+
+        self.assertEqual(len(parallel), 8)
+        self.assertEqual(len(sequential), 8)
+        self.assertEqual(statistics.received_frames, 16)
+        self.assertLessEqual(statistics.max_pending_requests, 2)
+
+    def test_resumable_streaming_workflow(self):
+        workflow = self.mock_workflow()
+
+        query_rect = ge.QueryRectangle(
+            spatial_bounds=ge.BoundingBox2D(-180.0, -90.0, 180.0, 90.0),
+            time_interval=ge.TimeInterval(datetime(2014, 1, 1, 0, 0, 0), datetime(2014, 1, 3, 0, 0, 0)),
+        )
+
+        def tile_key(tile: ge.RasterTile2D):
+            return (tile.time.start, tile.band, tile.geo_transform.y_max, tile.geo_transform.x_min)
+
+        def connect(uri: str, **kwargs):
+            # the first connection drops after the first tile of the second time step
+            if connect_mock.call_count == 1:
+                return DroppingMockWebsocket(uri, drop_after=5, **kwargs)
+            return BoundsMockWebsocket(uri, **kwargs)
+
+        reconnect = ge.ReconnectPolicy(initial_backoff=0.0)
+
+        with unittest.mock.patch("websockets.asyncio.client.connect", side_effect=BoundsMockWebsocket):
+            expected = asyncio.run(self.collect(workflow.raster_stream(query_rect)))
+
+        with unittest.mock.patch("websockets.asyncio.client.connect", side_effect=connect) as connect_mock:
+            tiles = asyncio.run(self.collect(workflow.raster_stream(query_rect, reconnect=reconnect)))
+
+            self.assertEqual(connect_mock.call_count, 2)
+            resumed_query = parse_qs(urlparse(connect_mock.call_args.kwargs["uri"]).query)
+            self.assertTrue(resumed_query["timeInterval"][0].startswith("2014-01-02"))
+
+            connect_mock.reset_mock()
+
+            with self.assertRaises(websockets.exceptions.ConnectionClosedError):
+                asyncio.run(self.collect(workflow.raster_stream(query_rect)))
+
+        self.assertEqual(list(map(tile_key, tiles)), list(map(tile_key, expected)))
+
+    def test_resumable_streaming_workflow_with_statistics(self):
+        workflow = self.mock_workflow()
+
+        query_rect = ge.QueryRectangle(
+            spatial_bounds=ge.BoundingBox2D(-180.0, -90.0, 180.0, 90.0),
+            time_interval=ge.TimeInterval(datetime(2014, 1, 1, 0, 0, 0), datetime(2014, 1, 3, 0, 0, 0)),
+        )
+
+        def connect(uri: str, **kwargs):
+            # the first connection drops with requests that were never answered
+            if connect_mock.call_count == 1:
+                return DroppingNextOnlyMockWebsocket(uri, drop_after=5, **kwargs)
+            return NextOnlyMockWebsocket(uri, **kwargs)
+
+        statistics = ge.StreamStatistics()
+
+        with unittest.mock.patch("websockets.asyncio.client.connect", side_effect=connect) as connect_mock:
+            tiles = asyncio.run(
+                asyncio.wait_for(
+                    self.collect(
+                        workflow.raster_stream(
+                            query_rect,
+                            prefetch=2,
+                            statistics=statistics,
+                            reconnect=ge.ReconnectPolicy(initial_backoff=0.0),
+                        )
+                    ),
+                    timeout=10,
+                )
+            )
+
+            self.assertEqual(connect_mock.call_count, 2)
+
+        self.assertEqual(len(tiles), 8)
+        # the mock ignores the resumed time interval, so the second connection sends all 8 tiles again
+        self.assertEqual(statistics.received_frames, 5 + 8)
+        self.assertGreater(statistics.pending_requests, 0)
+
+    def test_sync_iteration(self):
+        workflow = self.mock_workflow()
+
+        query_rect = ge.QueryRectangle(
+            spatial_bounds=ge.BoundingBox2D(-180.0, -90.0, 180.0, 90.0),
+            time_interval=ge.TimeInterval(datetime(2014, 1, 1, 0, 0, 0), datetime(2014, 1, 3, 0, 0, 0)),
+        )
+
+        websockets_ = []
+
+        class ClosingMockWebsocket(BoundsMockWebsocket):
+            closed = False
+
+            async def __aexit__(self, *args):
+                self.closed = True
+
+        def connect(uri: str, **kwargs):
+            websocket = ClosingMockWebsocket(uri, **kwargs)
+            websockets_.append(websocket)
+            return websocket
+
+        with unittest.mock.patch("websockets.asyncio.client.connect", side_effect=connect):
+            tiles = list(workflow.iter_raster_tiles(query_rect, buffer_size=2))
+
+            # breaking out of the loop closes the connection
+            for _tile in workflow.iter_raster_tiles(query_rect, buffer_size=2):
+                break
+
+            # iterating works within a running event loop, too
+            async def inner():
+                return list(workflow.iter_raster_tiles(query_rect))
+
+            tiles_in_loop = asyncio.run(inner())
+
+        self.assertEqual(len(tiles), 8)
+        self.assertEqual(len(tiles_in_loop), 8)
+        self.assertEqual(len(websockets_), 3)
+        self.assertTrue(all(websocket.closed for websocket in websockets_))
+
+    def test_arrow_stream(self):
+        workflow = self.mock_workflow()
+
+        query_rect = ge.QueryRectangle(
+            spatial_bounds=ge.BoundingBox2D(-180.0, -90.0, 180.0, 90.0),
+            time_interval=ge.TimeInterval(datetime(2014, 1, 1, 0, 0, 0), datetime(2014, 1, 3, 0, 0, 0)),
+        )
+
+        with unittest.mock.patch("websockets.asyncio.client.connect", side_effect=BoundsMockWebsocket):
+            (record_batches, tiles) = asyncio.run(
+                self.collect_both(workflow.raster_stream_arrow(query_rect), workflow.raster_stream(query_rect))
+            )
+            table = workflow.raster_stream_arrow_reader(query_rect).read_all()
+
+        # the record batches of the server with their metadata
+        self.assertEqual(len(record_batches), 8)
+        for record_batch, tile in zip(record_batches, tiles, strict=True):
+            self.assertEqual(record_batch.schema.metadata[b"band"], b"0")
+            decoded = ge.RasterTile2D.from_ge_record_batch(record_batch)
+            self.assertEqual(decoded.geo_transform, tile.geo_transform)
+            self.assertEqual(decoded.time, tile.time)
+            np.testing.assert_array_equal(decoded.to_numpy_data_array(), tile.to_numpy_data_array())
+
+        # one row per tile
+        self.assertEqual(table.schema, ge.raster_tile_schema(pa.uint8()))
+        self.assertEqual(table.num_rows, 8)
+        self.assertEqual(table.column("time_start")[0].as_py(), datetime(2014, 1, 1))
+        self.assertEqual(table.column("x_min").to_pylist()[:4], [-180.0, 0.0, -180.0, 0.0])
+        self.assertEqual(table.column("spatial_reference").to_pylist(), ["EPSG:4326"] * 8)
+        for row, tile in enumerate(tiles):
+            np.testing.assert_array_equal(
+                np.array(table.column("data")[row].as_py()).reshape(4, 4), tile.to_numpy_data_array()
+            )
+
+    @staticmethod
+    async def collect_both(first, second):
+        return ([item async for item in first], [item async for item in second])
+
+    def test_tile_grid_partition(self):
+        tile_grid = ge.TileGrid(ge.GeoTransform(x_min=-180.0, y_max=90.0, x_pixel_size=45.0, y_pixel_size=-22.5), 4)
+
+        query = ge.RasterQueryRectangle(
+            ge.BoundingBox2D(-170.0, -80.0, 170.0, 80.0),
+            ge.TimeInterval(datetime(2014, 1, 1, 0, 0, 0)),
+            [0],
+        )
+
+        partitions = tile_grid.partition(query, 3)
+
+        self.assertEqual(len(partitions), 2)
+        self.assertEqual(
+            [partition.spatial_bounds.as_bbox_tuple() for (partition, _tiles) in partitions],
+            [(-170.0, 0.0, 170.0, 80.0), (-170.0, -80.0, 170.0, 0.0)],
+        )
+        self.assertEqual(
+            [tiles for (_partition, tiles) in partitions],
+            [
+                ge.GridBoundingBox2D(ge.GridIdx2D(x_idx=0, y_idx=0), ge.GridIdx2D(x_idx=1, y_idx=0)),
+                ge.GridBoundingBox2D(ge.GridIdx2D(x_idx=0, y_idx=1), ge.GridIdx2D(x_idx=1, y_idx=1)),
+            ],
+        )
@@ -10,9 +10,13 @@ import geopandas as gpd
 import numpy as np
 import pandas as pd
 import pyarrow as pa
+import shapely
+import websockets.exceptions
 import websockets.protocol
 
 import geoengine as ge
+from geoengine.resumable import feature_keys
+from geoengine.workflow import VectorStreamProcessing
 
 from . import UrllibMocker
 
@@ -30,13 +34,11 @@ class MockRequestsGet:
 class MockWebsocket:
     """Mock for websockets.client.connect"""
 
-    def __init__(self):
-        """Create a mock websocket with some data"""
+    def __init__(self, chunk_size: int = 2):
+        """Create a mock websocket with some data in chunks of `chunk_size` features"""
 
         self.__chunks = []
 
-        chunk_size = 2
-
         (geos, times, datas) = read_data()
 
         for i in range(len(geos) // chunk_size):
@@ -60,6 +62,9 @@ class MockWebsocket:
         return websockets.protocol.State.OPEN if len(self.__chunks) > 0 else websockets.protocol.State.CLOSED
 
     async def recv(self):
+        if len(self.__chunks) == 0:
+            # the server closes the connection after the last chunk
+            raise websockets.exceptions.ConnectionClosedOK(None, None)
         return self.__chunks.pop(0)
 
     async def send(self, *args):
@@ -69,6 +74,20 @@ class MockWebsocket:
         pass
 
 
+class DroppingMockWebsocket(MockWebsocket):
+    """Mock for websockets.client.connect whose connection drops after some chunks"""
+
+    def __init__(self, drop_after: int):
+        super().__init__()
+        self.__remaining = drop_after
+
+    async def recv(self):
+        if self.__remaining == 0:
+            raise websockets.exceptions.ConnectionClosedError(None, None)
+        self.__remaining -= 1
+        return await super().recv()
+
+
 def read_data() -> tuple[list[str], list[list[int]], list[int]]:
     """Output vector data than can be subdivided into chunks"""
     geos = [
@@ -111,10 +130,10 @@ def read_data() -> tuple[list[str], list[list[int]], list[int]]:
     )
 
 
-def arrow_bytes(geo: list[str], time: list[list[int]], data: list[int]) -> bytes:
+def arrow_bytes(geo: list[str] | pa.Array, time: list[list[int]], data: list[int]) -> bytes:
     """Convert lists of vector data into an Arrow record batch within an IPC file"""
 
-    geo_array = pa.array(geo)
+    geo_array = geo if isinstance(geo, pa.Array) else pa.array(geo)
     time_array = pa.array(time)
     data_array = pa.array(data)
     batch = pa.RecordBatch.from_arrays([geo_array, time_array, data_array], ["__geometry", "__time", "data"])
@@ -138,6 +157,33 @@ class WorkflowVectorStreamTests(unittest.TestCase):
     def setUp(self) -> None:
         ge.reset(False)
 
+    def mock_workflow(self, measurement=None):
+        """Create a vector workflow with the result descriptor of the test data and a unitless or given measurement"""
+
+        with UrllibMocker() as m:
+            m.get(
+                "http://localhost:3030/session",
+                json={
+                    "id": "00000000-0000-0000-0000-000000000000",
+                },
+            )
+            ge.initialize("http://localhost:3030", token="no_token")
+
+        with unittest.mock.patch(
+            "geoengine.Workflow._Workflow__query_result_descriptor",
+            return_value=ge.VectorResultDescriptor(
+                spatial_reference="EPSG:4326",
+                data_type=ge.VectorDataType.MULTI_POINT,
+                columns={
+                    "data": ge.VectorColumnInfo(
+                        data_type=ge.FeatureDataType.INT,
+                        measurement=ge.UnitlessMeasurement() if measurement is None else measurement,
+                    )
+                },
+            ),
+        ):
+            return ge.Workflow(UUID("00000000-0000-0000-0000-000000000000"))
+
     def test_streaming_workflow(self):
         with UrllibMocker() as m:
             m.get(
@@ -180,6 +226,12 @@ class WorkflowVectorStreamTests(unittest.TestCase):
 
             asyncio.run(inner1())
 
+        with unittest.mock.patch("websockets.asyncio.client.connect", return_value=MockWebsocket()):
+            chunks = list(workflow.iter_vector_chunks(query_rect))
+
+            self.assertEqual(len(chunks), 4)
+            self.assertEqual(pd.concat(chunks)["data"].tolist(), read_data()[2])
+
         with unittest.mock.patch("websockets.asyncio.client.connect", return_value=MockWebsocket()):
 
             async def inner2():
@@ -192,11 +244,278 @@ class WorkflowVectorStreamTests(unittest.TestCase):
 
                 assert data_frame["geometry"].equals(gpd.GeoSeries.from_wkt(geos))
 
-                # TODO: when we can parse very early and very late times,
-                # this should be possible to check against `_times`
-                assert pd.isnull(data_frame["time_start"]).all()
-                assert pd.isnull(data_frame["time_end"]).all()
+                # the beginning and end of time of the Geo Engine are clipped to the range of nanosecond timestamps
+                assert data_frame["time_start"].dtype == "datetime64[ms, UTC]"
+                assert (data_frame["time_start"] == pd.Timestamp("1677-09-21 00:12:43.146", tz="UTC")).all()
+                assert (data_frame["time_end"] == pd.Timestamp("2262-04-11 23:47:16.854", tz="UTC")).all()
 
                 assert np.array_equal(data_frame["data"].tolist(), datas)
 
             asyncio.run(inner2())
+
+    def test_streaming_workflow_into_geopandas(self):
+        workflow = self.mock_workflow()
+
+        query_rect = ge.QueryRectangle(
+            spatial_bounds=ge.BoundingBox2D(-180.0, -90.0, 180.0, 90.0),
+            time_interval=ge.TimeInterval(datetime(2014, 4, 1, 0, 0, 0), datetime(2014, 6, 1, 0, 0, 0)),
+        )
+
+        (geos, times, datas) = read_data()
+
+        # the data column of the first chunk has no values and thus the null type
+        null_chunk = arrow_bytes(geos[:1], times[:1], [None])
+
+        class NullChunkMockWebsocket(MockWebsocket):
+            sent_null_chunk = False
+
+            async def recv(self):
+                if not self.sent_null_chunk:
+                    self.sent_null_chunk = True
+                    return null_chunk
+                return await super().recv()
+
+        async def into_geopandas(websocket):
+            with unittest.mock.patch("websockets.asyncio.client.connect", return_value=websocket):
+                return await workflow.vector_stream_into_geopandas(query_rect)
+
+        data_frame = asyncio.run(into_geopandas(MockWebsocket(chunk_size=1)))
+        self.assertEqual(data_frame.shape, (8, 4))
+        self.assertTrue(data_frame["geometry"].equals(gpd.GeoSeries.from_wkt(geos)))
+        self.assertEqual(data_frame["data"].tolist(), datas)
+
+        data_frame = asyncio.run(into_geopandas(NullChunkMockWebsocket(chunk_size=1)))
+        self.assertEqual(data_frame.shape, (9, 4))
+        self.assertTrue(pd.isnull(data_frame["data"][0]))
+        self.assertEqual(data_frame["data"][1:].tolist(), datas)
+
+        data_frame = asyncio.run(into_geopandas(MockWebsocket(chunk_size=16)))
+        self.assertEqual(len(data_frame), 0)
+        self.assertEqual(data_frame.crs, "EPSG:4326")
+
+    def test_streaming_workflow_with_binary_geometries(self):
+        workflow = self.mock_workflow()
+
+        query_rect = ge.QueryRectangle(
+            spatial_bounds=ge.BoundingBox2D(-180.0, -90.0, 180.0, 90.0),
+            time_interval=ge.TimeInterval(datetime(2014, 4, 1, 0, 0, 0), datetime(2014, 6, 1, 0, 0, 0)),
+        )
+
+        (geos, times, datas) = read_data()
+        geometries = shapely.from_wkt(geos)
+
+        (_geometry_type, coordinates, (offsets,)) = shapely.to_ragged_array(geometries)
+        geoarrow = pa.ListArray.from_arrays(
+            pa.array(offsets, type=pa.int32()), pa.FixedSizeListArray.from_arrays(pa.array(coordinates.ravel()), 2)
+        )
+
+        for geometry_encoding, geometry_array in [
+            (ge.GeometryEncoding.WKB, pa.array(shapely.to_wkb(geometries))),
+            (ge.GeometryEncoding.GEOARROW, geoarrow),
+        ]:
+
+            class BinaryMockWebsocket(MockWebsocket):
+                """Mock websocket that sends the geometries in two chunks with a binary encoding"""
+
+                def __init__(self, geometry_array: pa.Array):
+                    super().__init__(chunk_size=16)
+                    self.chunks = [
+                        arrow_bytes(geometry_array.slice(0, 3), times[:3], datas[:3]),
+                        arrow_bytes(geometry_array.slice(3), times[3:], datas[3:]),
+                    ]
+
+                @property
+                def state(self) -> websockets.protocol.State:
+                    return websockets.protocol.State.OPEN if self.chunks else websockets.protocol.State.CLOSED
+
+                async def recv(self):
+                    if not self.chunks:
+                        raise websockets.exceptions.ConnectionClosedOK(None, None)
+                    return self.chunks.pop(0)
+
+            with unittest.mock.patch(
+                "websockets.asyncio.client.connect", return_value=BinaryMockWebsocket(geometry_array)
+            ) as connect:
+                chunks = list(workflow.iter_vector_chunks(query_rect, geometry_encoding=geometry_encoding))
+
+            self.assertIn(f"geometryEncoding={geometry_encoding.value}", connect.call_args.kwargs["uri"])
+            self.assertEqual([len(chunk) for chunk in chunks], [3, 5])
+            self.assertTrue(pd.concat(chunks)["geometry"].reset_index(drop=True).equals(gpd.GeoSeries.from_wkt(geos)))
+
+            with unittest.mock.patch(
+                "websockets.asyncio.client.connect", return_value=BinaryMockWebsocket(geometry_array)
+            ):
+                data_frame = asyncio.run(
+                    workflow.vector_stream_into_geopandas(query_rect, geometry_encoding=geometry_encoding)
+                )
+
+            self.assertTrue(data_frame["geometry"].equals(gpd.GeoSeries.from_wkt(geos)))
+            self.assertEqual(data_frame["data"].tolist(), datas)
+            self.assertEqual(data_frame.crs, "EPSG:4326")
+
+    def test_streaming_workflow_as_arrow(self):
+        workflow = self.mock_workflow()
+
+        query_rect = ge.QueryRectangle(
+            spatial_bounds=ge.BoundingBox2D(-180.0, -90.0, 180.0, 90.0),
+            time_interval=ge.TimeInterval(datetime(2014, 4, 1, 0, 0, 0), datetime(2014, 6, 1, 0, 0, 0)),
+        )
+
+        (geos, times, datas) = read_data()
+        time_type = pa.timestamp("ms", tz="UTC")
+
+        with unittest.mock.patch("websockets.asyncio.client.connect", return_value=MockWebsocket()):
+
+            async def inner():
+                return [record_batch async for record_batch in workflow.vector_stream_arrow(query_rect)]
+
+            record_batches = asyncio.run(inner())
+
+        self.assertEqual(len(record_batches), 4)
+        for record_batch in record_batches:
+            self.assertEqual(record_batch.schema.names, ["__geometry", "data", "time_start", "time_end"])
+            self.assertEqual(record_batch.schema.field("time_start").type, time_type)
+            self.assertEqual(record_batch.schema.metadata[b"spatialReference"], b"EPSG:4326")
+
+        with unittest.mock.patch("websockets.asyncio.client.connect", return_value=MockWebsocket()):
+            table = workflow.vector_stream_arrow_reader(query_rect).read_all()
+
+        self.assertEqual(table.num_rows, 8)
+        self.assertEqual(table.column("__geometry").to_pylist(), geos)
+        self.assertEqual(table.column("data").to_pylist(), datas)
+        self.assertEqual(table.column("time_start").cast(pa.int64()).to_pylist(), [time[0] for time in times])
+        self.assertEqual(table.column("time_end").cast(pa.int64()).to_pylist(), [time[1] for time in times])
+
+        # the data column of the first chunk has no values and thus the null type
+        null_chunk = arrow_bytes(geos[:1], times[:1], [None])
+
+        class NullChunkMockWebsocket(MockWebsocket):
+            sent_null_chunk = False
+
+            async def recv(self):
+                if not self.sent_null_chunk:
+                    self.sent_null_chunk = True
+                    return null_chunk
+                return await super().recv()
+
+        with unittest.mock.patch("websockets.asyncio.client.connect", return_value=NullChunkMockWebsocket()):
+            table = asyncio.run(workflow.vector_stream_into_arrow(query_rect))
+
+        self.assertEqual(table.num_rows, 9)
+        self.assertEqual(table.schema.field("data").type, pa.int64())
+        self.assertEqual(table.column("data").to_pylist(), [None, *datas])
+        self.assertEqual(table.schema.metadata[b"spatialReference"], b"EPSG:4326")
+
+        with unittest.mock.patch("websockets.asyncio.client.connect", return_value=MockWebsocket(chunk_size=16)):
+            table = asyncio.run(workflow.vector_stream_into_arrow(query_rect))
+
+        self.assertEqual(table.num_rows, 0)
+        self.assertEqual(table.schema.names, ["time_start", "time_end"])
+
+    def test_time_columns(self):
+        time_start = int(pd.Timestamp("2014-04-01", tz="UTC").timestamp() * 1000)
+        time_end = int(pd.Timestamp("2014-06-01", tz="UTC").timestamp() * 1000)
+
+        record_batch = pa.ipc.open_file(
+            arrow_bytes(
+                read_data()[0][:3],
+                [[time_start, time_end], [-8334632851200000, 8210298412799999], None],
+                [1, 2, 3],
+            )
+        ).get_record_batch(0)
+
+        data_frame = VectorStreamProcessing.create_geo_data_frame(record_batch, "start", "end")
+
+        self.assertEqual(data_frame["start"].dtype, "datetime64[ms, UTC]")
+        self.assertEqual(data_frame["start"][0], pd.Timestamp("2014-04-01", tz="UTC"))
+        self.assertEqual(data_frame["end"][0], pd.Timestamp("2014-06-01", tz="UTC"))
+        self.assertEqual(data_frame["start"][1], pd.Timestamp("1677-09-21 00:12:43.146", tz="UTC"))
+        self.assertEqual(data_frame["end"][1], pd.Timestamp("2262-04-11 23:47:16.854", tz="UTC"))
+        self.assertTrue(pd.isnull(data_frame["start"][2]))
+        self.assertTrue(pd.isnull(data_frame["end"][2]))
+
+    def test_streaming_workflow_with_classifications(self):
+        classes = {1: "one", 2: "two", 3: "three", 4: "small", 5: "small", 6: "small", 7: "small"}
+        workflow = self.mock_workflow(measurement=ge.ClassificationMeasurement("class", classes))
+
+        query_rect = ge.QueryRectangle(
+            spatial_bounds=ge.BoundingBox2D(-180.0, -90.0, 180.0, 90.0),
+            time_interval=ge.TimeInterval(datetime(2014, 4, 1, 0, 0, 0), datetime(2014, 6, 1, 0, 0, 0)),
+        )
+
+        # the code 8 has no class
+        expected = ["one", "two", "three", "small", "small", "small", "small", None]
+
+        with unittest.mock.patch("websockets.asyncio.client.connect", return_value=MockWebsocket()):
+            chunks = list(workflow.iter_vector_chunks(query_rect, resolve_classifications=True))
+
+        for chunk in chunks:
+            self.assertIsInstance(chunk["data"].dtype, pd.CategoricalDtype)
+            self.assertEqual(chunk["data"].cat.categories.tolist(), ["one", "two", "three", "small"])
+        self.assertEqual(pd.concat(chunks)["data"].astype(object).where(lambda x: x.notna(), None).tolist(), expected)
+
+        with unittest.mock.patch("websockets.asyncio.client.connect", return_value=MockWebsocket()):
+            data_frame = asyncio.run(workflow.vector_stream_into_geopandas(query_rect, resolve_classifications=True))
+
+        self.assertIsInstance(data_frame["data"].dtype, pd.CategoricalDtype)
+        self.assertEqual(data_frame["data"].astype(object).where(lambda x: x.notna(), None).tolist(), expected)
+
+        with unittest.mock.patch("websockets.asyncio.client.connect", return_value=MockWebsocket()):
+            data_frame = asyncio.run(workflow.vector_stream_into_geopandas(query_rect))
+
+        self.assertEqual(data_frame["data"].tolist(), read_data()[2])
+
+    def test_resumable_streaming_workflow(self):
+        workflow = self.mock_workflow()
+
+        query_rect = ge.QueryRectangle(
+            spatial_bounds=ge.BoundingBox2D(-180.0, -90.0, 180.0, 90.0),
+            time_interval=ge.TimeInterval(datetime(2014, 4, 1, 0, 0, 0), datetime(2014, 6, 1, 0, 0, 0)),
+        )
+
+        # the resumed connection returns the features in other chunks
+        with unittest.mock.patch(
+            "websockets.asyncio.client.connect",
+            side_effect=[DroppingMockWebsocket(drop_after=3), MockWebsocket(chunk_size=4)],
+        ) as connect:
+
+            async def inner():
+                return [
+                    chunk
+                    async for chunk in workflow.vector_stream(
+                        query_rect, reconnect=ge.ReconnectPolicy(initial_backoff=0.0)
+                    )
+                ]
+
+            chunks = asyncio.run(inner())
+
+            self.assertEqual(connect.call_count, 2)
+
+        # the features that were yielded before the connection dropped are not repeated
+        self.assertEqual([len(chunk) for chunk in chunks], [2, 2, 2, 2])
+        self.assertEqual(pd.concat(chunks)["data"].tolist(), read_data()[2])
+
+    def test_feature_keys(self):
+        (geos, times, datas) = read_data()
+        geometries = shapely.from_wkt(geos)
+
+        (_geometry_type, coordinates, (offsets,)) = shapely.to_ragged_array(geometries)
+        geoarrow = pa.ListArray.from_arrays(
+            pa.array(offsets, type=pa.int32()), pa.FixedSizeListArray.from_arrays(pa.array(coordinates.ravel()), 2)
+        )
+
+        for geometry_array in [pa.array(geos), geoarrow]:
+            record_batch = pa.ipc.open_file(arrow_bytes(geometry_array, times, datas)).get_record_batch(0)
+            keys = feature_keys(record_batch)
+
+            self.assertEqual(len(np.unique(keys)), len(geos))
+            # a feature has the same key in any chunk
+            np.testing.assert_array_equal(feature_keys(record_batch.slice(3)), keys[3:])
+
+        # the order of the coordinates matters
+        swapped = pa.ListArray.from_arrays(
+            pa.array([0, 2, 4], type=pa.int32()),
+            pa.FixedSizeListArray.from_arrays(pa.array([1.0, 2.0, 3.0, 4.0, 3.0, 4.0, 1.0, 2.0]), 2),
+        )
+        keys = feature_keys(pa.RecordBatch.from_arrays([swapped], ["__geometry"]))
+        self.assertNotEqual(keys[0], keys[1])